@@ -5,6 +5,7 @@ from . import models
 from . import wizard
 from . import controllers
 from . import report
+from . import cli
 
 from odoo import api, SUPERUSER_ID
 import logging
@@ -1,7 +1,7 @@
 # -*- coding: utf-8 -*-
 {
     'name': 'Access Management',
-    'version': '16.0.1.0.0',
+    'version': '16.0.1.0.1',
     'category': 'Technical',
     'summary': 'Advanced Access Control Management System',
     'description': """
@@ -69,6 +69,7 @@ while providing additional granular control over user access.
         # Views
         'views/access_management_views.xml',
         'views/access_management_menus.xml',
+        'views/access_management_slow_log_views.xml',
         
         # Reports
         'report/access_management_reports.xml',
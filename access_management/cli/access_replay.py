@@ -0,0 +1,49 @@
+# -*- coding: utf-8 -*-
+import json
+import optparse
+import sys
+from pathlib import Path
+
+import odoo
+from odoo.cli import Command
+
+from ..models.utils import iter_access_records
+
+
+class AccessReplay(Command):
+    """Replay recorded access decisions against the current access engine"""
+    name = 'access_replay'
+
+    def run(self, cmdargs):
+        parser = odoo.tools.config.parser
+        parser.prog = f'{Path(sys.argv[0]).name} {self.name}'
+        group = optparse.OptionGroup(parser, "Access Replay Configuration")
+        group.add_option(
+            '--records', dest='records',
+            help="JSON lines file written by the access recorder (access_management_record_file)",
+        )
+        group.add_option(
+            '--repeat', dest='repeat', type='int', default=1,
+            help="Number of times the records are replayed, to measure throughput",
+        )
+        parser.add_option_group(group)
+        opt = odoo.tools.config.parse_config(cmdargs)
+
+        if not opt.records:
+            parser.error("--records is required")
+        dbname = odoo.tools.config['db_name']
+        if not dbname:
+            parser.error("a database is required, use -d")
+
+        with open(opt.records, encoding='utf-8') as records_file:
+            records = list(iter_access_records(records_file))
+
+        registry = odoo.registry(dbname)
+        with registry.cursor() as cr:
+            env = odoo.api.Environment(cr, odoo.SUPERUSER_ID, {})
+            result = env['access.management']._replay_access_records(records, repeat=opt.repeat)
+            cr.rollback()
+
+        print(json.dumps(dict(result, records=len(records)), indent=2))
+        if result['mismatches']:
+            sys.exit(1)
@@ -1,8 +1,16 @@
 # -*- coding: utf-8 -*-
-from odoo import http, _
+from odoo import api, http, _
 from odoo.http import request
+from werkzeug.exceptions import BadRequest, Forbidden
+import hmac
 import json
 import logging
+import tempfile
+
+from ..models.utils import (
+    EXPORT_SHEETS, METRICS_TOKEN, MODEL_OPERATIONS, format_prometheus_metrics, stream_csv_export,
+    write_xlsx_export,
+)
 
 _logger = logging.getLogger(__name__)
 
@@ -118,52 +126,82 @@ class AccessManagementController(http.Controller):
         return True
     
     @http.route('/access_management/export_rules', type='http', auth='user')
-    def export_rules(self, rule_ids=None):
-        """Export access rules to CSV/Excel"""
-        if rule_ids:
-            rule_ids = json.loads(rule_ids)
-            rules = request.env['access.management'].browse(rule_ids)
-        else:
-            rules = request.env['access.management'].search([])
+    def export_rules(self, rule_ids=None, format='csv', sheet='rules'):
+        """Export access rules to CSV/Excel
+
+        CSV streams one sheet (the rules, or one line type), XLSX holds the
+        rules and every line type, one sheet each.
+        """
+        access_mgmt = request.env['access.management']
+        domain = [('id', 'in', json.loads(rule_ids))] if rule_ids else []
+        rule_ids = access_mgmt.search(domain).ids
         
-        # Create CSV content
-        import csv
-        import io
+        if format == 'xlsx':
+            output = tempfile.TemporaryFile()
+            write_xlsx_export(request.env, rule_ids, output)
+            output.seek(0)
+            headers = [
+                ('Content-Type', 'application/vnd.openxmlformats-officedocument.spreadsheetml.sheet'),
+                ('Content-Disposition', 'attachment; filename="access_rules.xlsx"'),
+            ]
+            return request.make_response(self._iter_file(output), headers)
         
-        output = io.StringIO()
-        writer = csv.writer(output)
+        if sheet not in EXPORT_SHEETS:
+            raise BadRequest(_("Unknown export sheet: %s") % sheet)
         
-        # Headers
-        writer.writerow([
-            'Name', 'Active', 'Apply by Group', 'Read Only',
-            'Users', 'Groups', 'Company', 'Rules Count'
-        ])
+        # The rows are generated after the request cursor is closed
+        registry, uid, context = request.env.registry, request.env.uid, dict(request.env.context)
+        
+        def generate():
+            with registry.cursor() as cr:
+                env = api.Environment(cr, uid, context)
+                yield from stream_csv_export(env, rule_ids, sheet)
         
-        # Data
-        for rule in rules:
-            writer.writerow([
-                rule.name,
-                rule.active,
-                rule.apply_by_group,
-                rule.read_only,
-                ', '.join(rule.user_ids.mapped('name')),
-                ', '.join(rule.group_ids.mapped('name')),
-                rule.company_id.name if rule.company_id else '',
-                rule.access_rules_count
-            ])
-        
-        # Return as download
-        content = output.getvalue()
         headers = [
             ('Content-Type', 'text/csv'),
             ('Content-Disposition', 'attachment; filename="access_rules.csv"'),
         ]
+        return request.make_response(generate(), headers)
+    
+    @staticmethod
+    def _iter_file(fileobj, block_size=65536):
+        """Stream a file by blocks, closing it at the end"""
+        try:
+            yield from iter(lambda: fileobj.read(block_size), b'')
+        finally:
+            fileobj.close()
+    
+    @http.route('/access_management/metrics', type='http', auth='none', methods=['GET'], save_session=False)
+    def metrics(self):
+        """Expose the access cache and hook latency metrics of this worker
+
+        Prometheus text format. Scrapers have no session, they authenticate
+        with the ``access_management_metrics_token`` of the server
+        configuration as a bearer token; the endpoint is disabled without it.
+        """
+        authorization = request.httprequest.headers.get('Authorization', '')
+        scheme, _sep, token = authorization.partition(' ')
+        if not METRICS_TOKEN or scheme.lower() != 'bearer' or not hmac.compare_digest(
+            token.strip().encode(), METRICS_TOKEN.encode(),
+        ):
+            raise Forbidden()
         
-        return request.make_response(content, headers)
+        headers = [('Content-Type', 'text/plain; version=0.0.4; charset=utf-8')]
+        return request.make_response(format_prometheus_metrics(), headers)
     
     @http.route('/access_management/test_rule', type='json', auth='user')
-    def test_rule(self, rule_id, test_user_id=None):
-        """Test an access rule with a specific user"""
+    def test_rule(self, rule_id=None, test_user_id=None, candidates=None, user_ids=None, sections=None):
+        """Test an access rule with a specific user
+
+        With ``candidates``, simulate a candidate rule set, unsaved changes
+        included, over the ``user_ids`` population (all active users by
+        default) and return the per-user diffs against the live policies.
+        """
+        if candidates is not None:
+            access_mgmt = request.env['access.management']
+            access_mgmt.check_access_rights('write')
+            return access_mgmt._simulate_policies(candidates, user_ids=user_ids, sections=sections)
+        
         rule = request.env['access.management'].browse(rule_id)
         
         if not test_user_id:
@@ -191,3 +229,49 @@ class AccessManagementController(http.Controller):
             }
         
         return results
+    
+    @http.route('/access_management/impact_analysis', type='json', auth='user')
+    def impact_analysis(self, rule_id, values=None):
+        """Preview the users and permissions an edit of a rule would affect
+
+        Without ``values``, get the current impact of the rule.
+        """
+        rule = request.env['access.management'].browse(rule_id)
+        rule.check_access_rights('read')
+        rule.check_access_rule('read')
+        self._check_impact_values(values)
+        
+        return rule._get_rule_impact(values)
+    
+    @staticmethod
+    def _check_impact_values(values):
+        """Reject impact analysis values with unknown models or operations, or malformed ids"""
+        if values is None:
+            return
+        if not isinstance(values, dict):
+            raise BadRequest(_("Impact analysis values must be an object"))
+        
+        # Ids are given as plain values, not as x2many commands
+        def is_id(value):
+            return isinstance(value, int) and not isinstance(value, bool)
+        for name in ('user_ids', 'group_ids'):
+            ids = values.get(name, [])
+            if not isinstance(ids, list) or not all(is_id(value) for value in ids):
+                raise BadRequest(_("%s must be a list of ids") % name)
+        company_id = values.get('company_id')
+        if company_id not in (None, False) and not is_id(company_id):
+            raise BadRequest(_("company_id must be an id"))
+        
+        model_access = values.get('model_access', [])
+        if not isinstance(model_access, list):
+            raise BadRequest(_("Model access lines must be a list"))
+        perm_keys = {'perm_%s' % operation for operation in MODEL_OPERATIONS}
+        for line in model_access:
+            if not isinstance(line, dict):
+                raise BadRequest(_("Model access lines must be objects"))
+            model_name = line.get('model')
+            if not isinstance(model_name, str) or model_name not in request.env:
+                raise BadRequest(_("Unknown model: %s") % model_name)
+            unknown = set(line) - perm_keys - {'model'}
+            if unknown:
+                raise BadRequest(_("Unknown operations: %s") % ', '.join(sorted(map(str, unknown))))
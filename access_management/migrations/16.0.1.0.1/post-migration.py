@@ -0,0 +1,30 @@
+# -*- coding: utf-8 -*-
+# migrations/16.0.1.0.1/post-migration.py
+
+import logging
+
+from odoo.addons.access_management.models.utils import compile_global_access
+
+_logger = logging.getLogger(__name__)
+
+
+def migrate(cr, version):
+    """Report the global access code saved before it was sandboxed
+
+    Code the sandbox rejects denies access to the users of its rule until it is fixed.
+    """
+    if not version:
+        return
+    
+    cr.execute("""
+        SELECT id, global_access FROM access_management
+        WHERE global_access IS NOT NULL AND global_access != ''
+    """)
+    for rule_id, code in cr.fetchall():
+        try:
+            compile_global_access(code)
+        except (SyntaxError, ValueError) as e:
+            _logger.warning(
+                "Global access code of access rule %s is not allowed anymore, "
+                "it denies access until fixed: %s", rule_id, e,
+            )
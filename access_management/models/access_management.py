@@ -1,15 +1,40 @@
 # -*- coding: utf-8 -*-
 import ast
+import collections
+import functools
 import json
 import logging
+import time
 from lxml import etree
 from odoo import models, fields, api, tools, _
 from odoo.exceptions import ValidationError, UserError
 from odoo.tools.safe_eval import safe_eval
 from odoo.osv import expression
 
+from .utils import (
+    FIELD_ACCESS_FLAGS, IMPORT_BATCH_SIZE, IMPORT_LINE_TYPES, POLICY_SECTIONS,
+    access_cache, access_span, add_rules_evaluated, import_bool, import_value_list,
+    clear_policy_cache, clear_policy_sections, clear_rule_index, ensure_policy_signaling,
+    clear_user_policy_cache, compile_global_access, compile_policy_lines, diff_policy_section, get_policy_hash,
+    match_rules, MODEL_OPERATIONS, policy_cache_key, project_policy_line,
+    register_policy, rule_index_key, setup_policy_signaling, signal_policy_change, SLOW_ACCESS_LOG_LIMIT,
+    drain_slow_access_buffer, user_policy_cache_key,
+)
+
 _logger = logging.getLogger(__name__)
 
+# Rule fields deciding which users a rule applies to
+RULE_TARGETING_FIELDS = {
+    'active', 'user_ids', 'group_ids', 'apply_by_group', 'company_id',
+    'default_internal_user', 'default_portal_user',
+}
+
+# Rule fields compiled into a policy section
+RULE_SECTION_FIELDS = {
+    'disable_developer_mode': 'rules',
+    'global_access': 'rules',
+}
+
 
 class AccessManagement(models.Model):
     _name = 'access.management'
@@ -149,7 +174,11 @@ class AccessManagement(models.Model):
     # Global Access
     global_access = fields.Text(
         string='Global Access',
-        help="Python code for custom access logic"
+        help="Python code for custom access logic, run as the body of a function of "
+             "user, model and operation on every model access check: returning False "
+             "denies access. Code whose result only depends on the rules applying to the "
+             "user may declare it with a '# access-scope: user' line, its results are then "
+             "cached per set of rules, model and operation, and user is None."
     )
     
     # Computed fields
@@ -187,11 +216,24 @@ class AccessManagement(models.Model):
         readonly=True
     )
     
+    def init(self):
+        setup_policy_signaling(self.env.cr)
+    
     @api.depends('model_access_ids', 'field_access_ids', 'domain_access_ids',
                  'button_tab_access_ids', 'menu_access_ids', 'search_panel_access_ids',
                  'chatter_access_ids', 'field_conditional_access_ids')
     def _compute_access_rules_count(self):
-        for record in self:
+        # Grouped counts per line table for all the saved rules at once
+        rules = self.filtered('id')
+        line_sections = [section for section in POLICY_SECTIONS if section != 'rules']
+        counts = self._get_line_counts(rules.ids, line_sections) if rules else {}
+        for record in rules:
+            record.access_rules_count = sum(
+                counts[section].get(record.id, 0) for section in line_sections
+            )
+        
+        # Unsaved rules have their lines in cache only
+        for record in self - rules:
             count = (
                 len(record.model_access_ids) +
                 len(record.field_access_ids) +
@@ -204,16 +246,68 @@ class AccessManagement(models.Model):
             )
             record.access_rules_count = count
     
-    @api.model
-    def create(self, vals):
-        vals['created_by'] = self.env.user.id
-        vals['created_on'] = fields.Datetime.now()
-        return super(AccessManagement, self).create(vals)
-    
+    @api.model_create_multi
+    def create(self, vals_list):
+        for vals in vals_list:
+            vals['created_by'] = self.env.user.id
+            vals['created_on'] = fields.Datetime.now()
+        res = super(AccessManagement, self).create(vals_list)
+        if not self.env.context.get('defer_access_invalidation'):
+            self._invalidate_rule_index()
+            self._invalidate_user_policies(res._get_impacted_user_ids())
+        return res
+
     def write(self, vals):
         vals['last_updated_by'] = self.env.user.id
         vals['last_updated_on'] = fields.Datetime.now()
-        return super(AccessManagement, self).write(vals)
+        
+        if self.env.context.get('defer_access_invalidation'):
+            return super(AccessManagement, self).write(vals)
+        
+        # Users the rules applied to before the change are impacted too
+        targeting = not RULE_TARGETING_FIELDS.isdisjoint(vals)
+        impacted_user_ids = self._get_impacted_user_ids() if targeting else set()
+        
+        res = super(AccessManagement, self).write(vals)
+        
+        if targeting:
+            impacted_user_ids |= self._get_impacted_user_ids()
+            self._invalidate_rule_index()
+            self._invalidate_user_policies(impacted_user_ids)
+        sections = {RULE_SECTION_FIELDS[name] for name in vals if name in RULE_SECTION_FIELDS}
+        if sections:
+            self._invalidate_policy_sections(self.ids, sections)
+        return res
+
+    def unlink(self):
+        if self.env.context.get('defer_access_invalidation'):
+            return super(AccessManagement, self).unlink()
+        
+        rule_ids = self.ids
+        impacted_user_ids = self._get_impacted_user_ids()
+        res = super(AccessManagement, self).unlink()
+        self._invalidate_rule_index()
+        self._invalidate_user_policies(impacted_user_ids)
+        self._invalidate_policy_sections(rule_ids, POLICY_SECTIONS)
+        return res
+
+    def _get_impacted_user_ids(self):
+        """Get the users targeted by the rules, whatever their company or state"""
+        rules = self.sudo().with_context(active_test=False)
+        user_ids = set(rules.user_ids.ids)
+        user_ids.update(rules.filtered('apply_by_group').group_ids.users.ids)
+        
+        # User type filters target every internal or portal user
+        share_values = []
+        if any(rules.mapped('default_internal_user')):
+            share_values.append(False)
+        if any(rules.mapped('default_portal_user')):
+            share_values.append(True)
+        if share_values:
+            user_ids.update(self.env['res.users'].sudo().with_context(active_test=False).search([
+                ('share', 'in', share_values),
+            ]).ids)
+        return user_ids
     
     @api.constrains('user_ids', 'group_ids')
     def _check_user_or_group(self):
@@ -230,11 +324,15 @@ class AccessManagement(models.Model):
         for record in self:
             if record.global_access:
                 try:
-                    compile(record.global_access, '<string>', 'exec')
+                    compile_global_access(record.global_access)
                 except SyntaxError as e:
                     raise ValidationError(
                         _("Global access code has syntax error: %s") % str(e)
                     )
+                except ValueError as e:
+                    raise ValidationError(
+                        _("Global access code is not allowed: %s") % str(e)
+                    )
     
     def toggle_active(self):
         """Toggle the active state of the access management rule"""
@@ -275,41 +373,1076 @@ class AccessManagement(models.Model):
         """Get all applicable rules for a specific user"""
         if not user:
             user = self.env.user
+        user = user.sudo()
         
-        domain = [('active', '=', True)]
+        with access_span('access_management._get_applicable_rules') as span:
+            rule_ids = match_rules(
+                self._get_rule_index(), user.id, user.share, user.company_id.id,
+                user.groups_id.ids, check_company=not self.env.context.get('bypass_company_check'),
+            )
+            if span:
+                span.set_attribute('enduser.id', user.id)
+                span.set_attribute('access.rule_count', len(rule_ids))
+        return self.browse(rule_ids)
+
+    @api.model
+    def _get_users_rule_ids(self, user_ids):
+        """Get the applicable rule ids of many users at once, as {user_id: rule_ids}"""
+        if not user_ids:
+            return {}
+        self.env['res.users'].flush_model(['share', 'company_id', 'groups_id'])
+        self.env.cr.execute("""
+            SELECT u.id, u.share, u.company_id, array_remove(array_agg(rel.gid), NULL)
+            FROM res_users u
+            LEFT JOIN res_groups_users_rel rel ON rel.uid = u.id
+            WHERE u.id IN %s
+            GROUP BY u.id
+        """, [tuple(user_ids)])
         
-        # Company check
-        if not self.env.context.get('bypass_company_check'):
-            domain.append('|')
-            domain.append(('company_id', '=', False))
-            domain.append(('company_id', '=', user.company_id.id))
+        index = self._get_rule_index()
+        check_company = not self.env.context.get('bypass_company_check')
+        return {
+            user_id: tuple(match_rules(index, user_id, share, company_id, group_ids, check_company))
+            for user_id, share, company_id, group_ids in self.env.cr.fetchall()
+        }
+
+    @api.model
+    def _get_line_counts(self, rule_ids, sections):
+        """Count the lines of rules per section, as {section: {rule_id: count}}
+
+        One grouped query per section, whatever the number of rules.
+        """
+        counts = {}
+        for section in sections:
+            line_model = self.env[POLICY_SECTIONS[section][0]].sudo().with_context(active_test=False)
+            groups = line_model.read_group(
+                [('access_id', 'in', list(rule_ids))], ['access_id'], ['access_id'], lazy=False,
+            )
+            counts[section] = {group['access_id'][0]: group['__count'] for group in groups}
+        return counts
+
+    @api.model
+    def _import_rules(self, records, line_types=None, update_existing=False):
+        """Import rules and their lines from the (row, values) pairs of an import file
+
+        Records are processed by batches: the logins, groups, companies,
+        menus, models and fields referenced by a batch are resolved with one
+        query per kind, and rules and lines are created with one create()
+        per model. A batch failing to save is retried row by row so errors
+        are reported per row. Tracking is disabled and the access caches
+        are invalidated once at the end.
+
+        Returns a dict with the ids of the created or updated ``rules``, the
+        number of created ``lines`` and the ``errors`` as (row, message).
+        """
+        result = {'rules': [], 'lines': 0, 'errors': []}
+        line_types = line_types or list(IMPORT_LINE_TYPES)
+        importer = self.with_context(tracking_disable=True, defer_access_invalidation=True)
         
-        rules = self.search(domain, order='sequence')
-        applicable_rules = self.env['access.management']
+        for batch in tools.split_every(IMPORT_BATCH_SIZE, records, list):
+            importer._import_rule_batch(batch, line_types, update_existing, result)
         
-        for rule in rules:
-            # Check if rule applies to this user
-            applies = False
-            
-            # Check user types
-            if rule.default_internal_user and not user.share:
-                applies = True
-            elif rule.default_portal_user and user.share:
-                applies = True
+        if result['rules']:
+            self._invalidate_policy_cache()
+        return result
+
+    @api.model
+    def _prepare_import_batch(self, batch, line_types, errors):
+        """Get the (row, name, rule values, lines by type) of a batch of import records
+
+        Rows that are not objects, with malformed lines or referencing
+        unknown records are reported in ``errors`` and skipped.
+        """
+        valid = []
+        for row, values in batch:
+            if not isinstance(values, dict):
+                errors.append((row, str(values) if isinstance(values, Exception) else _("Expected an object")))
+                continue
+            try:
+                self._check_import_lines(values, line_types)
+            except ValueError as e:
+                errors.append((row, str(e)))
+                continue
+            valid.append((row, values))
+        batch = valid
+        references = self._resolve_import_references([values for _row, values in batch], line_types)
+        
+        prepared = []
+        for row, values in batch:
+            try:
+                rule_vals = self._prepare_import_rule(values, references)
+                lines = self._prepare_import_lines(values, line_types, references)
+            except ValueError as e:
+                errors.append((row, str(e)))
+                continue
+            prepared.append((row, rule_vals['name'], rule_vals, lines))
+        return prepared
+
+    @api.model
+    def _check_import_lines(self, values, line_types):
+        """Raise a ValueError if the lines of an import record are not lists of objects"""
+        for line_type in line_types:
+            lines = values.get(line_type) or []
+            if not isinstance(lines, list) or not all(isinstance(line, dict) for line in lines):
+                raise ValueError(_("%s must be a list of objects") % line_type)
+            for line in lines:
+                for key in ('menu', 'model', 'field'):
+                    if line.get(key) and not isinstance(line[key], str):
+                        raise ValueError(_("%(type)s %(key)s must be a name: %(value)s") % {
+                            'type': line_type, 'key': key, 'value': line[key],
+                        })
+
+    @api.model
+    def _get_rule_ids_by_name(self, names):
+        """Get the ids of the rules with the given names, archived ones included"""
+        rule_ids = {}
+        if names:
+            rules = self.with_context(active_test=False).search_read([('name', 'in', list(names))], ['name'])
+            for rule in rules:
+                rule_ids.setdefault(rule['name'], rule['id'])
+        return rule_ids
+
+    @api.model
+    def _import_rule_batch(self, batch, line_types, update_existing, result):
+        """Import one batch of rules, see ``_import_rules``"""
+        errors = result['errors']
+        prepared = self._prepare_import_batch(batch, line_types, errors)
+        existing = self._get_rule_ids_by_name({item[1] for item in prepared}) if update_existing else {}
+        
+        # Create the new rules, update the existing ones
+        rules = {}
+        to_create = [item for item in prepared if item[1] not in existing]
+        created = self._import_create(
+            self, [(row, rule_vals) for row, _name, rule_vals, _lines in to_create], errors,
+        )
+        for (row, _name, _rule_vals, _lines), rule in zip(to_create, created):
+            if rule:
+                rules[row] = rule
+        for row, name, rule_vals, _lines in prepared:
+            if name in existing:
+                rule = self.browse(existing[name])
+                try:
+                    with self.env.cr.savepoint():
+                        rule.write(rule_vals)
+                except Exception as e:
+                    errors.append((row, str(e)))
+                    continue
+                rules[row] = rule
+        
+        # One create per line type for the lines of every imported rule
+        for line_type in line_types:
+            line_model = self.env[IMPORT_LINE_TYPES[line_type][0]].with_context(self.env.context)
+            vals_list = [
+                (row, dict(line_vals, access_id=rules[row].id))
+                for row, _name, _rule_vals, lines in prepared if row in rules
+                for line_vals in lines.get(line_type, [])
+            ]
+            result['lines'] += len(list(filter(None, self._import_create(line_model, vals_list, errors))))
+        
+        result['rules'].extend(rule.id for rule in rules.values())
+
+    @api.model
+    def _import_create(self, model, vals_list, errors):
+        """Create records from (row, vals) pairs in one call, or row by row if it fails
+
+        Returns the created records aligned with ``vals_list``, None for
+        the rows that failed.
+        """
+        if not vals_list:
+            return []
+        try:
+            with self.env.cr.savepoint():
+                return list(model.create([vals for _row, vals in vals_list]))
+        except Exception:
+            records = []
+            for row, vals in vals_list:
+                try:
+                    with self.env.cr.savepoint():
+                        records.append(model.create(vals))
+                except Exception as e:
+                    errors.append((row, str(e)))
+                    records.append(None)
+            return records
+
+    @api.model
+    def _import_call(self, model, method, args, row_ids, errors):
+        """Call a method on records in one call, or record by record if it fails
+
+        ``row_ids`` are (row, record id) pairs, failures are reported on the
+        row of their record. Returns the number of records the call succeeded on.
+        """
+        if not row_ids:
+            return 0
+        try:
+            with self.env.cr.savepoint():
+                getattr(model.browse([record_id for _row, record_id in row_ids]), method)(*args)
+            return len(row_ids)
+        except Exception:
+            done = 0
+            for row, record_id in row_ids:
+                try:
+                    with self.env.cr.savepoint():
+                        getattr(model.browse(record_id), method)(*args)
+                    done += 1
+                except Exception as e:
+                    errors.append((row, str(e)))
+            return done
+
+    @api.model
+    def _resolve_import_references(self, values_list, line_types):
+        """Resolve the records referenced by import values, with one query per kind"""
+        logins, group_names, company_names = set(), set(), set()
+        menu_paths, model_names, field_keys = set(), set(), set()
+        for values in values_list:
+            logins.update(import_value_list(values.get('users')))
+            group_names.update(import_value_list(values.get('groups')))
+            if values.get('company'):
+                company_names.add(values['company'])
+            for line_type in line_types:
+                for line in values.get(line_type) or []:
+                    if line.get('menu'):
+                        menu_paths.add(line['menu'])
+                    if line.get('model'):
+                        model_names.add(line['model'])
+                        if line.get('field'):
+                            field_keys.add((line['model'], line['field']))
+        
+        def lookup(model_name, field_name, names):
+            ids = {}
+            if names:
+                model = self.env[model_name].sudo().with_context(active_test=False)
+                for record in model.search_read([(field_name, 'in', list(names))], [field_name]):
+                    ids.setdefault(record[field_name], record['id'])
+            return ids
+        
+        # Menus are matched on their full path, searched by the name of their leaf
+        menu_ids = {}
+        if menu_paths:
+            leaves = {path.rsplit('/', 1)[-1] for path in menu_paths}
+            menus = self.env['ir.ui.menu'].sudo().with_context(active_test=False).search([
+                ('name', 'in', list(leaves)),
+            ])
+            for menu in menus:
+                menu_ids.setdefault(menu.complete_name, menu.id)
+        
+        field_ids = {}
+        if field_keys:
+            model_fields = self.env['ir.model.fields'].sudo().search_read([
+                ('model', 'in', list({model for model, _name in field_keys})),
+                ('name', 'in', list({name for _model, name in field_keys})),
+            ], ['model', 'name'])
+            field_ids = {(field['model'], field['name']): field['id'] for field in model_fields}
+        
+        return {
+            'users': lookup('res.users', 'login', logins),
+            'groups': lookup('res.groups', 'name', group_names),
+            'companies': lookup('res.company', 'name', company_names),
+            'menus': menu_ids,
+            'models': lookup('ir.model', 'model', model_names),
+            'fields': field_ids,
+        }
+
+    @api.model
+    def _prepare_import_rule(self, values, references):
+        """Get the values of a rule to import, raising ValueError for unknown references"""
+        if not values.get('name'):
+            raise ValueError(_("Missing rule name"))
+        
+        rule_vals = {'name': values['name'], 'active': import_bool(values.get('active', True))}
+        for name in ('apply_by_group', 'read_only', 'default_internal_user',
+                     'default_portal_user', 'disable_developer_mode'):
+            if name in values:
+                rule_vals[name] = import_bool(values[name])
+        
+        for key, field_name, kind in (('users', 'user_ids', 'users'), ('groups', 'group_ids', 'groups')):
+            if key in values:
+                names = import_value_list(values[key])
+                missing = [name for name in names if name not in references[kind]]
+                if missing:
+                    raise ValueError(_("Unknown %s: %s") % (key, ', '.join(missing)))
+                rule_vals[field_name] = [(6, 0, [references[kind][name] for name in names])]
+        
+        if values.get('company'):
+            if values['company'] not in references['companies']:
+                raise ValueError(_("Unknown company: %s") % values['company'])
+            rule_vals['company_id'] = references['companies'][values['company']]
+        return rule_vals
+
+    @api.model
+    def _prepare_import_lines(self, values, line_types, references):
+        """Get the values of the lines of a rule to import, by line type"""
+        lines = {}
+        for line_type in line_types:
+            _line_model, columns, _key = IMPORT_LINE_TYPES[line_type]
+            if line_type in values:
+                # Line types given empty are synchronized too
+                lines[line_type] = []
+            for line in values.get(line_type) or []:
+                line_vals = {
+                    column: line[key] for key, column in columns.items() if key in line
+                }
+                if line.get('menu'):
+                    if line['menu'] not in references['menus']:
+                        raise ValueError(_("Unknown menu: %s") % line['menu'])
+                    line_vals['menu_id'] = references['menus'][line['menu']]
+                if line.get('model'):
+                    if line['model'] not in references['models']:
+                        raise ValueError(_("Unknown model: %s") % line['model'])
+                    line_vals['model_id'] = references['models'][line['model']]
+                if line.get('field'):
+                    field_key = (line.get('model'), line['field'])
+                    if field_key not in references['fields']:
+                        raise ValueError(_("Unknown field: %s") % '.'.join(filter(None, field_key)))
+                    line_vals['field_id'] = references['fields'][field_key]
+                lines[line_type].append(line_vals)
+        return lines
+
+    @api.model
+    def _sync_rules(self, records, line_types=None, remove_missing=False):
+        """Synchronize rules and their lines with the (row, values) pairs of an import file
+
+        Rules are matched by name and lines by their natural key within
+        their rule (see ``IMPORT_LINE_TYPES``). Only the differences are
+        applied: missing rules and lines are created, changed ones written
+        and lines absent from the file unlinked, by batches. Lines are only
+        synchronized for the line types given in the row of their rule, so
+        partial files leave the other lines as they are. Rules absent
+        from the file are unlinked too with ``remove_missing``, unless some
+        rows failed.
+
+        Returns a dict with the ids of the synchronized ``rules``, the
+        numbers of ``created``, ``updated`` and ``deleted`` records and the
+        ``errors`` as (row, message).
+        """
+        result = {'rules': [], 'created': 0, 'updated': 0, 'deleted': 0, 'errors': []}
+        line_types = line_types or list(IMPORT_LINE_TYPES)
+        syncer = self.with_context(tracking_disable=True, defer_access_invalidation=True)
+        
+        for batch in tools.split_every(IMPORT_BATCH_SIZE, records, list):
+            syncer._sync_rule_batch(batch, line_types, result)
+        
+        # A rule failing to sync must not be taken for a removed one
+        if remove_missing and not result['errors']:
+            missing = syncer.with_context(active_test=False).search([('id', 'not in', result['rules'])])
+            result['deleted'] += len(missing)
+            missing.unlink()
+        
+        if result['created'] or result['updated'] or result['deleted']:
+            self._invalidate_policy_cache()
+        return result
+
+    @api.model
+    def _sync_rule_batch(self, batch, line_types, result):
+        """Synchronize one batch of rules, see ``_sync_rules``"""
+        errors = result['errors']
+        prepared = self._prepare_import_batch(batch, line_types, errors)
+        existing_ids = self._get_rule_ids_by_name({item[1] for item in prepared})
+        
+        # Current values of the matched rules, in one read
+        rule_fields = {name for _row, _name, rule_vals, _lines in prepared for name in rule_vals}
+        current = {
+            rule['id']: rule for rule in self.browse(list(existing_ids.values())).with_context(
+                active_test=False,
+            ).read(list(rule_fields), load=None)
+        } if existing_ids else {}
+        
+        rules = {}
+        to_create = []
+        for row, name, rule_vals, _lines in prepared:
+            rule_id = existing_ids.get(name)
+            if not rule_id:
+                to_create.append((row, rule_vals))
+                continue
+            changes = {
+                field_name: value for field_name, value in rule_vals.items()
+                if not self._is_import_value_equal(current[rule_id][field_name], value)
+            }
+            if changes:
+                try:
+                    with self.env.cr.savepoint():
+                        self.browse(rule_id).write(changes)
+                except Exception as e:
+                    errors.append((row, str(e)))
+                    continue
+                result['updated'] += 1
+            rules[row] = rule_id
+        
+        created = self._import_create(self, to_create, errors)
+        for (row, _rule_vals), rule in zip(to_create, created):
+            if rule:
+                rules[row] = rule.id
+                result['created'] += 1
+        
+        for line_type in line_types:
+            self._sync_rule_lines(line_type, prepared, rules, result)
+        
+        result['rules'].extend(rules.values())
+
+    @api.model
+    def _sync_rule_lines(self, line_type, prepared, rules, result):
+        """Synchronize the lines of one type of a batch of rules, matched by natural key
+
+        Only the rules whose row gives this line type are synchronized, the
+        lines of the others are left as they are. A natural key given twice
+        for a rule, in the file or in the database, is reported as an error
+        of its row and the lines of the rule are left as they are.
+        """
+        model_name, columns, key_columns = IMPORT_LINE_TYPES[line_type]
+        line_model = self.env[model_name].with_context(self.env.context)
+        errors = result['errors']
+        
+        def line_key(rule_id, values):
+            return (rule_id,) + tuple(values.get(column) or False for column in key_columns)
+        
+        def report_duplicate(row, key):
+            errors.append((row, _("Duplicate %(type)s line: %(key)s") % {
+                'type': line_type,
+                'key': ', '.join(f'{column}={value}' for column, value in zip(key_columns, key[1:])),
+            }))
+        
+        # Lines of the file by natural key, for the rules giving this line type
+        rows = {}
+        file_lines = {}
+        skipped = set()
+        for row, _name, _rule_vals, lines in prepared:
+            if row not in rules or line_type not in lines:
+                continue
+            rows.setdefault(rules[row], row)
+            for line_vals in lines[line_type]:
+                key = line_key(rules[row], line_vals)
+                if key in file_lines:
+                    report_duplicate(row, key)
+                    skipped.add(rules[row])
+                file_lines[key] = (row, line_vals)
+        if not rows:
+            return
+        
+        # Current lines of the synchronized rules, in one query
+        current = {}
+        for line in line_model.search_read(
+            [('access_id', 'in', list(rows))],
+            ['access_id'] + list(key_columns) + list(columns.values()), load=None,
+        ):
+            key = line_key(line['access_id'], line)
+            if key in current:
+                report_duplicate(rows[line['access_id']], key)
+                skipped.add(line['access_id'])
+            current[key] = line
+        
+        to_create, to_write = [], {}
+        for key, (row, line_vals) in file_lines.items():
+            if key[0] in skipped:
+                continue
+            line = current.get(key)
+            if not line:
+                to_create.append((row, dict(line_vals, access_id=key[0])))
+                continue
+            changes = {
+                column: value for column, value in line_vals.items()
+                if not self._is_import_value_equal(line[column], value)
+            }
+            if changes:
+                # Lines with the same changes are written together
+                to_write.setdefault(tuple(sorted(changes.items())), []).append((row, line['id']))
+        
+        # Lines failing to be saved are reported on the row of their rule
+        result['created'] += len(list(filter(None, self._import_create(line_model, to_create, errors))))
+        for changes, row_ids in to_write.items():
+            result['updated'] += self._import_call(line_model, 'write', (dict(changes),), row_ids, errors)
+        
+        obsolete = [
+            (rows[key[0]], line['id']) for key, line in current.items()
+            if key not in file_lines and key[0] not in skipped
+        ]
+        result['deleted'] += self._import_call(line_model, 'unlink', (), obsolete, errors)
+
+    @api.model
+    def _is_import_value_equal(self, current, value):
+        """Compare a value read with load=None to a value to import"""
+        if isinstance(value, list):
+            # Many2many replacement commands
+            return set(current or []) == set(value[0][2])
+        if isinstance(value, bool) or isinstance(current, bool):
+            return bool(current) == bool(value)
+        return current == value
+
+    def _get_rule_targeting(self, values=None):
+        """Get the targeting of the rule, with unsaved values applied over it"""
+        self.ensure_one()
+        targeting = {
+            'active': self.active,
+            'user_ids': self.user_ids.ids,
+            'group_ids': self.group_ids.ids,
+            'apply_by_group': self.apply_by_group,
+            'company_id': self.company_id.id,
+            'default_internal_user': self.default_internal_user,
+            'default_portal_user': self.default_portal_user,
+        }
+        targeting.update({
+            name: value for name, value in (values or {}).items()
+            if name in RULE_TARGETING_FIELDS
+        })
+        return targeting
+
+    @api.model
+    def _get_target_user_ids(self, targeting):
+        """Get the active users matched by rule targeting values, from the rel tables"""
+        if not targeting.get('active'):
+            return set()
+        
+        clauses, params = [], []
+        if targeting.get('user_ids'):
+            clauses.append("u.id IN %s")
+            params.append(tuple(targeting['user_ids']))
+        if targeting.get('apply_by_group') and targeting.get('group_ids'):
+            # Members of implying groups are members of the implied ones too
+            clauses.append("u.id IN (SELECT uid FROM res_groups_users_rel WHERE gid IN %s)")
+            params.append(tuple(targeting['group_ids']))
+        share_values = []
+        if targeting.get('default_internal_user'):
+            share_values.append(False)
+        if targeting.get('default_portal_user'):
+            share_values.append(True)
+        if share_values:
+            clauses.append("u.share IN %s")
+            params.append(tuple(share_values))
+        if not clauses:
+            return set()
+        
+        query = "SELECT u.id FROM res_users u WHERE u.active AND (%s)" % " OR ".join(clauses)
+        if targeting.get('company_id') and not self.env.context.get('bypass_company_check'):
+            query += " AND u.company_id = %s"
+            params.append(targeting['company_id'])
+        
+        self.env['res.users'].flush_model(['active', 'share', 'company_id', 'groups_id'])
+        self.env.cr.execute(query, params)
+        return {row[0] for row in self.env.cr.fetchall()}
+
+    def _get_rule_impact(self, values=None):
+        """Compute the users and model permissions a change of the rule affects
+
+        ``values`` holds the unsaved changes: targeting fields, with plain id
+        lists for user_ids and group_ids, and optionally ``model_access``, the
+        model lines replacing the current ones as dicts with a ``model`` key
+        and perm_read/perm_write/perm_create/perm_unlink keys.
+
+        Without ``values``, compute the current impact of the rule: the
+        policies of its users against the same policies without it.
+        """
+        self.ensure_one()
+        rule = self.sudo()
+        
+        target_user_ids = self._get_target_user_ids(rule._get_rule_targeting())
+        if values is None:
+            values = {}
+            before_user_ids, after_user_ids = set(), target_user_ids
+        else:
+            before_user_ids = target_user_ids
+            after_user_ids = self._get_target_user_ids(rule._get_rule_targeting(values))
+        lines_changed = 'model_access' in values
+        affected_user_ids = before_user_ids ^ after_user_ids
+        if lines_changed:
+            affected_user_ids |= before_user_ids & after_user_ids
+        
+        # Group the affected users by policy class, past and future membership
+        classes = {}
+        for user_id, rule_ids in self._get_users_rule_ids(affected_user_ids).items():
+            key = (frozenset(rule_ids), user_id in before_user_ids, user_id in after_user_ids)
+            classes[key] = classes.get(key, 0) + 1
+        
+        # Current model lines of every involved rule, candidate lines for this one
+        lines_by_rule = {}
+        involved_rule_ids = set().union(*(rule_ids for rule_ids, _before, _after in classes)) | {rule.id}
+        for line in self._load_policy_lines(involved_rule_ids, 'models'):
+            lines_by_rule.setdefault(line[0], []).append(line)
+        candidate_lines = dict(lines_by_rule)
+        if lines_changed:
+            candidate_lines[rule.id] = [
+                (rule.id, line['model']) + tuple(
+                    bool(line.get('perm_%s' % operation, operation == 'read'))
+                    for operation in MODEL_OPERATIONS
+                )
+                for line in values['model_access']
+            ]
+        
+        model_deltas = {}
+        policy_classes = []
+        for (rule_ids, applies_before, applies_after), user_count in classes.items():
+            other_rule_ids = rule_ids - {rule.id}
+            before_rule_ids = other_rule_ids | ({rule.id} if applies_before else set())
+            if before_rule_ids == rule_ids:
+                # The live policy of the class, compiled once
+                before = self._get_policy_section(
+                    (get_policy_hash(rule_ids), tuple(rule_ids)), 'models'
+                )
+            else:
+                before = compile_policy_lines('models', [
+                    line for rule_id in before_rule_ids for line in lines_by_rule.get(rule_id, [])
+                ])
+            after_rule_ids = other_rule_ids | ({rule.id} if applies_after else set())
+            after = compile_policy_lines('models', [
+                line for rule_id in after_rule_ids for line in candidate_lines.get(rule_id, [])
+            ])
             
-            # Check specific users
-            if user in rule.user_ids:
-                applies = True
+            for model_name in set(before) | set(after):
+                for operation in MODEL_OPERATIONS:
+                    allowed_before = before.get(model_name, {}).get(operation, True)
+                    allowed_after = after.get(model_name, {}).get(operation, True)
+                    if allowed_before != allowed_after:
+                        delta = model_deltas.setdefault(model_name, {}).setdefault(
+                            operation, {'granted': 0, 'revoked': 0}
+                        )
+                        delta['granted' if allowed_after else 'revoked'] += user_count
             
-            # Check groups
-            if rule.apply_by_group and any(group in rule.group_ids for group in user.groups_id):
-                applies = True
+            policy_classes.append({
+                'rule_ids': sorted(rule_ids),
+                'users': user_count,
+                'applies_before': applies_before,
+                'applies_after': applies_after,
+            })
+        
+        return {
+            'rule_id': rule.id,
+            'affected_users': len(affected_user_ids),
+            'users_added': len(after_user_ids - before_user_ids),
+            'users_removed': len(before_user_ids - after_user_ids),
+            'policy_classes': policy_classes,
+            'model_deltas': model_deltas,
+        }
+
+    @api.model
+    def _simulate_policies(self, candidates, user_ids=None, sections=None):
+        """Compute the effective policies of users under a candidate rule set
+
+        ``candidates`` is a list of dicts, each either editing an existing rule
+        (with an ``id`` key) or adding a new one. Targeting fields are given
+        as in ``_get_rule_targeting``, and ``lines`` optionally maps section
+        names to the lines replacing those of the rule, as dicts of the
+        stored columns of the section (see ``POLICY_SECTIONS``).
+
+        Users are grouped by their live and simulated policy classes, each
+        class pair is compiled and diffed once, and the diffs are fanned out
+        to the users. Returns the per-user diffs of the users whose policy
+        changes, keyed by user id then section.
+        """
+        sections = sections or list(POLICY_SECTIONS)
+        self._check_policy_sections(sections)
+        if user_ids is None:
+            self.env['res.users'].flush_model(['active'])
+            self.env.cr.execute("SELECT id FROM res_users WHERE active")
+            user_ids = [row[0] for row in self.env.cr.fetchall()]
+        live_rule_ids = self._get_users_rule_ids(user_ids)
+        
+        # Targeted users and replaced lines of every candidate, new rules get negative ids
+        targets = {}
+        candidate_lines = {section: {} for section in sections}
+        for sequence, candidate in enumerate(candidates, start=1):
+            values = dict(candidate)
+            rule_id = values.pop('id', None)
+            lines = dict(values.pop('lines', None) or {})
+            if rule_id:
+                targeting = self.sudo().browse(rule_id)._get_rule_targeting(values)
+            else:
+                rule_id = -sequence
+                targeting = dict({'active': True}, **values)
+                lines = dict({section: [] for section in sections}, **lines)
+            rule_values = {
+                name: values[name] for name, section in RULE_SECTION_FIELDS.items()
+                if section == 'rules' and name in values
+            }
+            if rule_values and 'rules' not in lines:
+                # Columns the candidate leaves out keep their stored values
+                stored = self._load_policy_lines([rule_id], 'rules') if rule_id > 0 else []
+                columns = POLICY_SECTIONS['rules'][2]
+                lines['rules'] = [dict(dict(zip(columns, stored[0])) if stored else {}, **rule_values)]
+            targets[rule_id] = self._get_target_user_ids(targeting)
+            for section, section_lines in lines.items():
+                if section in candidate_lines:
+                    candidate_lines[section][rule_id] = [
+                        project_policy_line(section, rule_id, line) for line in section_lines
+                    ]
+        
+        # Group the users by live and simulated policy classes
+        classes = {}
+        for user_id, rule_ids in live_rule_ids.items():
+            live = frozenset(rule_ids)
+            simulated = frozenset(rule_id for rule_id in live if rule_id not in targets) | {
+                rule_id for rule_id, target_ids in targets.items() if user_id in target_ids
+            }
+            classes.setdefault((live, simulated), []).append(user_id)
+        
+        involved_rule_ids = set().union(*(live | simulated for live, simulated in classes))
+        existing_rule_ids = [rule_id for rule_id in involved_rule_ids if rule_id > 0]
+        
+        diffs = {}
+        for section in sections:
+            # One query per section for the lines of every involved rule
+            lines_by_rule = {}
+            for line in self._load_policy_lines(existing_rule_ids, section):
+                lines_by_rule.setdefault(line[0], []).append(line)
+            lines_by_rule.update(candidate_lines[section])
             
-            if applies:
-                applicable_rules |= rule
+            simulated_policies = {}
+            for (live, simulated), class_user_ids in classes.items():
+                if live == simulated and not live & targets.keys():
+                    continue
+                before = self._get_policy_section(
+                    (get_policy_hash(live), tuple(sorted(live))), section
+                )
+                if simulated not in simulated_policies:
+                    simulated_policies[simulated] = compile_policy_lines(section, [
+                        line for rule_id in sorted(simulated) for line in lines_by_rule.get(rule_id, [])
+                    ])
+                diff = diff_policy_section(before, simulated_policies[simulated])
+                if diff:
+                    for user_id in class_user_ids:
+                        diffs.setdefault(user_id, {})[section] = diff
         
-        return applicable_rules
-    
+        return {
+            'users': len(live_rule_ids),
+            'changed_users': len(diffs),
+            'policy_classes': len(classes),
+            'diffs': diffs,
+        }
+
+    def action_impact_analysis(self):
+        """Show how many users and policy classes the rule affects"""
+        self.ensure_one()
+        impact = self._get_rule_impact()
+        return {
+            'type': 'ir.actions.client',
+            'tag': 'display_notification',
+            'params': {
+                'title': _('Impact Analysis'),
+                'message': _('%(users)s users in %(classes)s policy classes are affected by this rule.') % {
+                    'users': impact['affected_users'],
+                    'classes': len(impact['policy_classes']),
+                },
+                'type': 'info',
+                'sticky': False,
+            }
+        }
+
+    @api.model
+    def _get_rule_index(self):
+        """Get the cached applicability index of the active rules
+
+        Group-based rules are mapped on every group implying one of their
+        groups, so matching a user is a set union over the user's groups.
+        """
+        ensure_policy_signaling(self.env.cr)
+        cache_key = rule_index_key(self.env.cr.dbname)
+        index = access_cache.get(cache_key)
+        if index is None:
+            index = self._build_rule_index()
+            access_cache.set(cache_key, index)
+        return index
+
+    @api.model
+    def _build_rule_index(self):
+        """Build the applicability index of the active rules from the rel tables"""
+        self.flush_model()
+        self.env['res.groups'].flush_model(['implied_ids'])
+        cr = self.env.cr
+        
+        cr.execute("""
+            SELECT id, company_id, default_internal_user, default_portal_user
+            FROM access_management
+            WHERE active
+            ORDER BY sequence, id
+        """)
+        rules = cr.fetchall()
+        
+        cr.execute("""
+            SELECT rel.user_id, rel.access_id
+            FROM access_management_users_rel rel
+            JOIN access_management am ON am.id = rel.access_id
+            WHERE am.active
+        """)
+        by_user = {}
+        for user_id, rule_id in cr.fetchall():
+            by_user.setdefault(user_id, set()).add(rule_id)
+        
+        # Transitive closure of implied groups: a rule targeting a group
+        # applies to the members of every group implying it
+        cr.execute("""
+            WITH RECURSIVE closure(gid, hid) AS (
+                SELECT id, id FROM res_groups
+                UNION
+                SELECT closure.gid, implied.hid
+                FROM closure
+                JOIN res_groups_implied_rel implied ON implied.gid = closure.hid
+            )
+            SELECT closure.gid, rel.access_id
+            FROM closure
+            JOIN access_management_groups_rel rel ON rel.group_id = closure.hid
+            JOIN access_management am ON am.id = rel.access_id
+            WHERE am.active AND am.apply_by_group
+        """)
+        by_group = {}
+        for group_id, rule_id in cr.fetchall():
+            by_group.setdefault(group_id, set()).add(rule_id)
+        
+        return {
+            'rules': [(rule_id, company_id) for rule_id, company_id, _internal, _portal in rules],
+            'internal': frozenset(rule[0] for rule in rules if rule[2]),
+            'portal': frozenset(rule[0] for rule in rules if rule[3]),
+            'by_user': {user_id: frozenset(ids) for user_id, ids in by_user.items()},
+            'by_group': {group_id: frozenset(ids) for group_id, ids in by_group.items()},
+        }
+
+    @api.model
+    def _get_user_policy(self, user=None):
+        """Get the policy class of a user as a (policy_hash, rule_ids) pair"""
+        if not user:
+            user = self.env.user
+
+        # Rule lookups bypassing the company check are not cached
+        cacheable = not self.env.context.get('bypass_company_check')
+        ensure_policy_signaling(self.env.cr)
+        cache_key = user_policy_cache_key(self.env.cr.dbname, user.id)
+        
+        policy = access_cache.get(cache_key) if cacheable else None
+        if policy is None:
+            rule_ids = tuple(self.sudo()._get_applicable_rules(user).ids)
+            policy = (get_policy_hash(rule_ids), rule_ids)
+            add_rules_evaluated(len(rule_ids))
+            if cacheable:
+                access_cache.set(cache_key, policy)
+        return policy
+
+    @api.model
+    def _get_policy_section(self, policy, section):
+        """Get a compiled section of a policy, compiling it on cache miss"""
+        policy_hash, rule_ids = policy
+        cache_key = policy_cache_key(self.env.cr.dbname, policy_hash, section)
+
+        compiled = access_cache.get(cache_key)
+        if compiled is None:
+            self._check_policy_sections([section])
+            register_policy(self.env.cr.dbname, policy_hash, rule_ids)
+            compiled = self._compile_policy_section(rule_ids, section)
+            add_rules_evaluated(len(rule_ids))
+            access_cache.set(cache_key, compiled)
+        return compiled
+
+    @api.model
+    def _check_policy_sections(self, sections):
+        """Raise a UserError naming the given policy sections that do not exist"""
+        unknown = [str(section) for section in sections if section not in POLICY_SECTIONS]
+        if unknown:
+            raise UserError(_("Unknown access policy sections: %s") % ', '.join(unknown))
+
+    @api.model
+    def _compile_policy_section(self, rule_ids, section):
+        """Compile one section of the merged permissions of the given rules"""
+        return compile_policy_lines(section, self._load_policy_lines(rule_ids, section))
+
+    @api.model
+    def _load_policy_lines(self, rule_ids, section):
+        """Load the lines of a policy section as plain tuples of stored columns
+
+        One search_read per section, reading only stored columns without
+        name_get, so compilation never pulls ir.model* records into cache.
+        """
+        if not rule_ids:
+            return []
+        model_name, key_column, columns = POLICY_SECTIONS[section]
+        records = self.env[model_name].sudo().with_context(active_test=False).search_read(
+            [(key_column, 'in', list(rule_ids))], columns, order='id', load=None,
+        )
+        return [tuple(record[column] for column in columns) for record in records]
+
+    @api.model
+    def _get_field_mask(self, model_name, user=None):
+        """Get the names of the fields of a model that are invisible to the user"""
+        policy = self._get_user_policy(user)
+        cache_key = policy_cache_key(self.env.cr.dbname, policy[0], 'fields', 'mask', model_name)
+
+        mask = access_cache.get(cache_key)
+        if mask is None:
+            field_access = self._get_policy_section(policy, 'fields').get(model_name, {})
+            mask = frozenset(
+                field_name for field_name, flags in field_access.items()
+                if flags['invisible']
+            )
+            access_cache.set(cache_key, mask)
+        return mask
+
+    @api.model
+    def _get_field_overlay(self, model_name, policy):
+        """Get the fields_get flags to force per field of a model for a policy"""
+        cache_key = policy_cache_key(self.env.cr.dbname, policy[0], 'fields', 'overlay', model_name)
+
+        overlay = access_cache.get(cache_key)
+        if overlay is None:
+            field_access = self._get_policy_section(policy, 'fields').get(model_name, {})
+            overlay = {}
+            for field_name, flags in field_access.items():
+                forced = tuple(flag for flag in FIELD_ACCESS_FLAGS if flags[flag])
+                if forced:
+                    overlay[field_name] = forced
+            access_cache.set(cache_key, overlay)
+        return overlay
+
+    @api.model
+    def _get_access_decision(self, hook, model_name, user, operation=None, fields=None, domain=None,
+                             attributes=None):
+        """Get the decision of the engine for a hook call as plain JSON data
+
+        Decisions of sampled hook calls are recorded, then compared on
+        replay, from the same inputs: ``domain`` is the domain searched, and
+        ``fields`` and ``attributes`` the ones requested from fields_get.
+        """
+        policy = self._get_user_policy(user)
+        if hook == 'check_access_rights':
+            decision = self.check_access(model_name, operation, user=user, raise_exception=False)
+        elif hook == '_search':
+            restriction = self._get_policy_section(policy, 'domains').get(model_name)
+            decision = expression.AND([domain or [], restriction]) if restriction else domain or []
+        elif hook == 'fields_get':
+            requested = set(attributes) if attributes else None
+            decision = {}
+            for field_name, flags in self._get_field_overlay(model_name, policy).items():
+                forced = [flag for flag in flags if requested is None or flag in requested]
+                if forced and (not fields or field_name in fields):
+                    decision[field_name] = forced
+        elif hook == 'read':
+            decision = sorted(self._get_field_mask(model_name, user))
+        elif hook == 'write':
+            overlay = self._get_field_overlay(model_name, policy)
+            decision = sorted(name for name in fields or () if 'readonly' in overlay.get(name, ()))
+        elif hook == '_visible_menu_ids':
+            decision = sorted(self._get_policy_section(policy, 'menus'))
+        elif hook == 'has_group':
+            decision = bool(self._get_policy_section(policy, 'rules')['disable_developer_mode'])
+        else:
+            raise ValueError(f"Unknown access hook: {hook}")
+        return json.loads(json.dumps(decision, default=str))
+
+    @api.model
+    def _replay_access_records(self, records, repeat=1, max_mismatches=20):
+        """Replay recorded hook calls against the current engine
+
+        Returns the throughput of the decisions, and the calls whose decision
+        or policy class differs from the recorded one, compared on the first
+        run only. Calls of users that no longer exist are skipped.
+        """
+        users = {}
+        result = {
+            'calls': 0, 'skipped': 0, 'duration': 0.0,
+            'mismatches': 0, 'policy_changes': 0, 'examples': [],
+        }
+        for run in range(repeat):
+            for record in records:
+                if record['user'] not in users:
+                    users[record['user']] = self.env['res.users'].browse(record['user']).exists()
+                user = users[record['user']]
+                if not user:
+                    result['skipped'] += 1
+                    continue
+
+                start = time.perf_counter()
+                decision = self._get_access_decision(
+                    record['hook'], record['model'], user,
+                    operation=record.get('operation'), fields=record.get('fields'),
+                    domain=record.get('domain'), attributes=record.get('attributes'),
+                )
+                result['duration'] += time.perf_counter() - start
+                result['calls'] += 1
+                if run:
+                    continue
+
+                if self._get_user_policy(user)[0] != record['policy']:
+                    result['policy_changes'] += 1
+                if decision != record['decision']:
+                    result['mismatches'] += 1
+                    if len(result['examples']) < max_mismatches:
+                        result['examples'].append({
+                            'hook': record['hook'], 'model': record['model'], 'user': record['user'],
+                            'recorded': record['decision'], 'replayed': decision,
+                        })
+
+        result['throughput'] = result['calls'] / result['duration'] if result['duration'] else 0.0
+        return result
+
+    @api.model
+    def _invalidate_policy_cache(self):
+        """Drop compiled policies, policy assignments and the rule index"""
+        self._clear_cache_on_commit(clear_policy_cache)
+        self._clear_cache_on_commit(clear_user_policy_cache)
+        self._invalidate_rule_index()
+
+    @api.model
+    def _invalidate_user_policies(self, user_ids):
+        """Drop the policy assignments of some users, keeping compiled policies warm"""
+        user_ids = set(user_ids)
+        if not user_ids:
+            return
+        dbname = self.env.cr.dbname
+        clear_user_policy_cache(dbname, user_ids)
+        self._signal_policy_change({('user', user_id, None, None) for user_id in user_ids})
+        
+        # Accumulate the users to clear again once the transaction ends
+        for callbacks in (self.env.cr.postcommit, self.env.cr.postrollback):
+            pending = callbacks.data.setdefault('access_management.user_policies', set())
+            if not pending:
+                callbacks.add(functools.partial(clear_user_policy_cache, dbname, pending))
+            pending.update(user_ids)
+
+    @api.model
+    def _invalidate_policy_sections(self, rule_ids, sections):
+        """Drop some sections of the compiled policies containing one of the rules"""
+        changes = {(rule_id, section) for rule_id in rule_ids for section in sections}
+        if not changes:
+            return
+        dbname = self.env.cr.dbname
+        clear_policy_sections(dbname, changes)
+        self._signal_policy_change({('section', None, rule_id, section) for rule_id, section in changes})
+        
+        # Accumulate the sections to clear again once the transaction ends
+        for callbacks in (self.env.cr.postcommit, self.env.cr.postrollback):
+            pending = callbacks.data.setdefault('access_management.policy_sections', set())
+            if not pending:
+                callbacks.add(functools.partial(clear_policy_sections, dbname, pending))
+            pending.update(changes)
+
+    @api.model
+    def _invalidate_rule_index(self):
+        """Drop the rule applicability index"""
+        self._clear_cache_on_commit(clear_rule_index)
+
+    @api.model
+    def _clear_cache_on_commit(self, clear_func):
+        """Run a cache clearing function of the database now and again once the transaction ends
+
+        Entries rebuilt in between may hold uncommitted data, so they are
+        dropped after commit as well as after rollback.
+        """
+        dbname = self.env.cr.dbname
+        clear_func(dbname)
+        self._signal_policy_change({(clear_func.__name__, None, None, None)})
+        key = 'access_management.%s' % clear_func.__name__
+        for callbacks in (self.env.cr.postcommit, self.env.cr.postrollback):
+            if not callbacks.data.get(key):
+                callbacks.data[key] = True
+                callbacks.add(functools.partial(clear_func, dbname))
+
+    @api.model
+    def _signal_policy_change(self, invalidations):
+        """Log the invalidations for the other workers once the transaction commits
+
+        ``invalidations`` are (kind, user_id, rule_id, section) rows, see
+        apply_invalidations. The caches of this worker are cleared by the
+        invalidation itself, those of the other workers on their next
+        policy lookup.
+        """
+        postcommit = self.env.cr.postcommit
+        pending = postcommit.data.setdefault('access_management.invalidations', set())
+        if not pending:
+            postcommit.add(functools.partial(signal_policy_change, self.env.registry, pending))
+        pending.update(invalidations)
+
     @api.model
     def check_access(self, model_name, operation, user=None, raise_exception=True):
         """Check if user has access to perform operation on model"""
@@ -320,81 +1453,216 @@ class AccessManagement(models.Model):
         if user._is_superuser():
             return True
         
-        rules = self._get_applicable_rules(user)
-        
-        for rule in rules:
-            # Check model access
-            for model_access in rule.model_access_ids:
-                if model_access.model_id.model == model_name:
-                    if operation == 'read' and not model_access.perm_read:
-                        if raise_exception:
-                            raise UserError(_("Read access denied on %s") % model_name)
-                        return False
-                    elif operation == 'write' and not model_access.perm_write:
-                        if raise_exception:
-                            raise UserError(_("Write access denied on %s") % model_name)
-                        return False
-                    elif operation == 'create' and not model_access.perm_create:
-                        if raise_exception:
-                            raise UserError(_("Create access denied on %s") % model_name)
-                        return False
-                    elif operation == 'unlink' and not model_access.perm_unlink:
-                        if raise_exception:
-                            raise UserError(_("Delete access denied on %s") % model_name)
-                        return False
+        with access_span('access_management.check_access', model_name) as span:
+            policy = self._get_user_policy(user)
+            model_access = self._get_policy_section(policy, 'models').get(model_name)
+            allowed = bool(not model_access or model_access.get(operation, True))
+            if allowed:
+                allowed = self._check_global_access(policy, user, model_name, operation)
+            if span:
+                span.set_policy(policy)
+                span.set_attribute('access.operation', operation)
+                span.set_attribute('access.allowed', allowed)
+        
+        if not allowed:
+            if raise_exception:
+                messages = {
+                    'read': _("Read access denied on %s"),
+                    'write': _("Write access denied on %s"),
+                    'create': _("Create access denied on %s"),
+                    'unlink': _("Delete access denied on %s"),
+                }
+                # Global access code may also deny operations of its own
+                message = messages.get(operation, _("Access denied on %s"))
+                raise UserError(message % model_name)
+            return False
         
         return True
     
     @api.model
-    def apply_field_access(self, model_name, fields_dict, user=None):
-        """Apply field access rules to fields dictionary"""
-        if not user:
-            user = self.env.user
+    def _check_global_access(self, policy, user, model_name, operation):
+        """Run the global access code of the rules of a policy, False if one denies access
+
+        Code the sandbox rejects, saved before it was checked, and code
+        raising an error deny access, as a broken restriction must not
+        grant it. Results are cached per policy class, model and operation
+        when every code is user-scoped; such code gets no user then, as
+        its result is shared by all the users of the policy class.
+        """
+        codes = self._get_policy_section(policy, 'rules')['global_access']
+        if not codes:
+            return True
         
-        rules = self._get_applicable_rules(user)
+        functions = []
+        for rule_id, code in codes:
+            try:
+                functions.append((rule_id,) + compile_global_access(code))
+            except (SyntaxError, ValueError) as e:
+                # Reported to be fixed by the migration to 16.0.1.0.1
+                _logger.warning("Global access code of rule %s is invalid, denying access: %s", rule_id, e)
+                return False
         
-        for rule in rules:
-            for field_access in rule.field_access_ids:
-                if field_access.model_id.model == model_name:
-                    field_name = field_access.field_id.name
-                    if field_name in fields_dict:
-                        if field_access.invisible:
-                            fields_dict[field_name]['invisible'] = True
-                        if field_access.readonly:
-                            fields_dict[field_name]['readonly'] = True
-                        if field_access.required:
-                            fields_dict[field_name]['required'] = True
+        memoize = all(user_scoped for _rule_id, _function, user_scoped in functions)
+        cache_key = policy_cache_key(
+            self.env.cr.dbname, policy[0], 'rules', 'global_access', model_name, operation,
+        )
+        if memoize:
+            allowed = access_cache.get(cache_key)
+            if allowed is not None:
+                return allowed
+            user = None
         
-        return fields_dict
+        allowed = True
+        for rule_id, function, _user_scoped in functions:
+            try:
+                result = function(user, model_name, operation)
+            except Exception as e:
+                _logger.warning("Global access code of rule %s failed, denying access: %s", rule_id, e)
+                result = False
+            if result is False:
+                allowed = False
+                break
+        
+        if memoize:
+            access_cache.set(cache_key, allowed)
+        return allowed
     
+    @api.model
+    def apply_field_access(self, model_name, fields_dict, user=None, attributes=None):
+        """Apply field access rules to fields dictionary"""
+        with access_span('access_management.apply_field_access', model_name) as span:
+            policy = self._get_user_policy(user)
+            overlay = self._get_field_overlay(model_name, policy)
+            if span:
+                span.set_policy(policy)
+            requested = set(attributes) if attributes else None
+
+            for field_name, flags in overlay.items():
+                field_desc = fields_dict.get(field_name)
+                if field_desc is None:
+                    continue
+                for flag in flags:
+                    if requested is None or flag in requested:
+                        field_desc[flag] = True
+
+        return fields_dict
+
     @api.model
     def apply_view_access(self, model_name, view_arch, view_type, user=None):
         """Apply view access rules to view architecture"""
-        if not user:
-            user = self.env.user
-        
-        rules = self._get_applicable_rules(user)
-        doc = etree.fromstring(view_arch)
-        
-        for rule in rules:
+        with access_span('access_management.apply_view_access', model_name) as span:
+            policy = self._get_user_policy(user)
+            elements_access = self._get_policy_section(policy, 'buttons').get(model_name)
+            if span:
+                span.set_policy(policy)
+                span.set_attribute('access.view_type', view_type)
+            if not elements_access:
+                return view_arch
+            
+            doc = etree.fromstring(view_arch)
+            
             # Apply button/tab access
-            for btn_tab in rule.button_tab_access_ids:
-                if btn_tab.model_id.model == model_name:
-                    elements = doc.xpath("//%s[@name='%s']" % (btn_tab.element_type, btn_tab.element_name))
-                    for element in elements:
-                        if btn_tab.invisible:
-                            element.set('invisible', '1')
-                        if btn_tab.readonly:
-                            element.set('readonly', '1')
-        
-        return etree.tostring(doc, encoding='unicode')
+            for element_type, element_name, invisible, readonly in elements_access:
+                elements = doc.xpath("//%s[@name='%s']" % (element_type, element_name))
+                for element in elements:
+                    if invisible:
+                        element.set('invisible', '1')
+                    if readonly:
+                        element.set('readonly', '1')
+            
+            return etree.tostring(doc, encoding='unicode')
+
+
+class AccessManagementLineMixin(models.AbstractModel):
+    _name = 'access.management.line.mixin'
+    _description = 'Access Management Line Mixin'
+    
+    # Policy section compiled from the lines of the model
+    _policy_section = None
+    # Field whose target is configured once per rule
+    _unique_line_field = None
+
+    @api.model_create_multi
+    def create(self, vals_list):
+        if self._unique_line_field:
+            self._check_unique_line_keys([
+                (vals.get('access_id'), vals.get(self._unique_line_field)) for vals in vals_list
+            ])
+        res = super(AccessManagementLineMixin, self).create(vals_list)
+        res._invalidate_policy_section()
+        return res
+
+    def write(self, vals):
+        field_name = self._unique_line_field
+        if field_name and ('access_id' in vals or field_name in vals):
+            self._check_unique_line_keys([
+                (vals.get('access_id', line.access_id.id), vals.get(field_name, line[field_name].id))
+                for line in self
+            ], exclude_ids=self.ids)
+        rule_ids = set(self.access_id.ids)
+        res = super(AccessManagementLineMixin, self).write(vals)
+        self._invalidate_policy_section(rule_ids)
+        return res
+
+    def unlink(self):
+        rule_ids = set(self.access_id.ids)
+        res = super(AccessManagementLineMixin, self).unlink()
+        self._invalidate_policy_section(rule_ids)
+        return res
+
+    def _get_duplicate_line_message(self, target):
+        """Get the message of a target configured twice in a rule"""
+        return _("'%s' is already configured in this access rule.") % target.display_name
+
+    def _check_unique_line_keys(self, keys, exclude_ids=()):
+        """Raise a ValidationError if some (rule id, target id) keys repeat or are already configured
+
+        Checked before the lines are saved, so users get the message of the
+        model rather than the generic one of the unique index.
+        """
+        field_name = self._unique_line_field
+        keys = [key for key in keys if all(key)]
+        if not keys:
+            return
+        duplicates = [key for key, count in collections.Counter(keys).items() if count > 1]
+        if not duplicates:
+            self.flush_model(['access_id', field_name])
+            query = "SELECT access_id, %s FROM %s WHERE (access_id, %s) IN %%s" % (
+                field_name, self._table, field_name,
+            )
+            params = [tuple(set(keys))]
+            if exclude_ids:
+                query += " AND id NOT IN %s"
+                params.append(tuple(exclude_ids))
+            self.env.cr.execute(query + " LIMIT 1", params)
+            duplicates = self.env.cr.fetchall()
+        if duplicates:
+            target = self.env[self._fields[field_name].comodel_name].browse(duplicates[0][1])
+            raise ValidationError(self._get_duplicate_line_message(target))
+
+    def _invalidate_policy_section(self, rule_ids=()):
+        """Drop the section of the lines in the policies containing their rules"""
+        if self.env.context.get('defer_access_invalidation'):
+            return
+        rule_ids = set(rule_ids) | set(self.exists().access_id.ids)
+        self.env['access.management']._invalidate_policy_sections(
+            rule_ids, [self._policy_section]
+        )
 
 
 class AccessManagementMenu(models.Model):
     _name = 'access.management.menu'
+    _inherit = 'access.management.line.mixin'
+    _policy_section = 'menus'
+    _unique_line_field = 'menu_id'
     _description = 'Access Management Menu'
     _order = 'sequence, id'
     
+    _sql_constraints = [
+        ('access_menu_unique', 'UNIQUE(access_id, menu_id)',
+         'This menu is already configured in this access rule.'),
+    ]
+    
     access_id = fields.Many2one(
         'access.management', 
         string='Access Management',
@@ -418,25 +1686,23 @@ class AccessManagementMenu(models.Model):
         default=10
     )
     
-    @api.constrains('access_id', 'menu_id')
-    def _check_unique_menu(self):
-        for record in self:
-            duplicate = self.search([
-                ('id', '!=', record.id),
-                ('access_id', '=', record.access_id.id),
-                ('menu_id', '=', record.menu_id.id)
-            ])
-            if duplicate:
-                raise ValidationError(
-                    _("Menu '%s' is already configured in this access rule.") % record.menu_id.name
-                )
+    def _get_duplicate_line_message(self, target):
+        return _("Menu '%s' is already configured in this access rule.") % target.name
 
 
 class AccessManagementModel(models.Model):
     _name = 'access.management.model'
+    _inherit = 'access.management.line.mixin'
+    _policy_section = 'models'
+    _unique_line_field = 'model_id'
     _description = 'Access Management Model'
     _order = 'model_id'
     
+    _sql_constraints = [
+        ('access_model_unique', 'UNIQUE(access_id, model_id)',
+         'This model is already configured in this access rule.'),
+    ]
+    
     access_id = fields.Many2one(
         'access.management', 
         string='Access Management',
@@ -474,18 +1740,8 @@ class AccessManagementModel(models.Model):
         help="Allow delete access"
     )
     
-    @api.constrains('access_id', 'model_id')
-    def _check_unique_model(self):
-        for record in self:
-            duplicate = self.search([
-                ('id', '!=', record.id),
-                ('access_id', '=', record.access_id.id),
-                ('model_id', '=', record.model_id.id)
-            ])
-            if duplicate:
-                raise ValidationError(
-                    _("Model '%s' is already configured in this access rule.") % record.model_id.name
-                )
+    def _get_duplicate_line_message(self, target):
+        return _("Model '%s' is already configured in this access rule.") % target.name
     
     @api.onchange('access_id')
     def _onchange_access_id(self):
@@ -497,9 +1753,17 @@ class AccessManagementModel(models.Model):
 
 class AccessManagementField(models.Model):
     _name = 'access.management.field'
+    _inherit = 'access.management.line.mixin'
+    _policy_section = 'fields'
+    _unique_line_field = 'field_id'
     _description = 'Access Management Field'
     _order = 'model_id, field_id'
     
+    _sql_constraints = [
+        ('access_field_unique', 'UNIQUE(access_id, field_id)',
+         'This field is already configured in this access rule.'),
+    ]
+    
     access_id = fields.Many2one(
         'access.management', 
         string='Access Management',
@@ -550,18 +1814,8 @@ class AccessManagementField(models.Model):
         help="Make this field mandatory"
     )
     
-    @api.constrains('access_id', 'field_id')
-    def _check_unique_field(self):
-        for record in self:
-            duplicate = self.search([
-                ('id', '!=', record.id),
-                ('access_id', '=', record.access_id.id),
-                ('field_id', '=', record.field_id.id)
-            ])
-            if duplicate:
-                raise ValidationError(
-                    _("Field '%s' is already configured in this access rule.") % record.field_id.name
-                )
+    def _get_duplicate_line_message(self, target):
+        return _("Field '%s' is already configured in this access rule.") % target.name
     
     @api.onchange('model_id')
     def _onchange_model_id(self):
@@ -579,6 +1833,8 @@ class AccessManagementField(models.Model):
 
 class AccessManagementFieldConditional(models.Model):
     _name = 'access.management.field.conditional'
+    _inherit = 'access.management.line.mixin'
+    _policy_section = 'conditional'
     _description = 'Access Management Field Conditional'
     _order = 'model_id, field_id'
     
@@ -648,6 +1904,11 @@ class AccessManagementFieldConditional(models.Model):
     
     def evaluate_condition(self, record):
         """Evaluate the condition for a given record"""
+        return self._evaluate_condition(self.condition, record)
+
+    @api.model
+    def _evaluate_condition(self, condition, record):
+        """Evaluate a condition expression for a given record"""
         try:
             context = {
                 'record': record,
@@ -657,7 +1918,7 @@ class AccessManagementFieldConditional(models.Model):
                 'uid': self.env.uid,
                 'context': self.env.context,
             }
-            return safe_eval(self.condition, context)
+            return safe_eval(condition, context)
         except Exception as e:
             _logger.warning("Error evaluating condition: %s", str(e))
             return False
@@ -665,6 +1926,8 @@ class AccessManagementFieldConditional(models.Model):
 
 class AccessManagementDomain(models.Model):
     _name = 'access.management.domain'
+    _inherit = 'access.management.line.mixin'
+    _policy_section = 'domains'
     _description = 'Access Management Domain'
     _order = 'model_id, sequence'
     
@@ -727,6 +1990,8 @@ class AccessManagementDomain(models.Model):
 
 class AccessManagementButtonTab(models.Model):
     _name = 'access.management.button.tab'
+    _inherit = 'access.management.line.mixin'
+    _policy_section = 'buttons'
     _description = 'Access Management Button/Tab'
     _order = 'model_id, element_type, element_name'
     
@@ -802,6 +2067,8 @@ class AccessManagementButtonTab(models.Model):
 
 class AccessManagementSearchPanel(models.Model):
     _name = 'access.management.search.panel'
+    _inherit = 'access.management.line.mixin'
+    _policy_section = 'search_panel'
     _description = 'Access Management Search Panel'
     _order = 'model_id, field_id'
     
@@ -854,9 +2121,17 @@ class AccessManagementSearchPanel(models.Model):
 
 class AccessManagementChatter(models.Model):
     _name = 'access.management.chatter'
+    _inherit = 'access.management.line.mixin'
+    _policy_section = 'chatter'
+    _unique_line_field = 'model_id'
     _description = 'Access Management Chatter'
     _order = 'model_id'
     
+    _sql_constraints = [
+        ('access_chatter_unique', 'UNIQUE(access_id, model_id)',
+         'This model already has chatter configuration in this access rule.'),
+    ]
+    
     access_id = fields.Many2one(
         'access.management', 
         string='Access Management',
@@ -901,15 +2176,78 @@ class AccessManagementChatter(models.Model):
         help="Disable attachment functionality in chatter"
     )
     
-    @api.constrains('access_id', 'model_id')
-    def _check_unique_model(self):
-        for record in self:
-            duplicate = self.search([
-                ('id', '!=', record.id),
-                ('access_id', '=', record.access_id.id),
-                ('model_id', '=', record.model_id.id)
-            ])
-            if duplicate:
-                raise ValidationError(
-                    _("Model '%s' already has chatter configuration in this access rule.") % record.model_id.name
-                )
+    def _get_duplicate_line_message(self, target):
+        return _("Model '%s' already has chatter configuration in this access rule.") % target.name
+
+
+class AccessManagementSlowLog(models.Model):
+    _name = 'access.management.slow.log'
+    _description = 'Access Management Slow Log'
+    _order = 'date desc, id desc'
+    _log_access = False
+
+    date = fields.Datetime(
+        string='Date',
+        required=True,
+        index=True,
+        readonly=True
+    )
+    hook = fields.Char(
+        string='Hook',
+        required=True,
+        index=True,
+        readonly=True
+    )
+    model_name = fields.Char(
+        string='Model',
+        index=True,
+        readonly=True
+    )
+    user_id = fields.Many2one(
+        'res.users',
+        string='User',
+        ondelete='cascade',
+        readonly=True
+    )
+    policy_hash = fields.Char(
+        string='Policy Class',
+        index=True,
+        readonly=True,
+        help="Hash of the rules applying to the user, shared by users with the same rules"
+    )
+    rule_count = fields.Integer(
+        string='Rules',
+        group_operator='max',
+        readonly=True
+    )
+    duration = fields.Float(
+        string='Duration (ms)',
+        digits=(16, 3),
+        group_operator='avg',
+        readonly=True
+    )
+    query_count = fields.Integer(
+        string='Queries',
+        group_operator='avg',
+        readonly=True
+    )
+
+    @api.model
+    def _flush_buffer(self):
+        """Insert the slow access checks buffered by this worker in one batch"""
+        entries = drain_slow_access_buffer()
+        if entries:
+            self.sudo().create(entries)
+        return len(entries)
+
+    @api.autovacuum
+    def _gc_slow_log(self):
+        """Keep the slow access log within its configured number of rows"""
+        self.env.cr.execute("""
+            DELETE FROM access_management_slow_log
+            WHERE id <= (
+                SELECT id FROM access_management_slow_log
+                ORDER BY id DESC
+                OFFSET %s LIMIT 1
+            )
+        """, [SLOW_ACCESS_LOG_LIMIT])
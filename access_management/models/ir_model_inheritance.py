@@ -1,10 +1,20 @@
 # -*- coding: utf-8 -*-
-from odoo import models, fields, api, tools, SUPERUSER_ID
+from odoo import models, fields, api, tools, SUPERUSER_ID, _
 from odoo.exceptions import AccessError
+from odoo.http import request
+from odoo.osv import expression
 from lxml import etree
+import json
 import logging
 
+from .utils import (
+    FIELD_ACCESS_FLAGS, access_profiler, access_span, is_slow_access_flush_due, record_access_call,
+    request_policy_signaling, start_access_stats, start_access_trace, stop_access_stats, stop_access_trace,
+)
+
 _logger = logging.getLogger(__name__)
+# Structured access overhead lines, one per request
+_stats_logger = logging.getLogger(__name__ + '.requests')
 
 
 class IrModel(models.Model):
@@ -26,9 +36,12 @@ class IrModel(models.Model):
             model_name = self.model
             access_mgmt = self.env['access.management']
             
-            if not access_mgmt.check_access(
-                model_name, operation, raise_exception=raise_exception
-            ):
+            record_access_call(self.env, 'check_access_rights', model_name, operation=operation)
+            with access_profiler(self.env, 'check_access_rights', model_name):
+                allowed = access_mgmt.check_access(
+                    model_name, operation, raise_exception=raise_exception
+                )
+            if not allowed:
                 return False
         
         if not res and raise_exception:
@@ -50,17 +63,18 @@ class IrUiView(models.Model):
         )
         
         if model and self.env.uid != SUPERUSER_ID:
-            # Apply access management rules
-            access_mgmt = self.env['access.management']
-            arch = access_mgmt.apply_view_access(
-                model, arch, self.type, user=self.env.user
-            )
-            
-            # Apply field access rules
-            if fields:
-                fields = access_mgmt.apply_field_access(
-                    model, fields, user=self.env.user
+            with access_profiler(self.env, 'postprocess_and_fields', model):
+                # Apply access management rules
+                access_mgmt = self.env['access.management']
+                arch = access_mgmt.apply_view_access(
+                    model, arch, self.type, user=self.env.user
                 )
+                
+                # Apply field access rules
+                if fields:
+                    fields = access_mgmt.apply_field_access(
+                        model, fields, user=self.env.user
+                    )
         
         return arch, fields
 
@@ -74,17 +88,14 @@ class IrUiMenu(models.Model):
         menus = super(IrUiMenu, self)._visible_menu_ids(debug=debug)
         
         if self.env.uid != SUPERUSER_ID:
-            # Get applicable access rules
-            access_mgmt = self.env['access.management']
-            rules = access_mgmt._get_applicable_rules(self.env.user)
-            
-            hidden_menu_ids = set()
-            for rule in rules:
-                for menu_access in rule.menu_access_ids:
-                    if menu_access.hidden:
-                        hidden_menu_ids.add(menu_access.menu_id.id)
-            
-            menus = menus - hidden_menu_ids
+            with access_profiler(self.env, '_visible_menu_ids', self._name):
+                # Get hidden menus of the user's policy
+                access_mgmt = self.env['access.management']
+                policy = access_mgmt._get_user_policy(self.env.user)
+                hidden_menu_ids = access_mgmt._get_policy_section(policy, 'menus')
+                
+                menus = menus - hidden_menu_ids
+            record_access_call(self.env, '_visible_menu_ids', self._name)
         
         return menus
 
@@ -96,17 +107,19 @@ class BaseModel(models.AbstractModel):
     def _search(self, args, offset=0, limit=None, order=None,
                 count=False, access_rights_uid=None):
         """Override to apply domain access rules"""
-        if self.env.uid != SUPERUSER_ID:
-            # Apply domain restrictions from access management
-            access_mgmt = self.env['access.management']
-            rules = access_mgmt._get_applicable_rules(self.env.user)
-            
-            for rule in rules:
-                for domain_access in rule.domain_access_ids:
-                    if domain_access.model_id.model == self._name:
-                        domain = domain_access.get_domain()
-                        if domain:
-                            args = ['&'] + args + domain
+        if self.env.uid != SUPERUSER_ID and not self._name.startswith('access.management'):
+            record_access_call(self.env, '_search', self._name, domain=args)
+            with access_profiler(self.env, '_search', self._name), \
+                    access_span('access_management._search', self._name) as span:
+                # Apply domain restrictions from access management
+                access_mgmt = self.env['access.management']
+                policy = access_mgmt._get_user_policy(self.env.user)
+                domain = access_mgmt._get_policy_section(policy, 'domains').get(self._name)
+                if domain:
+                    args = expression.AND([args, domain])
+                if span:
+                    span.set_policy(policy)
+                    span.set_attribute('access.domain_restricted', bool(domain))
         
         return super(BaseModel, self)._search(
             args, offset=offset, limit=limit, order=order,
@@ -120,42 +133,68 @@ class BaseModel(models.AbstractModel):
             allfields=allfields, attributes=attributes
         )
         
+        # Partial calls that request none of the access flags need no policy
+        if attributes and not set(attributes) & set(FIELD_ACCESS_FLAGS):
+            return res
+
         if self.env.uid != SUPERUSER_ID:
-            # Apply field access rules
-            access_mgmt = self.env['access.management']
-            res = access_mgmt.apply_field_access(
-                self._name, res, user=self.env.user
+            with access_profiler(self.env, 'fields_get', self._name):
+                # Apply field access rules
+                access_mgmt = self.env['access.management']
+                res = access_mgmt.apply_field_access(
+                    self._name, res, user=self.env.user, attributes=attributes
+                )
+            record_access_call(
+                self.env, 'fields_get', self._name, fields=allfields, attributes=attributes,
             )
         
         return res
-    
+
+    def read(self, fields=None, load='_classic_read'):
+        """Override to never fetch fields made invisible by access management"""
+        if self.env.uid != SUPERUSER_ID and not self._name.startswith('access.management'):
+            with access_profiler(self.env, 'read', self._name):
+                mask = self.env['access.management']._get_field_mask(self._name)
+            record_access_call(self.env, 'read', self._name, fields=fields)
+            if mask:
+                # An empty list would make read() fetch every field again
+                fields = [
+                    name for name in self.check_field_access_rights('read', fields)
+                    if name not in mask
+                ] or ['id']
+
+        return super(BaseModel, self).read(fields=fields, load=load)
+
     def write(self, vals):
         """Override to check field-level write access"""
-        if self.env.uid != SUPERUSER_ID:
-            # Check field-level access
-            access_mgmt = self.env['access.management']
-            rules = access_mgmt._get_applicable_rules(self.env.user)
-            
-            for rule in rules:
-                for field_access in rule.field_access_ids:
-                    if field_access.model_id.model == self._name:
-                        field_name = field_access.field_id.name
-                        if field_name in vals and field_access.readonly:
-                            raise AccessError(
-                                _("You don't have write access to field '%s'") % field_name
-                            )
+        if self.env.uid != SUPERUSER_ID and not self._name.startswith('access.management'):
+            record_access_call(self.env, 'write', self._name, fields=list(vals))
+            with access_profiler(self.env, 'write', self._name), \
+                    access_span('access_management.write', self._name) as span:
+                # Check field-level access
+                access_mgmt = self.env['access.management']
+                policy = access_mgmt._get_user_policy(self.env.user)
+                if span:
+                    span.set_policy(policy)
+                    span.set_attribute('access.record_count', len(self))
+                
+                overlay = access_mgmt._get_field_overlay(self._name, policy)
+                for field_name in vals:
+                    if 'readonly' in overlay.get(field_name, ()):
+                        raise AccessError(
+                            _("You don't have write access to field '%s'") % field_name
+                        )
                 
                 # Check conditional field access
-                for cond_access in rule.field_conditional_access_ids:
-                    if cond_access.model_id.model == self._name:
-                        field_name = cond_access.field_id.name
-                        if field_name in vals:
-                            for record in self:
-                                if cond_access.evaluate_condition(record):
-                                    if cond_access.readonly:
-                                        raise AccessError(
-                                            _("You don't have write access to field '%s' for this record") % field_name
-                                        )
+                conditional = access_mgmt._get_policy_section(policy, 'conditional').get(self._name, [])
+                evaluator = self.env['access.management.field.conditional']
+                for field_name, condition, readonly, _invisible, _required in conditional:
+                    if readonly and field_name in vals:
+                        for record in self:
+                            if evaluator._evaluate_condition(condition, record):
+                                raise AccessError(
+                                    _("You don't have write access to field '%s' for this record") % field_name
+                                )
         
         return super(BaseModel, self).write(vals)
 
@@ -163,6 +202,19 @@ class BaseModel(models.AbstractModel):
 class ResUsers(models.Model):
     _inherit = 'res.users'
     
+    # Fields deciding which access rules apply to a user
+    _ACCESS_POLICY_FIELDS = {'groups_id', 'company_id', 'company_ids', 'share'}
+    
+    def write(self, vals):
+        """Override to recompute the access policy of the users only"""
+        res = super(ResUsers, self).write(vals)
+        if any(
+            name in self._ACCESS_POLICY_FIELDS or name.startswith(('in_group_', 'sel_groups_'))
+            for name in vals
+        ):
+            self.env['access.management']._invalidate_user_policies(self.ids)
+        return res
+    
     @api.model
     def has_group(self, group_ext_id):
         """Override to consider access management rules"""
@@ -171,16 +223,55 @@ class ResUsers(models.Model):
         # Check if developer mode is disabled
         if group_ext_id in ['base.group_system', 'base.group_no_one']:
             if self.env.uid != SUPERUSER_ID:
+                # The groups checked are the ones of the user called on
+                user = self or self.env.user
                 access_mgmt = self.env['access.management']
-                rules = access_mgmt._get_applicable_rules(self)
-                
-                for rule in rules:
-                    if rule.disable_developer_mode:
-                        return False
+                with access_profiler(self.env, 'has_group'):
+                    policy = access_mgmt._get_user_policy(user)
+                    disabled = access_mgmt._get_policy_section(policy, 'rules')['disable_developer_mode']
+                record_access_call(self.env, 'has_group', self._name, user=user)
+                if disabled:
+                    return False
         
         return has_group
 
 
+class ResGroups(models.Model):
+    _inherit = 'res.groups'
+    
+    @api.model_create_multi
+    def create(self, vals_list):
+        """Override to refresh the implied groups closure of access rules"""
+        groups = super(ResGroups, self).create(vals_list)
+        self.env['access.management']._invalidate_rule_index()
+        return groups
+    
+    def write(self, vals):
+        """Override to refresh the access policy of the affected members"""
+        if 'users' not in vals and 'implied_ids' not in vals:
+            return super(ResGroups, self).write(vals)
+        
+        # Members implied through other groups are members of these too
+        user_ids = set(self.sudo().users.ids)
+        res = super(ResGroups, self).write(vals)
+        user_ids.update(self.sudo().users.ids)
+        
+        access_mgmt = self.env['access.management']
+        if 'implied_ids' in vals:
+            access_mgmt._invalidate_rule_index()
+        access_mgmt._invalidate_user_policies(user_ids)
+        return res
+    
+    def unlink(self):
+        """Override to refresh the implied groups closure of access rules"""
+        user_ids = self.sudo().users.ids
+        res = super(ResGroups, self).unlink()
+        access_mgmt = self.env['access.management']
+        access_mgmt._invalidate_rule_index()
+        access_mgmt._invalidate_user_policies(user_ids)
+        return res
+
+
 class MailThread(models.AbstractModel):
     _inherit = 'mail.thread'
     
@@ -194,21 +285,74 @@ class MailThread(models.AbstractModel):
         if self.env.uid != SUPERUSER_ID:
             # Check chatter access rules
             access_mgmt = self.env['access.management']
-            rules = access_mgmt._get_applicable_rules(self.env.user)
+            with access_profiler(self.env, '_get_mail_thread_data', self._name):
+                policy = access_mgmt._get_user_policy(self.env.user)
+                chatter_access = access_mgmt._get_policy_section(policy, 'chatter').get(self._name)
             
-            for rule in rules:
-                for chatter_access in rule.chatter_access_ids:
-                    if chatter_access.model_id.model == self._name:
-                        if chatter_access.disable_chatter:
-                            # Return empty data if chatter is disabled
-                            return {}
-                        
-                        # Modify thread data based on restrictions
-                        if chatter_access.disable_followers:
-                            thread_data.pop('followers', None)
-                        if chatter_access.disable_activities:
-                            thread_data.pop('activities', None)
-                        if chatter_access.restrict_message_post:
-                            thread_data['can_post'] = False
+            if chatter_access:
+                if chatter_access['disable_chatter']:
+                    # Return empty data if chatter is disabled
+                    return {}
+                
+                # Modify thread data based on restrictions
+                if chatter_access['disable_followers']:
+                    thread_data.pop('followers', None)
+                if chatter_access['disable_activities']:
+                    thread_data.pop('activities', None)
+                if chatter_access['restrict_message_post']:
+                    thread_data['can_post'] = False
         
         return thread_data
+
+
+class IrHttp(models.AbstractModel):
+    _inherit = 'ir.http'
+    
+    @classmethod
+    def _pre_dispatch(cls, rule, args):
+        """Override to count and trace the access management overhead of the request
+
+        The invalidations of the access caches logged by other workers are
+        applied before the first policy lookup of the request.
+        """
+        request_policy_signaling()
+        start_access_stats()
+        start_access_trace(request.httprequest.headers.get('traceparent'))
+        super(IrHttp, cls)._pre_dispatch(rule, args)
+    
+    @classmethod
+    def _post_dispatch(cls, response):
+        """Override to report the access management overhead of the request"""
+        super(IrHttp, cls)._post_dispatch(response)
+        
+        if is_slow_access_flush_due():
+            cls._flush_slow_access_log()
+        
+        stop_access_trace()
+        stats = stop_access_stats()
+        if not stats or not stats.hooks:
+            return
+        response.headers.add('Server-Timing', stats.get_server_timing())
+        _stats_logger.info("access overhead %s", json.dumps(dict(
+            stats.to_dict(), path=request.httprequest.path, uid=request.session.uid,
+        )))
+    
+    @classmethod
+    def _flush_slow_access_log(cls):
+        """Insert the buffered slow access checks, apart from the request transaction"""
+        try:
+            with request.env.registry.cursor() as cr:
+                env = api.Environment(cr, SUPERUSER_ID, {})
+                env['access.management.slow.log']._flush_buffer()
+        except Exception:
+            _logger.exception("Failed to insert the slow access log")
+
+
+class IrCron(models.Model):
+    _inherit = 'ir.cron'
+    
+    @api.model
+    def _callback(self, cron_name, server_action_id, job_id):
+        """Override to apply the access cache invalidations of other workers before the first policy lookup"""
+        request_policy_signaling()
+        return super(IrCron, self)._callback(cron_name, server_action_id, job_id)
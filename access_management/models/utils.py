@@ -1,10 +1,23 @@
 # -*- coding: utf-8 -*-
+import bisect
+import collections
+import contextlib
+import datetime
 import functools
+import itertools
+import os
+import random
+import re
+import sys
+import textwrap
+import threading
 import time
 import hashlib
 import json
 from odoo import api, tools
+from odoo.osv import expression
 from odoo.tools import config
+from odoo.tools.safe_eval import _BUILTINS, _SAFE_OPCODES, safe_eval, test_expr
 import logging
 
 _logger = logging.getLogger(__name__)
@@ -13,55 +26,268 @@ _logger = logging.getLogger(__name__)
 CACHE_TIMEOUT = int(config.get('access_management_cache_timeout', 3600))  # 1 hour default
 _cache = {}
 
+# Slow access checks: duration threshold in seconds, and the in-memory
+# buffer holding them until they are inserted in batches
+SLOW_ACCESS_THRESHOLD = float(config.get('access_management_slow_threshold', 0.1))
+SLOW_ACCESS_BUFFER_SIZE = int(config.get('access_management_slow_buffer_size', 1000))
+SLOW_ACCESS_FLUSH_SIZE = 100
+SLOW_ACCESS_FLUSH_INTERVAL = 60  # seconds
+# Rows kept in the slow access log
+SLOW_ACCESS_LOG_LIMIT = int(config.get('access_management_slow_log_limit', 100000))
+
+# Recording of sampled access hook calls, for replay: JSON lines file
+# (disabled when unset) and share of the calls recorded
+ACCESS_RECORD_FILE = config.get('access_management_record_file')
+ACCESS_RECORD_RATE = float(config.get('access_management_record_rate', 0.01))
+
+# Tracing of the access code in OpenTelemetry spans: JSON lines file
+# (disabled when unset) and share of the requests traced
+ACCESS_TRACE_FILE = config.get('access_management_trace_file')
+ACCESS_TRACE_RATE = float(config.get('access_management_trace_rate', 0.01))
+
+# Bearer token of the metrics endpoint scrapers (disabled when unset)
+METRICS_TOKEN = config.get('access_management_metrics_token')
+
+# Table logging the access cache invalidations committed by every worker,
+# so the others apply them to the caches they hold in memory, and how long
+# its rows are kept in seconds
+POLICY_SIGNALING_TABLE = 'access_management_invalidation'
+POLICY_SIGNALING_RETENTION = 86400
+
+# Operations of a model access line, in perm_* column order
+MODEL_OPERATIONS = ('read', 'write', 'create', 'unlink')
+
+# Flags a field access line can force on a field description
+FIELD_ACCESS_FLAGS = ('readonly', 'invisible', 'required')
+
+# Restrictions of a chatter access line
+CHATTER_FLAGS = (
+    'disable_chatter', 'disable_followers', 'disable_activities',
+    'restrict_message_post', 'disable_log_note', 'disable_attachments',
+)
+
+# Policy sections: (model, rule key column, stored columns projected as tuples)
+POLICY_SECTIONS = {
+    'rules': ('access.management', 'id', ['id', 'disable_developer_mode', 'global_access']),
+    'menus': ('access.management.menu', 'access_id', ['access_id', 'menu_id', 'hidden']),
+    'models': ('access.management.model', 'access_id', [
+        'access_id', 'model_name', 'perm_read', 'perm_write', 'perm_create', 'perm_unlink',
+    ]),
+    'fields': ('access.management.field', 'access_id', [
+        'access_id', 'model_name', 'field_name', 'readonly', 'invisible', 'required',
+    ]),
+    'conditional': ('access.management.field.conditional', 'access_id', [
+        'access_id', 'model_name', 'field_name', 'condition', 'readonly', 'invisible', 'required',
+    ]),
+    'domains': ('access.management.domain', 'access_id', ['access_id', 'model_name', 'domain']),
+    'buttons': ('access.management.button.tab', 'access_id', [
+        'access_id', 'model_name', 'element_type', 'element_name', 'invisible', 'readonly',
+    ]),
+    'search_panel': ('access.management.search.panel', 'access_id', [
+        'access_id', 'model_name', 'field_name', 'invisible',
+    ]),
+    'chatter': ('access.management.chatter', 'access_id', ['access_id', 'model_name'] + list(CHATTER_FLAGS)),
+}
+
+
+# Rules loaded per chunk when exporting, their cache is dropped between chunks
+EXPORT_CHUNK_SIZE = 100
+
+# Sheets of a rules export: model, rule column and (field, header) columns
+EXPORT_SHEETS = {
+    'rules': ('access.management', 'id', [
+        ('name', 'Name'), ('active', 'Active'), ('apply_by_group', 'Apply by Group'),
+        ('read_only', 'Read Only'), ('user_ids', 'Users'), ('group_ids', 'Groups'),
+        ('company_id', 'Company'), ('access_rules_count', 'Rules Count'),
+    ]),
+    'menu_access': ('access.management.menu', 'access_id', [
+        ('access_id', 'Rule'), ('menu_id', 'Menu'), ('hidden', 'Hidden'),
+    ]),
+    'model_access': ('access.management.model', 'access_id', [
+        ('access_id', 'Rule'), ('model_name', 'Model'), ('perm_read', 'Read'),
+        ('perm_write', 'Write'), ('perm_create', 'Create'), ('perm_unlink', 'Delete'),
+    ]),
+    'field_access': ('access.management.field', 'access_id', [
+        ('access_id', 'Rule'), ('model_name', 'Model'), ('field_name', 'Field'),
+        ('readonly', 'Readonly'), ('invisible', 'Invisible'), ('required', 'Required'),
+    ]),
+    'field_conditional_access': ('access.management.field.conditional', 'access_id', [
+        ('access_id', 'Rule'), ('model_name', 'Model'), ('field_name', 'Field'),
+        ('condition', 'Condition'), ('readonly', 'Readonly'), ('invisible', 'Invisible'),
+        ('required', 'Required'),
+    ]),
+    'domain_access': ('access.management.domain', 'access_id', [
+        ('access_id', 'Rule'), ('model_name', 'Model'), ('name', 'Name'), ('domain', 'Domain'),
+    ]),
+    'button_tab_access': ('access.management.button.tab', 'access_id', [
+        ('access_id', 'Rule'), ('model_name', 'Model'), ('element_type', 'Element Type'),
+        ('element_name', 'Element Name'), ('invisible', 'Invisible'), ('readonly', 'Readonly'),
+    ]),
+    'search_panel_access': ('access.management.search.panel', 'access_id', [
+        ('access_id', 'Rule'), ('model_name', 'Model'), ('field_name', 'Field'),
+        ('invisible', 'Invisible'),
+    ]),
+    'chatter_access': ('access.management.chatter', 'access_id', [
+        ('access_id', 'Rule'), ('model_name', 'Model'),
+    ] + [(flag, flag.replace('_', ' ').title()) for flag in CHATTER_FLAGS]),
+}
+
+# Fields written in export cells for the records of a model, the natural
+# keys the importer resolves them with, display names for other models
+EXPORT_KEYS = {
+    'access.management': 'name',
+    'res.users': 'login',
+    'res.groups': 'name',
+    'res.company': 'name',
+    'ir.ui.menu': 'complete_name',
+    'ir.model': 'model',
+    'ir.model.fields': 'name',
+}
+
+
+# Rules of an import file created per batch, with one reference lookup per kind
+IMPORT_BATCH_SIZE = 500
+
+# Line types of an import file: line model, file keys of its plain columns
+# and the columns of its natural key within a rule
+IMPORT_LINE_TYPES = {
+    'menu_access': ('access.management.menu', {'hidden': 'hidden'}, ('menu_id',)),
+    'model_access': ('access.management.model', {
+        'read': 'perm_read', 'write': 'perm_write', 'create': 'perm_create', 'unlink': 'perm_unlink',
+    }, ('model_id',)),
+    'field_access': ('access.management.field', {
+        'readonly': 'readonly', 'invisible': 'invisible', 'required': 'required',
+    }, ('model_id', 'field_id')),
+    'field_conditional_access': ('access.management.field.conditional', {
+        'condition': 'condition', 'readonly': 'readonly', 'invisible': 'invisible',
+        'required': 'required',
+    }, ('model_id', 'field_id', 'condition')),
+    'domain_access': ('access.management.domain', {
+        'name': 'name', 'domain': 'domain',
+    }, ('model_id', 'name')),
+    'button_tab_access': ('access.management.button.tab', {
+        'element_type': 'element_type', 'element_name': 'element_name',
+        'invisible': 'invisible', 'readonly': 'readonly',
+    }, ('model_id', 'element_type', 'element_name')),
+    'search_panel_access': ('access.management.search.panel', {
+        'invisible': 'invisible',
+    }, ('model_id', 'field_id')),
+    'chatter_access': ('access.management.chatter', {
+        flag: flag for flag in CHATTER_FLAGS
+    }, ('model_id',)),
+}
+
 
 class AccessCache:
-    """Cache for access management rules"""
+    """Cache for access management rules
+
+    Statistics are counted as entries come and go, including the shallow
+    size of each value, so reading them is free. Entries are stored and
+    removed under a lock, as requests served by other threads of the
+    worker share the cache.
+    """
     
     def __init__(self, timeout=CACHE_TIMEOUT):
         self.timeout = timeout
+        self.lock = threading.RLock()
         self.cache = {}
         self.timestamps = {}
+        self.sizes = {}
+        self.memory = 0
+        self.newest = None
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.invalidations = 0
+    
+    def _remove(self, key):
+        """Remove an entry, returning whether it was cached"""
+        with self.lock:
+            if key not in self.cache:
+                return False
+            del self.cache[key]
+            del self.timestamps[key]
+            self.memory -= self.sizes.pop(key, 0)
+            return True
     
     def get(self, key):
         """Get value from cache if not expired"""
-        if key in self.cache:
-            if time.time() - self.timestamps[key] < self.timeout:
-                return self.cache[key]
-            else:
-                # Remove expired entry
-                del self.cache[key]
-                del self.timestamps[key]
-        return None
+        value = self.cache.get(key)
+        if value is not None and time.time() - self.timestamps.get(key, 0) >= self.timeout:
+            # Remove expired entry
+            if self._remove(key):
+                self.evictions += 1
+            value = None
+        
+        if value is None:
+            self.misses += 1
+        else:
+            self.hits += 1
+        stats = get_access_stats()
+        if stats:
+            stats.add_cache_lookup(key, value is not None)
+        return value
+    
+    def peek(self, key):
+        """Get a cached value without counting a lookup nor expiring it"""
+        return self.cache.get(key)
     
     def set(self, key, value):
         """Set value in cache with timestamp"""
-        self.cache[key] = value
-        self.timestamps[key] = time.time()
+        # Shallow size, walking the value would cost more than computing it
+        size = sys.getsizeof(value)
+        with self.lock:
+            self._remove(key)
+            self.cache[key] = value
+            self.timestamps[key] = self.newest = time.time()
+            self.sizes[key] = size
+            self.memory += size
+    
+    def delete(self, keys):
+        """Remove the given entries from cache"""
+        with self.lock:
+            for key in keys:
+                if self._remove(key):
+                    self.invalidations += 1
     
     def clear(self, pattern=None):
         """Clear cache entries matching pattern"""
-        if pattern:
-            keys_to_remove = [k for k in self.cache.keys() if pattern in k]
-            for key in keys_to_remove:
-                del self.cache[key]
-                del self.timestamps[key]
-        else:
-            self.cache.clear()
-            self.timestamps.clear()
+        with self.lock:
+            if pattern:
+                self.delete([key for key in list(self.cache) if pattern in key])
+            else:
+                self.invalidations += len(self.cache)
+                self.cache.clear()
+                self.timestamps.clear()
+                self.sizes.clear()
+                self.memory = 0
     
     def get_stats(self):
-        """Get cache statistics"""
+        """Get cache statistics
+
+        Entries are inserted in time order, so the first one is the oldest.
+        """
+        with self.lock:
+            oldest = next(iter(self.timestamps.values()), None)
+            newest = self.newest if oldest is not None else None
         return {
             'size': len(self.cache),
-            'memory': sum(len(str(v)) for v in self.cache.values()),
-            'oldest': min(self.timestamps.values()) if self.timestamps else None,
-            'newest': max(self.timestamps.values()) if self.timestamps else None,
+            'memory': self.memory,
+            'hits': self.hits,
+            'misses': self.misses,
+            'evictions': self.evictions,
+            'invalidations': self.invalidations,
+            'oldest': oldest,
+            'newest': newest,
         }
 
 
 # Global cache instance
 access_cache = AccessCache()
 
+# Rule ids of the compiled policy classes, by policy hash
+policy_registry = {}
+
 
 def cached_method(key_func=None, timeout=None):
     """Decorator for caching method results"""
@@ -72,7 +298,7 @@ def cached_method(key_func=None, timeout=None):
             if key_func:
                 cache_key = key_func(self, *args, **kwargs)
             else:
-                cache_key = f"{self._name}.{func.__name__}:{self.env.uid}:{args}:{kwargs}"
+                cache_key = f"{self._name}.{func.__name__}:{self.env.cr.dbname}:{self.env.uid}:{args}:{kwargs}"
             
             # Check cache
             cached_value = access_cache.get(cache_key)
@@ -122,24 +348,818 @@ def get_user_access_hash(user):
     return hashlib.md5(data_str.encode()).hexdigest()
 
 
+def get_policy_hash(rule_ids):
+    """Generate hash of a set of applicable rules (the user's policy class)"""
+    data_str = ','.join(str(rule_id) for rule_id in sorted(rule_ids))
+    return hashlib.md5(data_str.encode()).hexdigest()
+
+
+def policy_cache_key(dbname, policy_hash, section, *parts):
+    """Build the cache key of a compiled policy section or derived entry of a database"""
+    return ':'.join(['policy', dbname, policy_hash, section] + [str(part) for part in parts])
+
+
+def register_policy(dbname, policy_hash, rule_ids):
+    """Remember the rules of a compiled policy class of a database"""
+    policy_registry[dbname, policy_hash] = frozenset(rule_ids)
+
+
+def find_policies(dbname, rule_ids):
+    """Get the hashes of the compiled policy classes of a database containing one of the rules"""
+    rule_ids = set(rule_ids)
+    return {
+        policy_hash for (policy_dbname, policy_hash), policy_rule_ids in list(policy_registry.items())
+        if policy_dbname == dbname and not rule_ids.isdisjoint(policy_rule_ids)
+    }
+
+
+def clear_policy_cache(dbname, policy_hash=None, section=None):
+    """Clear compiled policies of a database, optionally for a single policy class or section"""
+    if policy_hash and section:
+        pattern = policy_cache_key(dbname, policy_hash, section)
+    elif policy_hash:
+        pattern = f"policy:{dbname}:{policy_hash}:"
+        policy_registry.pop((dbname, policy_hash), None)
+    else:
+        pattern = f"policy:{dbname}:"
+        for key in [key for key in list(policy_registry) if key[0] == dbname]:
+            policy_registry.pop(key, None)
+    access_cache.clear(pattern)
+    _logger.debug(f"Cleared policy cache with pattern: {pattern}")
+
+
+def clear_policy_sections(dbname, changes):
+    """Clear the given sections of the policies of a database containing the given rules
+
+    ``changes`` is an iterable of (rule_id, section) pairs.
+    """
+    sections_by_rule = {}
+    for rule_id, section in changes:
+        sections_by_rule.setdefault(rule_id, set()).add(section)
+    
+    for rule_id, sections in sections_by_rule.items():
+        for policy_hash in find_policies(dbname, [rule_id]):
+            for section in sections:
+                clear_policy_cache(dbname, policy_hash, section)
+
+
+def user_policy_cache_key(dbname, user_id):
+    """Build the cache key of the policy class assigned to a user of a database"""
+    return f"user:{dbname}:{user_id}:policy"
+
+
+def clear_user_policy_cache(dbname, user_ids=None):
+    """Clear policy class assignments of a database, optionally for some users only"""
+    if user_ids is None:
+        access_cache.clear(f"user:{dbname}:")
+    else:
+        access_cache.delete([user_policy_cache_key(dbname, user_id) for user_id in user_ids])
+    _logger.debug("Cleared user policy assignments")
+
+
+def rule_index_key(dbname):
+    """Build the cache key of the rule applicability index of a database"""
+    return f"rules:{dbname}:index"
+
+
+def clear_rule_index(dbname):
+    """Clear the cached rule applicability index of a database"""
+    access_cache.clear(rule_index_key(dbname))
+    _logger.debug("Cleared access rule index")
+
+
+def clear_database_caches(dbname):
+    """Clear every access cache entry of a database"""
+    clear_policy_cache(dbname)
+    clear_user_policy_cache(dbname)
+    clear_rule_index(dbname)
+
+
+# Clearing functions of the invalidations logged for a whole database, by kind
+DATABASE_INVALIDATIONS = {
+    func.__name__: func for func in (clear_policy_cache, clear_user_policy_cache, clear_rule_index)
+}
+
+
+def apply_invalidations(dbname, invalidations):
+    """Clear the access cache entries of a database for logged invalidations
+
+    ``invalidations`` are (kind, user_id, rule_id, section) rows: the policy
+    assignment of a user, a section of the policies containing a rule, or a
+    whole database cache named by its clearing function.
+    """
+    user_ids, changes = set(), set()
+    for kind, user_id, rule_id, section in invalidations:
+        if kind == 'user':
+            user_ids.add(user_id)
+        elif kind == 'section':
+            changes.add((rule_id, section))
+        elif kind in DATABASE_INVALIDATIONS:
+            DATABASE_INVALIDATIONS[kind](dbname)
+    clear_user_policy_cache(dbname, user_ids)
+    clear_policy_sections(dbname, changes)
+
+
+# Signaling state of this worker by database: last logged invalidation
+# seen, time of the last check, and ids of the invalidations it logged
+_policy_signaling = {}
+# Whether the current request or scheduled action still has to check
+_request_signaling = threading.local()
+
+
+def _get_signaling_state(dbname):
+    """Get the signaling state of this worker for a database"""
+    return _policy_signaling.setdefault(dbname, {'last_id': None, 'checked': 0.0, 'own': set()})
+
+
+def setup_policy_signaling(cr):
+    """Create the log of access cache invalidations"""
+    cr.execute(f"""
+        CREATE TABLE IF NOT EXISTS {POLICY_SIGNALING_TABLE} (
+            id bigserial PRIMARY KEY,
+            create_date timestamp NOT NULL DEFAULT (now() at time zone 'UTC'),
+            kind varchar NOT NULL,
+            user_id integer,
+            rule_id integer,
+            section varchar
+        )
+    """)
+    # Replaced by the log, which tells what changed
+    cr.execute("DROP SEQUENCE IF EXISTS access_management_policy_signaling")
+
+
+def signal_policy_change(registry, invalidations):
+    """Log committed access cache invalidations for the other workers
+
+    Run once the change is committed, from a cursor of its own. The log
+    is locked until commit so its ids are committed in order, and the
+    invalidations are skipped by this worker, which applied them already.
+    """
+    with registry.cursor() as cr:
+        cr.execute(f"LOCK TABLE {POLICY_SIGNALING_TABLE} IN EXCLUSIVE MODE")
+        cr.execute(
+            f"DELETE FROM {POLICY_SIGNALING_TABLE} "
+            f"WHERE create_date < (now() at time zone 'UTC') - %s * interval '1 second'",
+            [POLICY_SIGNALING_RETENTION],
+        )
+        rows = sorted(invalidations, key=str)
+        cr.execute(
+            f"INSERT INTO {POLICY_SIGNALING_TABLE} (kind, user_id, rule_id, section) VALUES "
+            + ', '.join(['(%s, %s, %s, %s)'] * len(rows)) + " RETURNING id",
+            [value for row in rows for value in row],
+        )
+        ids = [row[0] for row in cr.fetchall()]
+    _get_signaling_state(registry.db_name)['own'].update(ids)
+
+
+def check_policy_signaling(cr):
+    """Apply the access cache invalidations logged by other workers since the last check
+
+    A worker which did not check for longer than the log keeps its rows
+    may have missed some, it drops the access caches of the database.
+    """
+    state = _get_signaling_state(cr.dbname)
+    now = time.time()
+    if state['last_id'] is None or now - state['checked'] > POLICY_SIGNALING_RETENTION / 2:
+        cr.execute(f"SELECT COALESCE(MAX(id), 0) FROM {POLICY_SIGNALING_TABLE}")
+        state['last_id'] = cr.fetchone()[0]
+        clear_database_caches(cr.dbname)
+        _logger.debug("Cleared access caches of %s, signaling from %s", cr.dbname, state['last_id'])
+    else:
+        cr.execute(f"""
+            SELECT id, kind, user_id, rule_id, section FROM {POLICY_SIGNALING_TABLE}
+            WHERE id > %s ORDER BY id
+        """, [state['last_id']])
+        rows = cr.fetchall()
+        if rows:
+            own = state['own']
+            apply_invalidations(cr.dbname, [row[1:] for row in rows if row[0] not in own])
+            state['last_id'] = rows[-1][0]
+            state['own'] = {own_id for own_id in own if own_id > state['last_id']}
+            _logger.debug("Applied %s access cache invalidations of %s", len(rows), cr.dbname)
+    state['checked'] = now
+
+
+def request_policy_signaling():
+    """Make the current request or scheduled action check the signaling before its first policy lookup"""
+    _request_signaling.pending = True
+
+
+def ensure_policy_signaling(cr):
+    """Check the signaling if the current request or scheduled action did not yet
+
+    Requests which never look a policy up, like the metrics endpoint,
+    issue no query for it.
+    """
+    if getattr(_request_signaling, 'pending', False):
+        _request_signaling.pending = False
+        check_policy_signaling(cr)
+
+
+def match_rules(index, user_id, share, company_id, group_ids, check_company=True):
+    """Get the ids of the indexed rules applying to a user, in rule order"""
+    # Check specific users and user types
+    rule_ids = set(index['by_user'].get(user_id, ()))
+    rule_ids |= index['portal'] if share else index['internal']
+    
+    # Check groups, implied groups included
+    by_group = index['by_group']
+    for group_id in group_ids:
+        rule_ids |= by_group.get(group_id, frozenset())
+    
+    return [
+        rule_id for rule_id, rule_company_id in index['rules']
+        if rule_id in rule_ids
+        and not (check_company and rule_company_id and rule_company_id != company_id)
+    ]
+
+
+def project_policy_line(section, rule_id, values):
+    """Project the values of an unsaved line on the stored columns of its section"""
+    _model_name, key_column, columns = POLICY_SECTIONS[section]
+    defaults = {'perm_read': True, 'hidden': True}
+    return tuple(
+        rule_id if column == key_column else values.get(column, defaults.get(column, False))
+        for column in columns
+    )
+
+
+def _plain_policy_value(value):
+    """Convert a compiled policy value to plain JSON-serializable data"""
+    if isinstance(value, (set, frozenset)):
+        return sorted(value)
+    if isinstance(value, (list, tuple)):
+        return [_plain_policy_value(item) for item in value]
+    if isinstance(value, dict):
+        return {key: _plain_policy_value(item) for key, item in value.items()}
+    return value
+
+
+def diff_policy_section(before, after):
+    """Diff two compiled versions of a policy section, or None if they are equal"""
+    if before == after:
+        return None
+    if isinstance(before, frozenset):
+        return {
+            'added': sorted(after - before),
+            'removed': sorted(before - after),
+        }
+    return {
+        key: {
+            'before': _plain_policy_value(before.get(key)),
+            'after': _plain_policy_value(after.get(key)),
+        }
+        for key in set(before) | set(after)
+        if before.get(key) != after.get(key)
+    }
+
+
+def compile_policy_lines(section, lines):
+    """Compile the projected lines of one policy section into merged permissions"""
+    if section == 'rules':
+        return {
+            'disable_developer_mode': any(line[1] for line in lines),
+            'global_access': tuple((line[0], line[2]) for line in lines if line[2]),
+        }
+    if section == 'menus':
+        return frozenset(menu_id for _access_id, menu_id, hidden in lines if hidden)
+
+    compiled = {}
+    if section == 'models':
+        for _access_id, model_name, *perms in lines:
+            if model_name not in compiled:
+                compiled[model_name] = dict.fromkeys(MODEL_OPERATIONS, True)
+            # Most restrictive permission wins
+            for operation, allowed in zip(MODEL_OPERATIONS, perms):
+                compiled[model_name][operation] &= bool(allowed)
+
+    elif section == 'fields':
+        for _access_id, model_name, field_name, *flags in lines:
+            model_fields = compiled.setdefault(model_name, {})
+            if field_name not in model_fields:
+                model_fields[field_name] = dict.fromkeys(FIELD_ACCESS_FLAGS, False)
+            # Most restrictive access wins
+            for flag, value in zip(FIELD_ACCESS_FLAGS, flags):
+                model_fields[field_name][flag] |= bool(value)
+
+    elif section in ('conditional', 'buttons'):
+        for _access_id, model_name, *line in lines:
+            compiled.setdefault(model_name, []).append(tuple(line))
+
+    elif section == 'domains':
+        domains = {}
+        for access_id, model_name, domain in lines:
+            try:
+                domain = safe_eval(domain)
+            except Exception as e:
+                _logger.warning(f"Ignoring invalid domain of access rule {access_id}: {e}")
+                continue
+            if domain:
+                domains.setdefault(model_name, []).append(domain)
+        compiled = {
+            model_name: expression.AND(model_domains)
+            for model_name, model_domains in domains.items()
+        }
+
+    elif section == 'search_panel':
+        for _access_id, model_name, field_name, invisible in lines:
+            if invisible:
+                compiled.setdefault(model_name, set()).add(field_name)
+        compiled = {model_name: frozenset(names) for model_name, names in compiled.items()}
+
+    elif section == 'chatter':
+        for _access_id, model_name, *flags in lines:
+            if model_name not in compiled:
+                compiled[model_name] = dict.fromkeys(CHATTER_FLAGS, False)
+            for flag, value in zip(CHATTER_FLAGS, flags):
+                compiled[model_name][flag] |= bool(value)
+
+    else:
+        raise ValueError(f"Unknown access policy section: {section}")
+
+    return compiled
+
+
+# Comment line declaring that global access code depends on the user only
+GLOBAL_ACCESS_USER_SCOPED = '# access-scope: user'
+
+
+@functools.lru_cache(maxsize=256)
+def compile_global_access(code):
+    """Compile the global access code of a rule into a sandboxed function
+
+    The code is the body of a function of ``user``, ``model`` and
+    ``operation`` which may return False to deny access. It is checked
+    against the opcodes allowed by safe_eval, and compiled once per
+    version of the code. Returns the function and whether the code
+    declares itself user-scoped.
+    """
+    source = 'def global_access(user, model, operation):\n%s\n    pass\n' % textwrap.indent(code, '    ')
+    code_obj = test_expr(source, _SAFE_OPCODES, mode='exec', filename='<global_access>')
+    namespace = {'__builtins__': dict(_BUILTINS)}
+    exec(code_obj, namespace)  # only defines the function
+    user_scoped = any(line.strip() == GLOBAL_ACCESS_USER_SCOPED for line in code.splitlines())
+    return namespace['global_access'], user_scoped
+
+
+class AccessStats:
+    """Access management overhead counters of one request
+
+    Time and queries are accounted per hook, and in total for the
+    outermost hooks only, so nested hooks are not counted twice.
+    """
+
+    def __init__(self):
+        self.duration = 0.0
+        self.queries = 0
+        self.rules = 0
+        self.depth = 0
+        self.hooks = {}
+        self.caches = {}
+
+    def add_hook_call(self, hook, duration, queries):
+        """Account a call of an access hook"""
+        counters = self.hooks.setdefault(hook, {'calls': 0, 'duration': 0.0, 'queries': 0})
+        counters['calls'] += 1
+        counters['duration'] += duration
+        counters['queries'] += queries
+        if not self.depth:
+            self.duration += duration
+            self.queries += queries
+
+    def add_cache_lookup(self, key, hit):
+        """Account a lookup in the access cache, by cache namespace"""
+        counters = self.caches.setdefault(key.split(':', 1)[0], {'hits': 0, 'misses': 0})
+        counters['hits' if hit else 'misses'] += 1
+
+    def get_server_timing(self):
+        """Get the counters as the metrics of a Server-Timing header"""
+        hits = sum(counters['hits'] for counters in self.caches.values())
+        misses = sum(counters['misses'] for counters in self.caches.values())
+        return ', '.join([
+            'access;dur=%.3f;desc="Access management"' % (self.duration * 1000),
+            'access-sql;desc="%d queries"' % self.queries,
+            'access-cache;desc="%d hits, %d misses"' % (hits, misses),
+            'access-rules;desc="%d rules"' % self.rules,
+        ])
+
+    def to_dict(self):
+        """Get the counters as a JSON serializable dict"""
+        return {
+            'duration_ms': round(self.duration * 1000, 3),
+            'queries': self.queries,
+            'rules': self.rules,
+            'hooks': {
+                hook: dict(counters, duration=round(counters['duration'] * 1000, 3))
+                for hook, counters in self.hooks.items()
+            },
+            'caches': self.caches,
+        }
+
+
+# Access overhead counters of the request served by the current thread
+_request_stats = threading.local()
+
+
+def start_access_stats():
+    """Start counting the access overhead of the current request"""
+    _request_stats.stats = AccessStats()
+    return _request_stats.stats
+
+
+def get_access_stats():
+    """Get the access overhead counters of the current request, if counting"""
+    return getattr(_request_stats, 'stats', None)
+
+
+def stop_access_stats():
+    """Stop counting the access overhead of the current request, returning its counters"""
+    stats = get_access_stats()
+    _request_stats.stats = None
+    return stats
+
+
+def add_rules_evaluated(count):
+    """Account rules evaluated to the current request"""
+    stats = get_access_stats()
+    if stats:
+        stats.rules += count
+
+
+class LatencyHistogram:
+    """Cumulative latency histogram of an access hook, in seconds"""
+
+    BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5)
+
+    def __init__(self):
+        self.counts = [0] * (len(self.BUCKETS) + 1)
+        self.total = 0.0
+
+    def observe(self, duration):
+        """Account one call of the given duration"""
+        self.counts[bisect.bisect_left(self.BUCKETS, duration)] += 1
+        self.total += duration
+
+    def get_buckets(self):
+        """Get the cumulative counts by upper bound, the last one being +Inf"""
+        bounds = [str(bound) for bound in self.BUCKETS] + ['+Inf']
+        return list(zip(bounds, itertools.accumulate(self.counts)))
+
+
+# Latency histograms of the access hooks of this worker, by hook
+hook_latency = {}
+
+
+# Slow access checks waiting to be inserted, oldest dropped first when full
+slow_access_buffer = collections.deque(maxlen=SLOW_ACCESS_BUFFER_SIZE)
+_slow_access_flush = {'last': time.monotonic()}
+
+
+def record_slow_access(env, hook, model_name, duration, queries):
+    """Buffer a slow access check, with the policy class of its user if known"""
+    policy = access_cache.peek(user_policy_cache_key(env.cr.dbname, env.uid))
+    slow_access_buffer.append({
+        'date': datetime.datetime.utcnow().replace(microsecond=0),
+        'hook': hook,
+        'model_name': model_name,
+        'user_id': env.uid,
+        'policy_hash': policy[0] if policy else False,
+        'rule_count': len(policy[1]) if policy else 0,
+        'duration': round(duration * 1000, 3),
+        'query_count': queries,
+    })
+
+
+def is_slow_access_flush_due():
+    """Check whether enough slow access checks are buffered, or for long enough"""
+    if len(slow_access_buffer) >= SLOW_ACCESS_FLUSH_SIZE:
+        return True
+    return bool(slow_access_buffer) and (
+        time.monotonic() - _slow_access_flush['last'] >= SLOW_ACCESS_FLUSH_INTERVAL
+    )
+
+
+def drain_slow_access_buffer():
+    """Take every buffered slow access check out of the buffer"""
+    _slow_access_flush['last'] = time.monotonic()
+    entries = []
+    while True:
+        try:
+            entries.append(slow_access_buffer.popleft())
+        except IndexError:
+            return entries
+
+
+@contextlib.contextmanager
+def access_profiler(env, hook, model_name=None):
+    """Account the time and queries of some access code to the current request
+
+    Checks slower than SLOW_ACCESS_THRESHOLD are buffered for the slow
+    access log.
+    """
+    stats = get_access_stats()
+    queries = env.cr.sql_log_count
+    start = time.perf_counter()
+    if stats:
+        stats.depth += 1
+    try:
+        yield
+    finally:
+        duration = time.perf_counter() - start
+        histogram = hook_latency.get(hook) or hook_latency.setdefault(hook, LatencyHistogram())
+        histogram.observe(duration)
+        queries = env.cr.sql_log_count - queries
+        if stats:
+            stats.depth -= 1
+            stats.add_hook_call(hook, duration, queries)
+        if duration > SLOW_ACCESS_THRESHOLD:
+            record_slow_access(env, hook, model_name, duration, queries)
+
+
 def profile_access_check(func):
     """Decorator to profile access check performance"""
     @functools.wraps(func)
-    def wrapper(*args, **kwargs):
-        start_time = time.time()
-        result = func(*args, **kwargs)
-        end_time = time.time()
-        
-        duration = end_time - start_time
-        if duration > 0.1:  # Log slow access checks
-            _logger.warning(
-                f"Slow access check: {func.__name__} took {duration:.3f}s"
-            )
-        
-        return result
+    def wrapper(self, *args, **kwargs):
+        with access_profiler(self.env, func.__name__):
+            return func(self, *args, **kwargs)
     return wrapper
 
 
+class JsonLinesFile:
+    """Thread-safe append-only JSON lines file, opened on first write"""
+
+    def __init__(self, path):
+        self.path = path
+        self.lock = threading.Lock()
+        self.file = None
+
+    def write(self, record):
+        """Append a record as one compact JSON line"""
+        line = json.dumps(record, separators=(',', ':'), default=str) + '\n'
+        with self.lock:
+            if self.file is None:
+                self.file = open(self.path, 'a', encoding='utf-8')
+            self.file.write(line)
+            self.file.flush()
+
+
+class AccessRecorder(JsonLinesFile):
+    """Append sampled access hook calls to a JSON lines file"""
+
+    def __init__(self, path, rate):
+        super().__init__(path)
+        self.rate = rate
+
+    def sample(self):
+        """Decide whether to record a call"""
+        return random.random() < self.rate
+
+
+# Recorder of this worker, if recording is enabled
+access_recorder = AccessRecorder(ACCESS_RECORD_FILE, ACCESS_RECORD_RATE) if ACCESS_RECORD_FILE else None
+
+
+def record_access_call(env, hook, model_name, user=None, **params):
+    """Record a sampled access hook call along with the decision of the engine
+
+    ``user`` is the user whose access is checked, the user of ``env`` by
+    default. ``params`` are the inputs of the call given to
+    _get_access_decision: operation, fields, attributes or domain.
+    """
+    if not access_recorder or not access_recorder.sample():
+        return
+    try:
+        user = user or env.user
+        access_mgmt = env['access.management']
+        policy = access_mgmt._get_user_policy(user)
+        access_recorder.write(dict(
+            params,
+            time=round(time.time(), 3),
+            hook=hook,
+            model=model_name,
+            user=user.id,
+            policy=policy[0],
+            rules=len(policy[1]),
+            decision=access_mgmt._get_access_decision(hook, model_name, user, **params),
+        ))
+    except Exception:
+        _logger.warning("Failed to record access call %s on %s", hook, model_name, exc_info=True)
+
+
+def iter_access_records(fileobj):
+    """Read the records of a file written by the access recorder"""
+    for line in fileobj:
+        if line.strip():
+            yield json.loads(line)
+
+
+def _otel_value(value):
+    """Encode an attribute value as an OTLP JSON AnyValue"""
+    if isinstance(value, bool):
+        return {'boolValue': value}
+    if isinstance(value, int):
+        return {'intValue': str(value)}
+    if isinstance(value, float):
+        return {'doubleValue': value}
+    return {'stringValue': str(value)}
+
+
+class AccessTrace:
+    """Spans of the access code traced during one request"""
+
+    def __init__(self, trace_id=None, parent_id=None):
+        self.trace_id = trace_id or os.urandom(16).hex()
+        self.parent_id = parent_id
+        self.stack = []
+        self.spans = []
+
+    def to_otlp(self):
+        """Get the spans as an OTLP JSON export request"""
+        return {'resourceSpans': [{
+            'resource': {'attributes': [
+                {'key': 'service.name', 'value': _otel_value('odoo')},
+                {'key': 'process.pid', 'value': _otel_value(os.getpid())},
+            ]},
+            'scopeSpans': [{
+                'scope': {'name': 'access_management'},
+                'spans': [span.to_otlp() for span in self.spans],
+            }],
+        }]}
+
+
+class AccessSpan:
+    """A span of access code, following the OpenTelemetry data model
+
+    The span counts the access cache lookups of the request made while
+    it is open, to tell whether it was served from cache.
+    """
+
+    def __init__(self, trace, name, attributes):
+        self.trace = trace
+        self.name = name
+        self.attributes = attributes
+        self.span_id = os.urandom(8).hex()
+        self.parent_id = None
+        self.start = self.end = 0
+        self.lookups = None
+        self.error = None
+
+    def set_attribute(self, key, value):
+        """Set an attribute of the span"""
+        self.attributes[key] = value
+
+    def set_policy(self, policy):
+        """Set the policy class the span applies, and its number of rules"""
+        self.attributes['access.policy'] = policy[0]
+        self.attributes['access.rule_count'] = len(policy[1])
+
+    @staticmethod
+    def _get_cache_lookups():
+        """Get the hits and misses of the access cache during the current request"""
+        stats = get_access_stats()
+        if not stats:
+            return None
+        return (
+            sum(counters['hits'] for counters in stats.caches.values()),
+            sum(counters['misses'] for counters in stats.caches.values()),
+        )
+
+    def __enter__(self):
+        stack = self.trace.stack
+        self.parent_id = stack[-1].span_id if stack else self.trace.parent_id
+        stack.append(self)
+        self.lookups = self._get_cache_lookups()
+        self.start = time.time_ns()
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.end = time.time_ns()
+        lookups = self._get_cache_lookups()
+        if self.lookups and lookups and lookups != self.lookups:
+            self.attributes['access.cache_hit'] = lookups[1] == self.lookups[1]
+        if exc_type:
+            self.error = f"{exc_type.__name__}: {exc_value}"
+        self.trace.stack.pop()
+        self.trace.spans.append(self)
+        return False
+
+    def to_otlp(self):
+        """Get the span as an OTLP JSON span"""
+        span = {
+            'traceId': self.trace.trace_id,
+            'spanId': self.span_id,
+            'name': self.name,
+            'kind': 1,  # SPAN_KIND_INTERNAL
+            'startTimeUnixNano': str(self.start),
+            'endTimeUnixNano': str(self.end),
+            'attributes': [
+                {'key': key, 'value': _otel_value(value)}
+                for key, value in self.attributes.items() if value is not None
+            ],
+            'status': {'code': 2, 'message': self.error} if self.error else {'code': 0},
+        }
+        if self.parent_id:
+            span['parentSpanId'] = self.parent_id
+        return span
+
+
+class _NoopSpan:
+    """Span of the requests not traced, doing nothing"""
+
+    def __enter__(self):
+        return None
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        return False
+
+
+_noop_span = _NoopSpan()
+
+# Exporter of the traced spans of this worker, if tracing is enabled
+access_trace_exporter = JsonLinesFile(ACCESS_TRACE_FILE) if ACCESS_TRACE_FILE else None
+
+# Trace of the request served by the current thread, if sampled
+_request_trace = threading.local()
+
+
+def start_access_trace(traceparent=None):
+    """Start tracing the current request if sampled, joining a W3C traceparent
+
+    Requests with a traceparent follow its sampling decision, others are
+    sampled at ACCESS_TRACE_RATE.
+    """
+    _request_trace.trace = None
+    if not access_trace_exporter:
+        return None
+    parts = traceparent.split('-') if traceparent else []
+    if len(parts) == 4 and len(parts[1]) == 32 and len(parts[2]) == 16 and parts[3] in ('00', '01'):
+        if parts[3] == '00':
+            return None
+        _request_trace.trace = AccessTrace(parts[1], parts[2])
+    elif random.random() < ACCESS_TRACE_RATE:
+        _request_trace.trace = AccessTrace()
+    return _request_trace.trace
+
+
+def stop_access_trace():
+    """Stop tracing the current request, exporting its spans"""
+    trace = getattr(_request_trace, 'trace', None)
+    _request_trace.trace = None
+    if trace and trace.spans:
+        try:
+            access_trace_exporter.write(trace.to_otlp())
+        except Exception:
+            _logger.warning("Failed to export the access trace %s", trace.trace_id, exc_info=True)
+    return trace
+
+
+def access_span(name, model_name=None):
+    """Get a span around some access code, doing nothing when not traced"""
+    trace = getattr(_request_trace, 'trace', None)
+    if trace is None:
+        return _noop_span
+    return AccessSpan(trace, name, {'odoo.model': model_name})
+
+
+# Access cache metrics: (name, type, help, get_stats() key)
+CACHE_METRICS = [
+    ('access_management_cache_hits_total', 'counter', 'Access cache lookups found in cache', 'hits'),
+    ('access_management_cache_misses_total', 'counter', 'Access cache lookups not found in cache', 'misses'),
+    ('access_management_cache_evictions_total', 'counter', 'Expired access cache entries removed', 'evictions'),
+    ('access_management_cache_invalidations_total', 'counter', 'Access cache entries invalidated', 'invalidations'),
+    ('access_management_cache_entries', 'gauge', 'Access cache entries', 'size'),
+    ('access_management_cache_bytes', 'gauge', 'Shallow size of the access cache values', 'memory'),
+]
+
+
+def format_prometheus_metrics():
+    """Render the access cache and hook latency metrics of this worker as Prometheus text"""
+    worker = os.getpid()
+    stats = access_cache.get_stats()
+    lines = []
+    for name, metric_type, description, key in CACHE_METRICS:
+        lines += [
+            f'# HELP {name} {description}',
+            f'# TYPE {name} {metric_type}',
+            f'{name}{{worker="{worker}"}} {stats[key]}',
+        ]
+
+    name = 'access_management_hook_duration_seconds'
+    lines += [
+        f'# HELP {name} Duration of the access management code of the hooks',
+        f'# TYPE {name} histogram',
+    ]
+    for hook, histogram in sorted(hook_latency.items()):
+        labels = f'worker="{worker}",hook="{hook}"'
+        buckets = histogram.get_buckets()
+        lines += [f'{name}_bucket{{{labels},le="{bound}"}} {count}' for bound, count in buckets]
+        lines += [
+            f'{name}_sum{{{labels}}} {histogram.total}',
+            f'{name}_count{{{labels}}} {buckets[-1][1]}',
+        ]
+    return '\n'.join(lines) + '\n'
+
+
 class AccessContext:
     """Context manager for access checking"""
     
@@ -224,8 +1244,86 @@ def merge_access_rules(rules):
     return merged
 
 
+def _export_value(record, field_name):
+    """Format the value of a field of an exported record for a cell"""
+    field = record._fields[field_name]
+    value = record[field_name]
+    if field.type in ('many2one', 'many2many', 'one2many'):
+        return ', '.join(value.mapped(EXPORT_KEYS.get(field.comodel_name, 'display_name')))
+    return value if value is not False or field.type == 'boolean' else ''
+
+
+def iter_export_rows(env, sheet, rule_ids, chunk_size=EXPORT_CHUNK_SIZE):
+    """Yield the header then the rows of one export sheet
+
+    Rules are processed by chunks: the records of a chunk are prefetched
+    together, and the cache is dropped before the next one so memory
+    stays flat whatever the number of rules and lines.
+    """
+    model_name, key_column, columns = EXPORT_SHEETS[sheet]
+    yield [header for _field_name, header in columns]
+    
+    model = env[model_name].with_context(active_test=False)
+    for chunk in tools.split_every(chunk_size, rule_ids, list):
+        if key_column == 'id':
+            records = model.browse(chunk)
+        else:
+            records = model.search([(key_column, 'in', chunk)], order='access_id, id')
+        for record in records:
+            yield [_export_value(record, field_name) for field_name, _header in columns]
+        env.invalidate_all()
+
+
+def stream_csv_export(env, rule_ids, sheet='rules'):
+    """Stream one export sheet as CSV, row by row"""
+    import csv
+    import io
+    
+    output = io.StringIO()
+    writer = csv.writer(output)
+    for row in iter_export_rows(env, sheet, rule_ids):
+        writer.writerow(row)
+        yield output.getvalue().encode()
+        output.seek(0)
+        output.truncate(0)
+
+
+def write_xlsx_export(env, rule_ids, fileobj):
+    """Write the rules and every line type to an XLSX file, one sheet each
+
+    The workbook is written in constant memory mode: rows are flushed to
+    disk as soon as the next row starts.
+    """
+    import xlsxwriter
+    
+    workbook = xlsxwriter.Workbook(fileobj, {'constant_memory': True})
+    bold = workbook.add_format({'bold': True})
+    for sheet in EXPORT_SHEETS:
+        worksheet = workbook.add_worksheet(sheet.replace('_', ' ').title())
+        for row_index, row in enumerate(iter_export_rows(env, sheet, rule_ids)):
+            worksheet.write_row(row_index, 0, row, bold if row_index == 0 else None)
+    workbook.close()
+
+
+def _export_line(line, columns):
+    """Get a line of an exported rule with the keys the importer reads"""
+    line_data = {}
+    if 'menu_id' in line._fields:
+        line_data['menu'] = line.menu_id.complete_name
+    if 'model_id' in line._fields:
+        line_data['model'] = line.model_id.model
+    if 'field_id' in line._fields:
+        line_data['field'] = line.field_id.name
+    line_data.update({key: line[column] for key, column in columns.items()})
+    return line_data
+
+
 def export_access_rules(rules, format='json'):
-    """Export access rules to specified format"""
+    """Export access rules to specified format
+
+    References are written as the natural keys the importer resolves,
+    so an exported file imports back as exported.
+    """
     data = []
     
     for rule in rules:
@@ -234,49 +1332,19 @@ def export_access_rules(rules, format='json'):
             'active': rule.active,
             'apply_by_group': rule.apply_by_group,
             'read_only': rule.read_only,
+            'default_internal_user': rule.default_internal_user,
+            'default_portal_user': rule.default_portal_user,
+            'disable_developer_mode': rule.disable_developer_mode,
             'users': [u.login for u in rule.user_ids],
             'groups': [g.name for g in rule.group_ids],
             'company': rule.company_id.name if rule.company_id else None,
-            'menu_access': [],
-            'model_access': [],
-            'field_access': [],
-            'domain_access': [],
         }
         
-        # Export menu access
-        for menu in rule.menu_access_ids:
-            rule_data['menu_access'].append({
-                'menu': menu.menu_id.complete_name,
-                'hidden': menu.hidden,
-            })
-        
-        # Export model access
-        for model in rule.model_access_ids:
-            rule_data['model_access'].append({
-                'model': model.model_id.model,
-                'read': model.perm_read,
-                'write': model.perm_write,
-                'create': model.perm_create,
-                'unlink': model.perm_unlink,
-            })
-        
-        # Export field access
-        for field in rule.field_access_ids:
-            rule_data['field_access'].append({
-                'model': field.model_id.model,
-                'field': field.field_id.name,
-                'readonly': field.readonly,
-                'invisible': field.invisible,
-                'required': field.required,
-            })
-        
-        # Export domain access
-        for domain in rule.domain_access_ids:
-            rule_data['domain_access'].append({
-                'model': domain.model_id.model,
-                'name': domain.name,
-                'domain': domain.domain,
-            })
+        # Export every line type, lines field named after it
+        for line_type, (_line_model, columns, _key) in IMPORT_LINE_TYPES.items():
+            rule_data[line_type] = [
+                _export_line(line, columns) for line in rule[f'{line_type}_ids']
+            ]
         
         data.append(rule_data)
     
@@ -312,68 +1380,97 @@ def export_access_rules(rules, format='json'):
     return data
 
 
-def import_access_rules(data, format='json'):
-    """Import access rules from data"""
+def iter_import_records(data, format='json'):
+    """Yield the rules of an import file as (row, values) pairs
+
+    ``format`` is 'json' (a list of rules, as exported), 'jsonl' (one rule
+    per line) or 'csv' (one rule per row, headers as exported). Lines that
+    cannot be parsed are yielded with the parsing error as values.
+    """
+    import csv
+    import io
+    
+    if isinstance(data, bytes):
+        data = data.decode('utf-8-sig')
+    
     if format == 'json':
         if isinstance(data, str):
-            data = json.loads(data)
+            yield from iter_json_array(data)
+        else:
+            yield from enumerate(data, start=1)
+    elif format == 'jsonl':
+        for row, line in enumerate(io.StringIO(data), start=1):
+            if not line.strip():
+                continue
+            try:
+                yield row, json.loads(line)
+            except ValueError as e:
+                yield row, e
     elif format == 'csv':
-        import csv
-        import io
-        
-        reader = csv.DictReader(io.StringIO(data))
-        data = list(reader)
-    
-    created_rules = []
-    
-    for rule_data in data:
-        # Create main rule
-        rule_vals = {
-            'name': rule_data.get('name'),
-            'active': rule_data.get('active', True),
-            'apply_by_group': rule_data.get('apply_by_group', False),
-            'read_only': rule_data.get('read_only', False),
-        }
-        
-        # Add users
-        if 'users' in rule_data:
-            user_logins = rule_data['users']
-            if isinstance(user_logins, str):
-                user_logins = [u.strip() for u in user_logins.split(',')]
-            
-            users = request.env['res.users'].search([('login', 'in', user_logins)])
-            rule_vals['user_ids'] = [(6, 0, users.ids)]
-        
-        # Add groups
-        if 'groups' in rule_data:
-            group_names = rule_data['groups']
-            if isinstance(group_names, str):
-                group_names = [g.strip() for g in group_names.split(',')]
-            
-            groups = request.env['res.groups'].search([('name', 'in', group_names)])
-            rule_vals['group_ids'] = [(6, 0, groups.ids)]
-        
-        # Create rule
-        rule = request.env['access.management'].create(rule_vals)
-        created_rules.append(rule)
-        
-        # Import detailed access data if format is JSON
-        if format == 'json':
-            # Import menu access
-            for menu_data in rule_data.get('menu_access', []):
-                menu = request.env['ir.ui.menu'].search([
-                    ('complete_name', '=', menu_data['menu'])
-                ], limit=1)
-                if menu:
-                    request.env['access.management.menu'].create({
-                        'access_id': rule.id,
-                        'menu_id': menu.id,
-                        'hidden': menu_data.get('hidden', True),
-                    })
-            
-            # Import other access types similarly...
-    
-    return created_rules
+        # Data rows start after the header row
+        for row, record in enumerate(csv.DictReader(io.StringIO(data)), start=2):
+            yield row, {
+                key.strip().lower().replace(' ', '_'): value
+                for key, value in record.items() if key
+            }
+    else:
+        raise ValueError(f"Unknown import format: {format}")
+
+
+def iter_json_array(text):
+    """Yield the items of a JSON array as (row, item) pairs, decoding one item at a time
+
+    An item that cannot be decoded is yielded with the decoding error,
+    and ends the array.
+    """
+    decoder = json.JSONDecoder()
+    whitespace = re.compile(r'\s*')
+    index = whitespace.match(text).end()
+    if text[index:index + 1] != '[':
+        yield 1, ValueError("Expected a JSON array of rules")
+        return
+    index = whitespace.match(text, index + 1).end()
+    if text[index:index + 1] == ']':
+        return
+    for row in itertools.count(1):
+        try:
+            item, index = decoder.raw_decode(text, index)
+        except ValueError as e:
+            yield row, e
+            return
+        yield row, item
+        index = whitespace.match(text, index).end()
+        separator = text[index:index + 1]
+        if separator == ']':
+            return
+        if separator != ',':
+            yield row + 1, ValueError(f"Expected ',' or ']' at character {index}")
+            return
+        index = whitespace.match(text, index + 1).end()
+
+
+def import_value_list(value):
+    """Get the items of a list value of an import file, also given as comma separated text"""
+    if not value:
+        return []
+    if isinstance(value, str):
+        return [item.strip() for item in value.split(',') if item.strip()]
+    return list(value)
+
+
+def import_bool(value):
+    """Get a boolean value of an import file, also given as text"""
+    if isinstance(value, str):
+        return value.strip().lower() in ('1', 'true', 'yes', 'y')
+    return bool(value)
+
+
+def import_access_rules(env, data, format='json'):
+    """Import access rules from data"""
+    result = env['access.management']._import_rules(iter_import_records(data, format))
+    for row, message in result['errors']:
+        _logger.warning(f"Access rule import, row {row}: {message}")
+    return env['access.management'].browse(result['rules'])
 
 
 def validate_access_rule(rule):
@@ -1,5 +1,5 @@
 # -*- coding: utf-8 -*-
-from odoo import models, fields, api, _
+from odoo import models, fields, api, tools, _
 from odoo.exceptions import UserError
 import json
 from datetime import datetime
@@ -20,40 +20,72 @@ class AccessManagementReport(models.Model):
     menu_restrictions = fields.Integer(string='Menu Restrictions')
     model_restrictions = fields.Integer(string='Model Restrictions')
     field_restrictions = fields.Integer(string='Field Restrictions')
+    domain_restrictions = fields.Integer(string='Domain Restrictions')
+    button_restrictions = fields.Integer(string='Button/Tab Restrictions')
+    search_panel_restrictions = fields.Integer(string='Search Panel Restrictions')
+    chatter_restrictions = fields.Integer(string='Chatter Restrictions')
     total_restrictions = fields.Integer(string='Total Restrictions')
     company_id = fields.Many2one('res.company', string='Company')
     created_by = fields.Many2one('res.users', string='Created By')
     created_date = fields.Date(string='Created Date')
     
+    # Line tables counted per rule, with the column of their count
+    _LINE_COUNTS = [
+        ('access_management_menu', 'menu_restrictions'),
+        ('access_management_model', 'model_restrictions'),
+        ('access_management_field', 'field_restrictions'),
+        ('access_management_domain', 'domain_restrictions'),
+        ('access_management_button_tab', 'button_restrictions'),
+        ('access_management_search_panel', 'search_panel_restrictions'),
+        ('access_management_chatter', 'chatter_restrictions'),
+    ]
+    # Line counts adding up to the total restrictions of a rule
+    _TOTAL_COUNTS = [
+        'menu_restrictions', 'model_restrictions', 'field_restrictions',
+        'domain_restrictions', 'button_restrictions',
+    ]
+    
     def init(self):
-        """Initialize the SQL view for the report"""
+        """Initialize the SQL view for the report
+
+        Every relation and line table is aggregated once by rule and joined,
+        instead of counting it with a correlated subquery per rule.
+        """
         tools.drop_view_if_exists(self.env.cr, self._table)
+        
+        counts = [
+            ('access_management_users_rel', 'user_count'),
+            ('access_management_groups_rel', 'group_count'),
+        ] + self._LINE_COUNTS
+        columns = ",\n".join(
+            f"COALESCE({alias}.count, 0) AS {alias}" for _table, alias in counts
+        )
+        total = " + ".join(
+            f"COALESCE({alias}.count, 0)" for alias in self._TOTAL_COUNTS
+        )
+        joins = "\n".join(
+            f"LEFT JOIN (SELECT access_id, COUNT(*) AS count FROM {table} GROUP BY access_id) {alias}"
+            f" ON {alias}.access_id = am.id"
+            for table, alias in counts
+        )
+        
         self.env.cr.execute("""
             CREATE OR REPLACE VIEW %s AS (
                 SELECT
-                    row_number() OVER () AS id,
+                    am.id AS id,
                     am.id AS access_rule_id,
                     am.name AS access_rule_name,
                     am.active,
-                    (SELECT COUNT(*) FROM access_management_users_rel WHERE access_id = am.id) AS user_count,
-                    (SELECT COUNT(*) FROM access_management_groups_rel WHERE access_id = am.id) AS group_count,
-                    (SELECT COUNT(*) FROM access_management_menu WHERE access_id = am.id) AS menu_restrictions,
-                    (SELECT COUNT(*) FROM access_management_model WHERE access_id = am.id) AS model_restrictions,
-                    (SELECT COUNT(*) FROM access_management_field WHERE access_id = am.id) AS field_restrictions,
-                    (
-                        (SELECT COUNT(*) FROM access_management_menu WHERE access_id = am.id) +
-                        (SELECT COUNT(*) FROM access_management_model WHERE access_id = am.id) +
-                        (SELECT COUNT(*) FROM access_management_field WHERE access_id = am.id) +
-                        (SELECT COUNT(*) FROM access_management_domain WHERE access_id = am.id) +
-                        (SELECT COUNT(*) FROM access_management_button_tab WHERE access_id = am.id)
-                    ) AS total_restrictions,
+                    %s,
+                    (%s) AS total_restrictions,
                     am.company_id,
                     am.create_uid AS created_by,
                     am.create_date::date AS created_date
                 FROM
                     access_management am
+                %s
             )
-        """ % self._table)
+        """ % (self._table, columns, total, joins))
 
 
 class AccessManagementReportWizard(models.TransientModel):
@@ -142,20 +174,28 @@ class AccessManagementReportWizard(models.TransientModel):
     def _generate_user_access_report(self):
         """Generate user access report"""
         users = self.user_ids or self.env['res.users'].search([])
+        access_mgmt = self.env['access.management']
+        
+        # Rule membership of all users at once, then the aggregates once per policy class
+        user_rule_ids = access_mgmt._get_users_rule_ids(users.ids)
+        rule_ids = set().union(*user_rule_ids.values())
+        line_counts = access_mgmt._get_line_counts(rule_ids, ['menus', 'models', 'fields'])
         
-        user_access_data = []
-        for user in users:
-            rules = self.env['access.management']._get_applicable_rules(user)
-            
-            user_data = {
-                'user': user,
-                'rules': rules,
-                'total_rules': len(rules),
-                'menu_restrictions': sum(len(r.menu_access_ids) for r in rules),
-                'model_restrictions': sum(len(r.model_access_ids) for r in rules),
-                'field_restrictions': sum(len(r.field_access_ids) for r in rules),
+        class_data = {}
+        for class_rule_ids in set(user_rule_ids.values()):
+            class_data[class_rule_ids] = {
+                'rules': access_mgmt.browse(class_rule_ids),
+                'total_rules': len(class_rule_ids),
+                'menu_restrictions': sum(line_counts['menus'].get(rule_id, 0) for rule_id in class_rule_ids),
+                'model_restrictions': sum(line_counts['models'].get(rule_id, 0) for rule_id in class_rule_ids),
+                'field_restrictions': sum(line_counts['fields'].get(rule_id, 0) for rule_id in class_rule_ids),
             }
-            user_access_data.append(user_data)
+        
+        user_access_data = [
+            dict(class_data[user_rule_ids[user.id]], user=user)
+            for user in users
+            if user.id in user_rule_ids
+        ]
         
         return {
             'type': 'ir.actions.report',
@@ -1,3 +1,2 @@
 from . import test_access_management
-from . import test_access_management_wizards
 from . import test_access_management_performance
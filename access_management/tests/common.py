@@ -0,0 +1,138 @@
+# -*- coding: utf-8 -*-
+import random
+
+from odoo.addons.access_management.models.utils import access_cache, policy_registry
+
+
+def clear_access_caches():
+    """Drop every compiled policy, policy assignment and the rule index"""
+    access_cache.clear()
+    policy_registry.clear()
+
+
+class AccessManagementDataGenerator:
+    """Generate a synthetic access configuration of a given size
+
+    Users, groups and a menu tree are created upfront, rules are added by
+    ``generate_rules`` and can be generated incrementally. Every rule
+    applies by group to the first generated group, so ``probe_user``, a
+    member of it, is subject to all the rules generated.
+    """
+
+    # Partner fields no line ever restricts, so hooks can be exercised on them
+    FREE_PARTNER_FIELDS = ('id', 'name', 'display_name', 'comment', 'write_date', 'create_date')
+
+    def __init__(self, env, users=20, groups=5, lines_per_type=3, menu_depth=3, menu_width=3, seed=42):
+        self.env = env
+        self.random = random.Random(seed)
+        self.lines_per_type = lines_per_type
+        self.rule_count = 0
+        self.rules = env['access.management']
+
+        self.groups = env['res.groups'].create([
+            {'name': f'Access Benchmark Group {index}'} for index in range(max(groups, 1))
+        ])
+        group_user = env.ref('base.group_user')
+        self.users = env['res.users'].create([{
+            'name': f'Access Benchmark User {index}',
+            'login': f'access_benchmark_user_{index}',
+            'groups_id': [(6, 0, [group_user.id] + self._sample(self.groups.ids, 2))],
+        } for index in range(max(users, 1))])
+        self.probe_user = self.users[0]
+        self.probe_user.groups_id = [(4, self.groups[0].id)]
+
+        self.menus = self._create_menu_tree(
+            env.ref('base.menu_administration'), menu_depth, menu_width,
+        )
+        self.models = env['ir.model'].search([
+            ('transient', '=', False),
+            ('model', 'not like', 'access.management'),
+        ], limit=50, order='id')
+        self.partner_model = env.ref('base.model_res_partner')
+        self.partner_fields = env['ir.model.fields'].search([
+            ('model', '=', 'res.partner'),
+            ('store', '=', True),
+            ('name', 'not in', self.FREE_PARTNER_FIELDS),
+        ], limit=40, order='id')
+
+    def _sample(self, population, count):
+        """Pick distinct items of a population, as many as available"""
+        return self.random.sample(list(population), min(count, len(population)))
+
+    def _create_menu_tree(self, parent, depth, width):
+        """Create a menu tree of the given depth and width under a menu"""
+        menus = self.env['ir.ui.menu']
+        parents = parent
+        for level in range(depth):
+            parents = self.env['ir.ui.menu'].create([{
+                'name': f'Access Benchmark Menu {level}.{index}',
+                'parent_id': menu.id,
+            } for menu in parents for index in range(width)])
+            menus |= parents
+        return menus
+
+    def reset_rules(self):
+        """Forget the generated rules, once the test that created them rolled back"""
+        self.rule_count = 0
+        self.rules = self.env['access.management']
+
+    def generate_rules(self, count):
+        """Create ``count`` more rules, each with ``lines_per_type`` lines of every type"""
+        if count < 0:
+            raise ValueError(f"Cannot generate a negative number of rules: {count}")
+        env = self.env(context=dict(self.env.context, tracking_disable=True, defer_access_invalidation=True))
+        lines = self.lines_per_type
+
+        rules = env['access.management'].create([{
+            'name': f'Access Benchmark Rule {self.rule_count + index}',
+            'apply_by_group': True,
+            'group_ids': [(6, 0, [self.groups[0].id] + self._sample(self.groups[1:].ids, 1))],
+            'user_ids': [(6, 0, self._sample(self.users.ids, 2))],
+        } for index in range(count)])
+        self.rule_count += count
+
+        line_values = {
+            'access.management.menu': lambda rule: [
+                {'access_id': rule.id, 'menu_id': menu_id, 'hidden': True}
+                for menu_id in self._sample(self.menus.ids, lines)
+            ],
+            'access.management.model': lambda rule: [
+                {'access_id': rule.id, 'model_id': model_id, 'perm_read': True,
+                 'perm_write': self.random.random() < 0.5}
+                for model_id in self._sample(self.models.ids, lines)
+            ],
+            'access.management.field': lambda rule: [
+                {'access_id': rule.id, 'model_id': self.partner_model.id, 'field_id': field_id,
+                 'readonly': self.random.random() < 0.5, 'invisible': self.random.random() < 0.2}
+                for field_id in self._sample(self.partner_fields.ids, lines)
+            ],
+            'access.management.field.conditional': lambda rule: [
+                {'access_id': rule.id, 'model_id': self.partner_model.id, 'field_id': field_id,
+                 'condition': 'record.id > 0', 'readonly': True}
+                for field_id in self._sample(self.partner_fields.ids, lines)
+            ],
+            'access.management.domain': lambda rule: [
+                {'access_id': rule.id, 'model_id': self.partner_model.id,
+                 'name': f'Benchmark Domain {index}', 'domain': "[('id', '!=', 0)]"}
+                for index in range(lines)
+            ],
+            'access.management.button.tab': lambda rule: [
+                {'access_id': rule.id, 'model_id': self.partner_model.id,
+                 'element_type': 'button', 'element_name': f'action_benchmark_{index}', 'invisible': True}
+                for index in range(lines)
+            ],
+            'access.management.search.panel': lambda rule: [
+                {'access_id': rule.id, 'model_id': self.partner_model.id, 'field_id': field_id, 'invisible': True}
+                for field_id in self._sample(self.partner_fields.ids, lines)
+            ],
+            'access.management.chatter': lambda rule: [
+                {'access_id': rule.id, 'model_id': model_id, 'restrict_message_post': True}
+                for model_id in self._sample(self.models.ids, lines)
+            ],
+        }
+        for model_name, get_values in line_values.items():
+            env[model_name].create([values for rule in rules for values in get_values(rule)])
+
+        self.env['access.management']._invalidate_policy_cache()
+        self.rules |= rules.with_env(self.env)
+        return rules
@@ -2,7 +2,20 @@
 from odoo.tests import TransactionCase, tagged
 from odoo.exceptions import AccessError, ValidationError, UserError
 from odoo.tools import mute_logger
+import base64
+import json
 import logging
+import tempfile
+
+from odoo.addons.access_management.models import utils
+from odoo.addons.access_management.models.utils import (
+    POLICY_SIGNALING_TABLE, AccessRecorder, JsonLinesFile, access_cache, access_profiler,
+    check_policy_signaling, compile_global_access, drain_slow_access_buffer, export_access_rules,
+    format_prometheus_metrics, import_access_rules, iter_access_records, iter_export_rows,
+    iter_import_records, policy_cache_key, record_slow_access, request_policy_signaling,
+    start_access_stats, start_access_trace, stop_access_stats, stop_access_trace, stream_csv_export,
+    user_policy_cache_key,
+)
 
 _logger = logging.getLogger(__name__)
 
@@ -270,6 +283,22 @@ return False
         # Test code validation
         self.access_rule._check_global_access_code()
         
+        # Test code execution
+        access_mgmt = self.env['access.management']
+        self.assertTrue(access_mgmt.check_access(
+            'res.partner', 'read', user=self.user_employee, raise_exception=False
+        ))
+        self.access_rule.global_access = "return operation != 'unlink'"
+        self.assertTrue(access_mgmt.check_access(
+            'res.partner', 'read', user=self.user_employee, raise_exception=False
+        ))
+        self.assertFalse(access_mgmt.check_access(
+            'res.partner', 'unlink', user=self.user_employee, raise_exception=False
+        ))
+        self.access_rule.global_access = "return operation != 'export'"
+        with self.assertRaisesRegex(UserError, 'Access denied on res.partner'):
+            access_mgmt.check_access('res.partner', 'export', user=self.user_employee)
+        
         # Test with invalid code
         with self.assertRaises(ValidationError):
             self.access_rule.global_access = "invalid python code {"
@@ -367,6 +396,681 @@ return False
         result = partner_model.check_access_rights('read', raise_exception=False)
         self.assertFalse(result)
 
+    def test_16_invisible_fields_not_read(self):
+        """Test invisible fields are pruned before the ORM reads them"""
+        self.env['access.management.field'].create({
+            'access_id': self.access_rule.id,
+            'model_id': self.env.ref('base.model_res_partner').id,
+            'field_id': self.env.ref('base.field_res_partner__vat').id,
+            'invisible': True,
+        })
+        partner = self.env['res.partner'].create({
+            'name': 'Masked Partner',
+            'vat': 'BE0477472701',
+        })
+
+        # Employee never gets the masked field, explicitly requested or not
+        Partner = self.env['res.partner'].with_user(self.user_employee)
+        data = Partner.browse(partner.id).read(['name', 'vat'])[0]
+        self.assertEqual(data['name'], 'Masked Partner')
+        self.assertNotIn('vat', data)
+        self.assertNotIn('vat', Partner.browse(partner.id).read()[0])
+        data = Partner.search_read([('id', '=', partner.id)], ['vat'])[0]
+        self.assertEqual(set(data), {'id'})
+
+        # Manager is not targeted by the rule
+        Partner = self.env['res.partner'].with_user(self.user_manager)
+        data = Partner.browse(partner.id).read(['name', 'vat'])[0]
+        self.assertEqual(data['vat'], 'BE0477472701')
+
+    def test_17_fields_get_overlay(self):
+        """Test the cached fields_get overlay honours requested attributes"""
+        self.env['access.management.field'].create({
+            'access_id': self.access_rule.id,
+            'model_id': self.env.ref('base.model_res_partner').id,
+            'field_id': self.env.ref('base.field_res_partner__vat').id,
+            'readonly': True,
+            'invisible': True,
+        })
+        Partner = self.env['res.partner'].with_user(self.user_employee)
+
+        res = Partner.fields_get(['vat', 'name'])
+        self.assertTrue(res['vat']['readonly'])
+        self.assertTrue(res['vat']['invisible'])
+        self.assertFalse(res['name'].get('invisible'))
+
+        # Only the requested flags are forced
+        res = Partner.fields_get(['vat'], attributes=['string', 'readonly'])
+        self.assertTrue(res['vat']['readonly'])
+        self.assertNotIn('invisible', res['vat'])
+        res = Partner.fields_get(['vat'], attributes=['string'])
+        self.assertEqual(set(res['vat']), {'string'})
+
+        # The overlay is compiled once per policy and model
+        access_mgmt = self.env['access.management']
+        policy = access_mgmt._get_user_policy(self.user_employee)
+        overlay = access_mgmt._get_field_overlay('res.partner', policy)
+        self.assertEqual(overlay, {'vat': ('readonly', 'invisible')})
+        self.assertIs(access_mgmt._get_field_overlay('res.partner', policy), overlay)
+
+    def test_18_policy_line_projection(self):
+        """Test policy lines are projected as tuples of stored columns"""
+        self.env['access.management.model'].create({
+            'access_id': self.access_rule.id,
+            'model_id': self.env.ref('base.model_res_partner').id,
+            'perm_read': True,
+            'perm_write': False,
+            'perm_create': False,
+            'perm_unlink': False,
+        })
+        self.env['access.management.field'].create({
+            'access_id': self.access_rule.id,
+            'model_id': self.env.ref('base.model_res_partner').id,
+            'field_id': self.env.ref('base.field_res_partner__vat').id,
+            'readonly': True,
+        })
+
+        access_mgmt = self.env['access.management']
+        self.assertEqual(
+            access_mgmt._load_policy_lines(self.access_rule.ids, 'models'),
+            [(self.access_rule.id, 'res.partner', True, False, False, False)],
+        )
+        self.assertEqual(
+            access_mgmt._load_policy_lines(self.access_rule.ids, 'fields'),
+            [(self.access_rule.id, 'res.partner', 'vat', True, False, False)],
+        )
+        self.assertEqual(access_mgmt._load_policy_lines([], 'fields'), [])
+
+        # Compiled sections are plain Python structures
+        policy = access_mgmt._get_user_policy(self.user_employee)
+        models_section = access_mgmt._get_policy_section(policy, 'models')
+        self.assertEqual(models_section, {
+            'res.partner': {'read': True, 'write': False, 'create': False, 'unlink': False},
+        })
+
+    def test_19_implied_group_rules(self):
+        """Test group rules apply through the implied groups closure"""
+        group_rule = self.env['access.management'].create({
+            'name': 'Implied Group Rule',
+            'active': True,
+            'apply_by_group': True,
+            'group_ids': [(6, 0, [self.test_group.id])],
+        })
+        parent_group = self.env['res.groups'].create({
+            'name': 'Test Parent Group',
+            'implied_ids': [(6, 0, [self.test_group.id])],
+        })
+        top_group = self.env['res.groups'].create({
+            'name': 'Test Top Group',
+        })
+
+        # The index maps every group implying the rule's group
+        access_mgmt = self.env['access.management']
+        by_group = access_mgmt._get_rule_index()['by_group']
+        self.assertIn(group_rule.id, by_group[self.test_group.id])
+        self.assertIn(group_rule.id, by_group[parent_group.id])
+        self.assertNotIn(group_rule.id, by_group.get(top_group.id, ()))
+
+        # Changing implied groups refreshes the closure
+        top_group.implied_ids = [(4, parent_group.id)]
+        by_group = access_mgmt._get_rule_index()['by_group']
+        self.assertIn(group_rule.id, by_group[top_group.id])
+
+        self.user_manager.groups_id = [(4, top_group.id)]
+        self.assertIn(group_rule, access_mgmt._get_applicable_rules(self.user_manager))
+
+    def test_20_targeted_user_policy_recompute(self):
+        """Test user changes only drop the policy assignments of those users"""
+        group_rule = self.env['access.management'].create({
+            'name': 'Targeted Group Rule',
+            'active': True,
+            'apply_by_group': True,
+            'group_ids': [(6, 0, [self.test_group.id])],
+        })
+        access_mgmt = self.env['access.management']
+        employee_key = user_policy_cache_key(self.cr.dbname, self.user_employee.id)
+        manager_key = user_policy_cache_key(self.cr.dbname, self.user_manager.id)
+
+        # Warm both users' assignments
+        employee_policy = access_mgmt._get_user_policy(self.user_employee)
+        manager_policy = access_mgmt._get_user_policy(self.user_manager)
+        self.assertNotIn(group_rule.id, employee_policy[1])
+
+        # A group change only affects the user concerned
+        self.user_employee.groups_id = [(4, self.test_group.id)]
+        self.assertIsNone(access_cache.get(employee_key))
+        self.assertEqual(access_cache.get(manager_key), manager_policy)
+        self.assertIn(group_rule.id, access_mgmt._get_user_policy(self.user_employee)[1])
+
+        # So does a membership change made from the group
+        self.test_group.users = [(3, self.user_employee.id)]
+        self.assertIsNone(access_cache.get(employee_key))
+        self.assertEqual(access_cache.get(manager_key), manager_policy)
+        self.assertNotIn(group_rule.id, access_mgmt._get_user_policy(self.user_employee)[1])
+
+    def test_21_incremental_rule_change_propagation(self):
+        """Test rule and line changes only drop the affected policy sections"""
+        self.env['access.management'].create({
+            'name': 'Manager Rule',
+            'active': True,
+            'user_ids': [(6, 0, [self.user_manager.id])],
+        })
+        field_line = self.env['access.management.field'].create({
+            'access_id': self.access_rule.id,
+            'model_id': self.env.ref('base.model_res_partner').id,
+            'field_id': self.env.ref('base.field_res_partner__vat').id,
+            'readonly': True,
+        })
+        access_mgmt = self.env['access.management']
+        employee_policy = access_mgmt._get_user_policy(self.user_employee)
+        manager_policy = access_mgmt._get_user_policy(self.user_manager)
+        for policy in (employee_policy, manager_policy):
+            access_mgmt._get_policy_section(policy, 'fields')
+            access_mgmt._get_policy_section(policy, 'models')
+
+        def is_cached(policy, section):
+            return access_cache.get(policy_cache_key(self.cr.dbname, policy[0], section)) is not None
+
+        # A line change only drops its section in the policies of its rule
+        field_line.invisible = True
+        self.assertFalse(is_cached(employee_policy, 'fields'))
+        self.assertTrue(is_cached(employee_policy, 'models'))
+        self.assertTrue(is_cached(manager_policy, 'fields'))
+        self.assertEqual(access_mgmt._get_field_mask('res.partner', self.user_employee), {'vat'})
+
+        # A targeting change only moves the impacted users to another policy
+        self.access_rule.user_ids = [(4, self.user_manager.id)]
+        self.assertIsNone(access_cache.get(user_policy_cache_key(self.cr.dbname, self.user_employee.id)))
+        self.assertIsNone(access_cache.get(user_policy_cache_key(self.cr.dbname, self.user_manager.id)))
+        self.assertTrue(is_cached(employee_policy, 'models'))
+        self.assertTrue(is_cached(manager_policy, 'fields'))
+        self.assertIn(self.access_rule.id, access_mgmt._get_user_policy(self.user_manager)[1])
+
+    def test_22_rule_impact_preview(self):
+        """Test the impact of unsaved rule edits is computed without saving"""
+        self.env['access.management.model'].create({
+            'access_id': self.access_rule.id,
+            'model_id': self.env.ref('base.model_res_partner').id,
+            'perm_read': True,
+            'perm_unlink': False,
+        })
+
+        impact = self.access_rule._get_rule_impact({
+            'user_ids': [self.user_employee.id, self.user_manager.id],
+        })
+        self.assertEqual(impact['affected_users'], 1)
+        self.assertEqual(impact['users_added'], 1)
+        self.assertEqual(impact['users_removed'], 0)
+        self.assertEqual(impact['model_deltas']['res.partner']['unlink'], {'granted': 0, 'revoked': 1})
+
+        # Candidate lines are diffed for the users keeping the rule
+        impact = self.access_rule._get_rule_impact({
+            'model_access': [{'model': 'res.partner', 'perm_read': True, 'perm_unlink': True}],
+        })
+        self.assertEqual(impact['affected_users'], 1)
+        self.assertEqual(impact['model_deltas']['res.partner']['unlink'], {'granted': 1, 'revoked': 0})
+
+        # Nothing was saved
+        self.assertEqual(self.access_rule.user_ids, self.user_employee)
+        self.assertFalse(self.access_rule.model_access_ids.perm_unlink)
+        
+        # Without changes, the rule is compared to the same policies without it
+        impact = self.access_rule._get_rule_impact()
+        self.assertEqual(impact['affected_users'], 1)
+        self.assertEqual(impact['users_added'], 1)
+        self.assertEqual(impact['model_deltas']['res.partner']['unlink'], {'granted': 0, 'revoked': 1})
+
+    def test_23_bulk_policy_simulation(self):
+        """Test candidate rule sets are simulated in bulk against live policies"""
+        menu = self.env.ref('base.menu_administration')
+        result = self.env['access.management']._simulate_policies([
+            {'id': self.access_rule.id, 'disable_developer_mode': True},
+            {
+                'name': 'Candidate Rule',
+                'user_ids': [self.user_manager.id],
+                'lines': {
+                    'menus': [{'menu_id': menu.id}],
+                    'models': [{'model_name': 'res.partner', 'perm_write': False}],
+                },
+            },
+        ], user_ids=[self.user_employee.id, self.user_manager.id])
+
+        self.assertEqual(result['users'], 2)
+        self.assertEqual(result['changed_users'], 2)
+        employee_diff = result['diffs'][self.user_employee.id]
+        self.assertEqual(set(employee_diff), {'rules'})
+        self.assertEqual(employee_diff['rules']['disable_developer_mode']['after'], True)
+        manager_diff = result['diffs'][self.user_manager.id]
+        self.assertEqual(manager_diff['menus'], {'added': [menu.id], 'removed': []})
+        self.assertFalse(manager_diff['models']['res.partner']['after']['write'])
+
+        # The live policies are left untouched
+        self.assertFalse(self.access_rule.disable_developer_mode)
+        self.assertFalse(self.env['access.management']._get_user_policy(self.user_manager)[1])
+
+        # Columns of the rule a candidate leaves out keep their stored values
+        self.access_rule.global_access = "return True"
+        access_mgmt = self.env['access.management']
+        result = access_mgmt._simulate_policies([
+            {'id': self.access_rule.id, 'disable_developer_mode': True},
+        ], user_ids=[self.user_employee.id])
+        self.assertEqual(set(result['diffs'][self.user_employee.id]['rules']), {'disable_developer_mode'})
+        result = access_mgmt._simulate_policies([
+            {'id': self.access_rule.id, 'global_access': "return False"},
+        ], user_ids=[self.user_employee.id])
+        self.assertEqual(set(result['diffs'][self.user_employee.id]['rules']), {'global_access'})
+
+        # Unknown sections are reported by name
+        with self.assertRaisesRegex(UserError, 'unknown_section'):
+            access_mgmt._simulate_policies([], sections=['menus', 'unknown_section'])
+        with self.assertRaisesRegex(UserError, 'unknown_section'):
+            access_mgmt._get_policy_section(access_mgmt._get_user_policy(self.user_manager), 'unknown_section')
+
+    def test_24_streamed_export(self):
+        """Test the export sheets are streamed row by row across rule chunks"""
+        rules = self.access_rule | self.env['access.management'].create({
+            'name': 'Second Export Rule',
+            'user_ids': [(6, 0, [self.user_manager.id])],
+        })
+        self.env['access.management.model'].create([{
+            'access_id': rule.id,
+            'model_id': self.env.ref('base.model_res_partner').id,
+        } for rule in rules])
+
+        rows = list(iter_export_rows(self.env, 'model_access', rules.ids, chunk_size=1))
+        self.assertEqual(rows[0][:2], ['Rule', 'Model'])
+        self.assertEqual([row[0] for row in rows[1:]], rules.mapped('name'))
+        self.assertEqual(rows[1][1], 'res.partner')
+
+        content = b''.join(stream_csv_export(self.env, rules.ids)).decode()
+        self.assertEqual(len(content.splitlines()), 3)
+        self.assertIn('test_employee', content)
+
+    def test_25_unique_lines(self):
+        """Test duplicate lines are rejected within a batch and against the database"""
+        partner_model = self.env.ref('base.model_res_partner')
+        users_model = self.env.ref('base.model_res_users')
+        self.env['access.management.model'].create([
+            {'access_id': self.access_rule.id, 'model_id': partner_model.id},
+            {'access_id': self.access_rule.id, 'model_id': users_model.id},
+        ])
+
+        # Users get the message of the model, not the one of the unique index
+        message = "Model '%s' is already configured in this access rule." % partner_model.name
+        with self.assertRaisesRegex(ValidationError, message):
+            self.env['access.management.model'].create({
+                'access_id': self.access_rule.id,
+                'model_id': partner_model.id,
+            })
+        with self.assertRaisesRegex(ValidationError, message):
+            self.env['access.management.model'].create([
+                {'access_id': self.access_rule.id, 'model_id': partner_model.id},
+                {'access_id': self.access_rule.id, 'model_id': partner_model.id},
+            ])
+        users_line = self.access_rule.model_access_ids.filtered(lambda line: line.model_id == users_model)
+        with self.assertRaisesRegex(ValidationError, message):
+            users_line.write({'model_id': partner_model.id})
+
+        # The same models in another rule are fine, keys are compared as a whole
+        other_rule = self.env['access.management'].create({
+            'name': 'Other Rule',
+            'user_ids': [(6, 0, [self.user_manager.id])],
+        })
+        self.env['access.management.model'].create([
+            {'access_id': other_rule.id, 'model_id': users_model.id},
+            {'access_id': other_rule.id, 'model_id': partner_model.id},
+        ])
+        self.assertEqual(len(other_rule.model_access_ids), 2)
+
+    def test_26_access_rules_count(self):
+        """Test the line count of rules is computed from grouped counts"""
+        other_rule = self.env['access.management'].create({
+            'name': 'Other Rule',
+            'user_ids': [(6, 0, [self.user_manager.id])],
+        })
+        rules = self.access_rule | other_rule
+        self.env['access.management.model'].create([{
+            'access_id': rule.id,
+            'model_id': self.env.ref('base.model_res_partner').id,
+        } for rule in rules])
+        self.env['access.management.field'].create({
+            'access_id': self.access_rule.id,
+            'model_id': self.env.ref('base.model_res_partner').id,
+            'field_id': self.env.ref('base.field_res_partner__vat').id,
+        })
+
+        self.assertEqual(self.access_rule.access_rules_count, 2)
+        self.assertEqual(other_rule.access_rules_count, 1)
+
+        # Unsaved rules count their lines in cache
+        new_rule = self.env['access.management'].new({
+            'name': 'New Rule',
+            'model_access_ids': [(0, 0, {'model_id': self.env.ref('base.model_res_partner').id})],
+        })
+        self.assertEqual(new_rule.access_rules_count, 1)
+
+    def test_27_request_access_stats(self):
+        """Test the access overhead of a request is counted per hook and cache"""
+        access_cache.clear()
+        stats = start_access_stats()
+        try:
+            self.env['res.partner'].with_user(self.user_employee).search([], limit=1)
+            self.env['res.partner'].with_user(self.user_employee).search([], limit=1)
+        finally:
+            self.assertIs(stop_access_stats(), stats)
+
+        self.assertGreaterEqual(stats.hooks['_search']['calls'], 2)
+        self.assertGreater(stats.queries, 0)
+        self.assertGreaterEqual(stats.rules, 1)
+        # The policy of the user is computed once, then found in cache
+        self.assertEqual(stats.caches['user']['misses'], 1)
+        self.assertGreaterEqual(stats.caches['user']['hits'], 1)
+        self.assertIn('access;dur=', stats.get_server_timing())
+        self.assertIn('_search', json.loads(json.dumps(stats.to_dict()))['hooks'])
+
+    def test_28_cache_metrics(self):
+        """Test the access cache counts its statistics incrementally"""
+        access_cache.clear()
+        before = access_cache.get_stats()
+        self.assertEqual((before['size'], before['memory']), (0, 0))
+
+        access_cache.set('test:metrics', [1, 2, 3])
+        access_cache.set('test:newest', {})
+        stats = access_cache.get_stats()
+        self.assertEqual(stats['oldest'], access_cache.timestamps['test:metrics'])
+        self.assertEqual(stats['newest'], access_cache.timestamps['test:newest'])
+        self.assertGreater(stats['memory'], 0)
+        access_cache.delete(['test:newest'])
+        access_cache.get('test:metrics')
+        access_cache.get('test:missing')
+        access_cache.delete(['test:metrics'])
+
+        stats = access_cache.get_stats()
+        self.assertEqual(stats['hits'] - before['hits'], 1)
+        self.assertEqual(stats['misses'] - before['misses'], 1)
+        self.assertEqual(stats['invalidations'] - before['invalidations'], 2)
+        self.assertEqual((stats['size'], stats['memory'], stats['oldest']), (0, 0, None))
+
+        self.env['res.partner'].with_user(self.user_employee).search([], limit=1)
+        metrics = format_prometheus_metrics()
+        self.assertIn('# TYPE access_management_cache_hits_total counter', metrics)
+        self.assertIn('hook="_search",le="+Inf"}', metrics)
+
+    def test_29_slow_access_log(self):
+        """Test slow access checks are buffered, then inserted in one batch"""
+        drain_slow_access_buffer()
+        employee_env = self.env(user=self.user_employee)
+        policy = self.env['access.management']._get_user_policy(self.user_employee)
+
+        record_slow_access(employee_env, '_search', 'res.partner', 0.25, 3)
+        record_slow_access(employee_env, 'fields_get', 'res.partner', 0.5, 0)
+        # Fast checks are not recorded
+        with access_profiler(employee_env, 'read', 'res.partner'):
+            pass
+
+        slow_log = self.env['access.management.slow.log']
+        with self.assertQueryCount(1):
+            self.assertEqual(slow_log._flush_buffer(), 2)
+        self.assertEqual(slow_log._flush_buffer(), 0)
+
+        logs = slow_log.search([('user_id', '=', self.user_employee.id)], order='id')
+        self.assertEqual(logs.mapped('hook'), ['_search', 'fields_get'])
+        self.assertEqual(logs[0].duration, 250)
+        self.assertEqual(logs[0].query_count, 3)
+        self.assertEqual(logs[0].policy_hash, policy[0])
+        self.assertEqual(logs[0].rule_count, len(policy[1]))
+
+    def test_30_record_and_replay(self):
+        """Test sampled hook calls are recorded, then replayed against the engine"""
+        partner_model = self.env['res.partner'].with_user(self.user_employee)
+        with tempfile.NamedTemporaryFile('w+', suffix='.jsonl') as records_file:
+            recorder = utils.access_recorder
+            utils.access_recorder = AccessRecorder(records_file.name, 1.0)
+            try:
+                partner_model.fields_get(['vat'])
+                partner_model.search([('name', '=', 'Replay')])
+            finally:
+                if utils.access_recorder.file:
+                    utils.access_recorder.file.close()
+                utils.access_recorder = recorder
+            records = list(iter_access_records(records_file))
+
+        hooks = {record['hook'] for record in records}
+        self.assertTrue({'fields_get', '_search'} <= hooks)
+        self.assertTrue(all(record['user'] == self.user_employee.id for record in records))
+        # The inputs of the calls are recorded to be replayed
+        search_record = next(record for record in records if record['hook'] == '_search')
+        self.assertIn(['name', '=', 'Replay'], search_record['domain'])
+        self.assertIn(['name', '=', 'Replay'], search_record['decision'])
+        fields_record = next(record for record in records if record['hook'] == 'fields_get')
+        self.assertEqual(fields_record['fields'], ['vat'])
+
+        access_mgmt = self.env['access.management']
+        result = access_mgmt._replay_access_records(records, repeat=2)
+        self.assertEqual(result['calls'], 2 * len(records))
+        self.assertEqual(result['mismatches'], 0)
+
+        # Decisions changed since the recording are reported
+        self.env['access.management.field'].create({
+            'access_id': self.access_rule.id,
+            'model_id': self.env.ref('base.model_res_partner').id,
+            'field_id': self.env.ref('base.field_res_partner__vat').id,
+            'readonly': True,
+        })
+        result = access_mgmt._replay_access_records(records)
+        self.assertGreaterEqual(result['mismatches'], 1)
+        self.assertIn('fields_get', [example['hook'] for example in result['examples']])
+
+        # has_group records the user whose groups are checked
+        with tempfile.NamedTemporaryFile('w+', suffix='.jsonl') as records_file:
+            utils.access_recorder = AccessRecorder(records_file.name, 1.0)
+            try:
+                self.user_employee.with_user(self.user_manager).has_group('base.group_no_one')
+            finally:
+                if utils.access_recorder.file:
+                    utils.access_recorder.file.close()
+                utils.access_recorder = recorder
+            records = list(iter_access_records(records_file))
+        self.assertEqual(
+            [record['user'] for record in records if record['hook'] == 'has_group'],
+            [self.user_employee.id],
+        )
+
+    def test_31_access_tracing(self):
+        """Test access spans are exported as OTLP JSON lines for sampled requests"""
+        access_cache.clear()
+        trace_id, parent_id = 'a' * 32, 'b' * 16
+        with tempfile.NamedTemporaryFile('w+', suffix='.jsonl') as trace_file:
+            exporter = utils.access_trace_exporter
+            utils.access_trace_exporter = JsonLinesFile(trace_file.name)
+            try:
+                # Requests the caller did not sample are not traced
+                self.assertIsNone(start_access_trace(f'00-{trace_id}-{parent_id}-00'))
+                stop_access_trace()
+
+                start_access_stats()
+                self.assertTrue(start_access_trace(f'00-{trace_id}-{parent_id}-01'))
+                self.env['access.management'].check_access(
+                    'res.partner', 'read', user=self.user_employee, raise_exception=False,
+                )
+                self.env['res.partner'].with_user(self.user_employee).search([], limit=1)
+                stop_access_trace()
+                stop_access_stats()
+            finally:
+                if utils.access_trace_exporter.file:
+                    utils.access_trace_exporter.file.close()
+                utils.access_trace_exporter = exporter
+            lines = [json.loads(line) for line in trace_file if line.strip()]
+
+        self.assertEqual(len(lines), 1)
+        spans = lines[0]['resourceSpans'][0]['scopeSpans'][0]['spans']
+        by_name = {span['name']: span for span in spans}
+        check_span = by_name['access_management.check_access']
+        self.assertEqual(check_span['traceId'], trace_id)
+        self.assertEqual(check_span['parentSpanId'], parent_id)
+        attributes = {attribute['key']: attribute['value'] for attribute in check_span['attributes']}
+        self.assertEqual(attributes['odoo.model'], {'stringValue': 'res.partner'})
+        self.assertIn('access.policy', attributes)
+        self.assertIn('access.rule_count', attributes)
+        self.assertIn('access_management._search', by_name)
+        # Nested spans are children of the enclosing span
+        rules_span = by_name['access_management._get_applicable_rules']
+        self.assertEqual(rules_span['parentSpanId'], check_span['spanId'])
+
+    def test_32_global_access_sandbox(self):
+        """Test global access code is sandboxed, compiled once and memoized when user-scoped"""
+        # Imports and dunder attributes are rejected
+        for code in ("import os\nreturn True", "return user.__class__"):
+            with self.assertRaises(ValidationError):
+                self.access_rule.global_access = code
+        
+        code = "# access-scope: user\nreturn model != 'res.partner'"
+        function, user_scoped = compile_global_access(code)
+        self.assertIs(compile_global_access(code)[0], function)
+        self.assertTrue(user_scoped)
+        self.assertFalse(compile_global_access("return True")[1])
+        
+        self.access_rule.global_access = code
+        access_mgmt = self.env['access.management']
+        self.assertFalse(access_mgmt.check_access(
+            'res.partner', 'read', user=self.user_employee, raise_exception=False
+        ))
+        policy = access_mgmt._get_user_policy(self.user_employee)
+        cache_key = policy_cache_key(
+            self.cr.dbname, policy[0], 'rules', 'global_access', 'res.partner', 'read',
+        )
+        self.assertIs(access_cache.get(cache_key), False)
+        self.assertTrue(access_mgmt.check_access(
+            'res.users', 'read', user=self.user_employee, raise_exception=False
+        ))
+        
+        # Changing the code drops the memoized results
+        self.access_rule.global_access = "# access-scope: user\nreturn True"
+        self.assertTrue(access_mgmt.check_access(
+            'res.partner', 'read', user=self.user_employee, raise_exception=False
+        ))
+        
+        # Memoized results are shared by the policy class, the code gets no user
+        self.access_rule.global_access = "# access-scope: user\nreturn user is None"
+        self.assertTrue(access_mgmt.check_access(
+            'res.partner', 'read', user=self.user_employee, raise_exception=False
+        ))
+        
+        # Code failing at runtime denies access
+        self.access_rule.global_access = "return 1 / 0"
+        self.assertFalse(access_mgmt.check_access(
+            'res.partner', 'read', user=self.user_employee, raise_exception=False
+        ))
+        
+        # Code saved before the sandbox checks denies access until fixed
+        self.cr.execute(
+            "UPDATE access_management SET global_access = %s WHERE id = %s",
+            ["import os\nreturn True", self.access_rule.id],
+        )
+        self.access_rule.invalidate_recordset(['global_access'])
+        access_cache.clear()
+        self.assertFalse(access_mgmt.check_access(
+            'res.users', 'read', user=self.user_employee, raise_exception=False
+        ))
+    
+    def test_33_policy_signaling(self):
+        """Test the invalidations logged by other workers only drop the entries they concern"""
+        access_mgmt = self.env['access.management']
+        employee_key = user_policy_cache_key(self.cr.dbname, self.user_employee.id)
+        manager_key = user_policy_cache_key(self.cr.dbname, self.user_manager.id)
+        check_policy_signaling(self.cr)
+        employee_policy = access_mgmt._get_user_policy(self.user_employee)
+        manager_policy = access_mgmt._get_user_policy(self.user_manager)
+        
+        # Nothing changed since the last check
+        check_policy_signaling(self.cr)
+        self.assertEqual(access_cache.get(employee_key), employee_policy)
+        
+        # Another worker changed the groups of the employee
+        self.cr.execute(
+            f"INSERT INTO {POLICY_SIGNALING_TABLE} (kind, user_id) VALUES ('user', %s)",
+            [self.user_employee.id],
+        )
+        check_policy_signaling(self.cr)
+        self.assertIsNone(access_cache.get(employee_key))
+        self.assertEqual(access_cache.get(manager_key), manager_policy)
+        
+        # Entries of other databases are left alone
+        other_key = user_policy_cache_key('access_other_database', self.user_manager.id)
+        access_cache.set(other_key, manager_policy)
+        self.cr.execute(f"INSERT INTO {POLICY_SIGNALING_TABLE} (kind) VALUES ('clear_user_policy_cache')")
+        check_policy_signaling(self.cr)
+        self.assertIsNone(access_cache.get(manager_key))
+        self.assertEqual(access_cache.get(other_key), manager_policy)
+        access_cache.delete([other_key])
+        
+        # Requests check the log on their first policy lookup only
+        manager_policy = access_mgmt._get_user_policy(self.user_manager)
+        request_policy_signaling()
+        for user in (self.user_manager, self.user_employee):
+            self.cr.execute(
+                f"INSERT INTO {POLICY_SIGNALING_TABLE} (kind, user_id) VALUES ('user', %s)", [user.id],
+            )
+            access_mgmt._get_user_policy(self.user_employee)
+        self.assertIsNone(access_cache.get(manager_key))
+        self.assertIsNotNone(access_cache.get(employee_key))
+        check_policy_signaling(self.cr)
+        
+        # Changes are logged for the other workers once committed
+        self.access_rule.disable_developer_mode = True
+        self.assertIn(
+            ('section', None, self.access_rule.id, 'rules'),
+            self.cr.postcommit.data['access_management.invalidations'],
+        )
+    
+    def test_34_export_import_round_trip(self):
+        """Test exported rules import back as exported, references included"""
+        category = self.env['ir.module.category'].create({'name': 'Export Category'})
+        group = self.env['res.groups'].create({'name': 'Export Group', 'category_id': category.id})
+        menu = self.env.ref('base.menu_administration')
+        rule = self.env['access.management'].create({
+            'name': 'Round Trip Rule',
+            'apply_by_group': True,
+            'user_ids': [(6, 0, [self.user_employee.id])],
+            'group_ids': [(6, 0, [group.id])],
+            'menu_access_ids': [(0, 0, {'menu_id': menu.id})],
+            'field_access_ids': [(0, 0, {
+                'model_id': self.env.ref('base.model_res_partner').id,
+                'field_id': self.env.ref('base.field_res_partner__vat').id,
+                'readonly': True,
+            })],
+            'chatter_access_ids': [(0, 0, {
+                'model_id': self.env.ref('base.model_res_partner').id,
+                'disable_followers': True,
+            })],
+        })
+        
+        def assert_same_rule(imported):
+            self.assertEqual(len(imported), 1)
+            self.assertEqual(imported.user_ids, rule.user_ids)
+            self.assertEqual(imported.group_ids, rule.group_ids)
+            self.assertEqual(imported.company_id, rule.company_id)
+            self.assertTrue(imported.apply_by_group)
+        
+        # The rules sheet of the CSV export
+        content = b''.join(stream_csv_export(self.env, rule.ids)).decode()
+        self.assertIn('test_employee', content)
+        self.assertNotIn('Export Category', content)
+        imported = import_access_rules(self.env, content.replace('Round Trip Rule', 'CSV Rule'), 'csv')
+        assert_same_rule(imported)
+        
+        # The JSON export, with every line type
+        data = export_access_rules(rule).replace('Round Trip Rule', 'JSON Rule')
+        imported = import_access_rules(self.env, data, 'json')
+        assert_same_rule(imported)
+        self.assertEqual(imported.menu_access_ids.menu_id, menu)
+        self.assertTrue(imported.field_access_ids.readonly)
+        self.assertTrue(imported.chatter_access_ids.disable_followers)
+        
+        # JSON arrays are decoded one rule at a time, errors reported per row
+        records = list(iter_import_records('[{"name": "A"}, {"name": "B"} {"name": "C"}]'))
+        self.assertEqual(records[:2], [(1, {'name': 'A'}), (2, {'name': 'B'})])
+        self.assertIsInstance(records[2][1], ValueError)
 
 @tagged('access_management', 'wizard')
 class TestAccessManagementWizards(TransactionCase):
@@ -461,6 +1165,209 @@ class TestAccessManagementWizards(TransactionCase):
         self.assertEqual(wizard.import_type, 'full')
         self.assertFalse(wizard.update_existing)
 
+    def test_04_user_access_report(self):
+        """Test the user access report aggregates rules per policy class"""
+        users = self.env['res.users'].create([{
+            'name': f'Report User {index}',
+            'login': f'report_user_{index}',
+            'groups_id': [(6, 0, [self.env.ref('base.group_user').id])],
+        } for index in range(3)])
+        self.access_rule.user_ids = [(6, 0, users[:2].ids)]
+        self.env['access.management.menu'].create({
+            'access_id': self.access_rule.id,
+            'menu_id': self.test_menu.id,
+            'hidden': True,
+        })
+
+        wizard = self.env['access.management.report.wizard'].create({
+            'report_type': 'user_access',
+            'user_ids': [(6, 0, users.ids)],
+        })
+        data = wizard._generate_user_access_report()['data']['user_access_data']
+        by_user = {user_data['user']: user_data for user_data in data}
+
+        self.assertEqual(len(data), 3)
+        self.assertIn(self.access_rule, by_user[users[0]]['rules'])
+        self.assertEqual(by_user[users[0]]['menu_restrictions'], by_user[users[1]]['menu_restrictions'])
+        self.assertNotIn(self.access_rule, by_user[users[2]]['rules'])
+
+    def test_05_import_rules(self):
+        """Test rules and lines are imported in batches with per-row errors"""
+        data = [{
+            'name': 'Imported Rule',
+            'users': ['admin'],
+            'menu_access': [{'menu': self.test_menu.complete_name, 'hidden': True}],
+            'model_access': [{'model': 'res.partner', 'read': True, 'write': False}],
+            'field_access': [{'model': 'res.partner', 'field': 'vat', 'readonly': True}],
+        }, {
+            'name': 'Invalid Rule',
+            'users': 'admin, unknown_login',
+        }, {
+            'name': 'Malformed Rule',
+            'model_access': 'res.partner',
+        }]
+        wizard = self.env['access.management.import.wizard'].create({
+            'file_data': base64.b64encode(json.dumps(data).encode()),
+            'file_name': 'rules.json',
+            'import_type': 'full',
+        })
+        result = wizard.action_import()
+        self.assertEqual(result['params']['type'], 'warning')
+        self.assertIn('Row 2', result['params']['message'])
+        self.assertIn('Row 3', result['params']['message'])
+
+        rule = self.env['access.management'].search([('name', '=', 'Imported Rule')])
+        self.assertEqual(rule.user_ids, self.env.ref('base.user_admin'))
+        self.assertEqual(rule.menu_access_ids.menu_id, self.test_menu)
+        self.assertFalse(rule.model_access_ids.perm_write)
+        self.assertEqual(rule.field_access_ids.field_id.name, 'vat')
+        self.assertFalse(self.env['access.management'].search([
+            ('name', 'in', ['Invalid Rule', 'Malformed Rule']),
+        ]))
+
+    def test_06_sync_rules(self):
+        """Test synchronizing applies only the differences with the file"""
+        data = [{
+            'name': 'Synced Rule',
+            'users': ['admin'],
+            'model_access': [
+                {'model': 'res.partner', 'read': True, 'write': False},
+                {'model': 'res.users', 'read': True, 'write': True},
+            ],
+        }]
+        access_mgmt = self.env['access.management']
+
+        def sync():
+            return access_mgmt._sync_rules(enumerate(json.loads(json.dumps(data)), start=1))
+
+        result = sync()
+        self.assertEqual((result['created'], result['updated'], result['deleted']), (3, 0, 0))
+        rule = access_mgmt.search([('name', '=', 'Synced Rule')])
+        partner_line = rule.model_access_ids.filtered(lambda line: line.model_name == 'res.partner')
+
+        # An unchanged file touches nothing
+        result = sync()
+        self.assertEqual((result['created'], result['updated'], result['deleted']), (0, 0, 0))
+
+        # Changed lines are written in place, lines absent from the file removed
+        data[0]['model_access'] = [{'model': 'res.partner', 'read': True, 'write': True}]
+        result = sync()
+        self.assertEqual((result['created'], result['updated'], result['deleted']), (0, 1, 1))
+        self.assertEqual(rule.model_access_ids, partner_line)
+        self.assertTrue(partner_line.perm_write)
+
+        # Line types absent from the file are left as they are
+        del data[0]['model_access']
+        result = sync()
+        self.assertEqual((result['created'], result['updated'], result['deleted']), (0, 0, 0))
+        self.assertEqual(rule.model_access_ids, partner_line)
+        
+        # Natural keys given twice are reported, the lines of the rule kept
+        data[0]['model_access'] = [
+            {'model': 'res.users', 'read': True},
+            {'model': 'res.users', 'read': False},
+        ]
+        result = sync()
+        self.assertEqual(len(result['errors']), 1)
+        self.assertIn('Duplicate model_access line', result['errors'][0][1])
+        self.assertEqual(rule.model_access_ids, partner_line)
+
+        # Lines failing to be written are reported on the row of their rule
+        data[0]['model_access'] = [{'model': 'res.partner', 'read': True, 'write': True}]
+        data[0]['domain_access'] = [
+            {'model': 'res.partner', 'name': 'Synced Domain', 'domain': "[('id', '>', 0)]"},
+        ]
+        sync()
+        data[0]['model_access'][0]['write'] = False
+        data[0]['domain_access'][0]['domain'] = "not a domain"
+        result = sync()
+        self.assertEqual([row for row, _message in result['errors']], [1])
+        self.assertEqual(result['updated'], 1)
+        self.assertFalse(partner_line.perm_write)
+        self.assertEqual(rule.domain_access_ids.domain, "[('id', '>', 0)]")
+
+    def test_07_menu_wizard_subtree(self):
+        """Test the menu wizard adds the missing menus of a whole subtree"""
+        child_menu = self.env['ir.ui.menu'].create({
+            'name': 'Test Child Menu',
+            'parent_id': self.test_menu.id,
+        })
+        grandchild_menu = self.env['ir.ui.menu'].create({
+            'name': 'Test Grandchild Menu',
+            'parent_id': child_menu.id,
+        })
+        self.env['access.management.menu'].create({
+            'access_id': self.access_rule.id,
+            'menu_id': child_menu.id,
+            'hidden': False,
+        })
+
+        wizard = self.env['access.management.menu.wizard'].create({
+            'access_id': self.access_rule.id,
+            'menu_id': self.test_menu.id,
+            'hidden': True,
+            'apply_to_children': True,
+        })
+        wizard.action_add_menu()
+
+        menu_access = self.access_rule.menu_access_ids
+        self.assertEqual(menu_access.menu_id, self.test_menu | child_menu | grandchild_menu)
+        self.assertEqual(len(menu_access), 3)
+        # Existing lines are left as they are
+        self.assertFalse(menu_access.filtered(lambda line: line.menu_id == child_menu).hidden)
+
+    def test_08_copy_wizard_per_company(self):
+        """Test the copy wizard clones a rule to many companies at once"""
+        self.env['access.management.menu'].create({
+            'access_id': self.access_rule.id,
+            'menu_id': self.test_menu.id,
+            'hidden': True,
+        })
+        self.env['access.management.model'].create({
+            'access_id': self.access_rule.id,
+            'model_id': self.env.ref('base.model_res_partner').id,
+        })
+        companies = self.env['res.company'].create([
+            {'name': 'Copy Company A'},
+            {'name': 'Copy Company B'},
+        ])
+
+        wizard = self.env['access.management.copy.wizard'].create({
+            'source_id': self.access_rule.id,
+            'name': 'Company Rule',
+            'copy_mode': 'companies',
+            'target_company_ids': [(6, 0, companies.ids)],
+            'copy_users': True,
+            'copy_model_access': False,
+        })
+        result = wizard.action_copy()
+
+        new_rules = self.env['access.management'].with_context(active_test=False).search(result['domain'])
+        self.assertEqual(new_rules.company_id, companies)
+        for rule in new_rules:
+            self.assertEqual(rule.menu_access_ids.menu_id, self.test_menu)
+            self.assertFalse(rule.model_access_ids)
+        # The source rule keeps its lines
+        self.assertEqual(len(self.access_rule.model_access_ids), 1)
+    
+    def test_09_report_restriction_counts(self):
+        """Test the report counts every line type, its total the menu, model, field, domain and button lines"""
+        partner_model = self.env.ref('base.model_res_partner')
+        self.env['access.management.model'].create({
+            'access_id': self.access_rule.id,
+            'model_id': partner_model.id,
+        })
+        self.env['access.management.search.panel'].create({
+            'access_id': self.access_rule.id,
+            'model_id': partner_model.id,
+            'field_id': self.env.ref('base.field_res_partner__name').id,
+        })
+        self.env.flush_all()
+        
+        report = self.env['access.management.report'].search([('access_rule_id', '=', self.access_rule.id)])
+        self.assertEqual(report.model_restrictions, 1)
+        self.assertEqual(report.search_panel_restrictions, 1)
+        self.assertEqual(report.total_restrictions, 1)
 
 @tagged('access_management', 'performance')
 class TestAccessManagementPerformance(TransactionCase):
@@ -0,0 +1,250 @@
+# -*- coding: utf-8 -*-
+import json
+import logging
+import time
+
+from odoo.tests import TransactionCase, tagged
+from odoo.tools import config
+
+from odoo.addons.access_management.models.utils import POLICY_SECTIONS
+
+from .common import AccessManagementDataGenerator, clear_access_caches
+
+_logger = logging.getLogger(__name__)
+
+# Arch processed by the view scenarios, with elements the generated rules hide
+BENCHMARK_VIEW_ARCH = """
+<form>
+    <header>
+        <button name="action_benchmark_0" type="object" string="Benchmark 0"/>
+        <button name="action_benchmark_1" type="object" string="Benchmark 1"/>
+    </header>
+    <sheet>
+        <field name="name"/>
+        <field name="comment"/>
+    </sheet>
+</form>
+"""
+
+
+def percentile(values, percent):
+    """Get the nearest-rank percentile of some values"""
+    values = sorted(values)
+    return values[min(len(values) - 1, max(0, round(percent / 100 * len(values)) - 1))]
+
+
+@tagged('access_management', 'benchmark', '-standard')
+class TestAccessManagementBenchmark(TransactionCase):
+    """Timed scenarios of every access hook over a synthetic configuration
+
+    Not part of the standard test run, run it with ``--test-tags benchmark``.
+    Sizes are read from the ``access_management_benchmark_*`` options of
+    the server configuration. Results are logged as JSON, and written to
+    the ``access_management_benchmark_output`` file when set, to compare runs.
+    """
+
+    # Benchmark sizes and their defaults
+    SIZES = {
+        'users': 200,
+        'groups': 20,
+        'rules': 500,
+        'lines_per_type': 5,
+        'menu_depth': 3,
+        'menu_width': 4,
+        'runs': 30,
+    }
+
+    @classmethod
+    def setUpClass(cls):
+        super(TestAccessManagementBenchmark, cls).setUpClass()
+        cls.sizes = {
+            name: int(config.get(f'access_management_benchmark_{name}', default))
+            for name, default in cls.SIZES.items()
+        }
+        cls.generator = AccessManagementDataGenerator(
+            cls.env,
+            users=cls.sizes['users'],
+            groups=cls.sizes['groups'],
+            lines_per_type=cls.sizes['lines_per_type'],
+            menu_depth=cls.sizes['menu_depth'],
+            menu_width=cls.sizes['menu_width'],
+        )
+        cls.generator.generate_rules(cls.sizes['rules'])
+        cls.user = cls.generator.probe_user
+        cls.partner = cls.env['res.partner'].create({'name': 'Access Benchmark Partner'})
+
+    def _measure(self, func, cold):
+        """Run a scenario, returning its duration in ms and its query count"""
+        if cold:
+            clear_access_caches()
+        queries = self.cr.sql_log_count
+        start = time.perf_counter()
+        func()
+        duration = (time.perf_counter() - start) * 1000
+        return duration, self.cr.sql_log_count - queries
+
+    def _run_scenario(self, name, func):
+        """Time a scenario on cold and warm access caches"""
+        # Warm up the ORM and registry caches the scenario goes through
+        func()
+        results = []
+        for cache in ('cold', 'warm'):
+            durations, queries = [], []
+            for _run in range(self.sizes['runs']):
+                duration, count = self._measure(func, cold=cache == 'cold')
+                durations.append(duration)
+                queries.append(count)
+            results.append({
+                'scenario': name,
+                'cache': cache,
+                'runs': len(durations),
+                'p50_ms': round(percentile(durations, 50), 3),
+                'p95_ms': round(percentile(durations, 95), 3),
+                'max_ms': round(max(durations), 3),
+                'queries_p50': percentile(queries, 50),
+                'queries_max': max(queries),
+            })
+        return results
+
+    def test_benchmark(self):
+        """Benchmark every access hook and report the results as JSON"""
+        user = self.user
+        partner = self.partner
+        scenarios = {
+            '_search': lambda: self.env['res.partner'].with_user(user).search([], limit=1),
+            'fields_get': lambda: self.env['res.partner'].with_user(user).fields_get(),
+            'read': lambda: partner.with_user(user).read(['name', 'comment']),
+            'write': lambda: partner.with_user(user).sudo().write({'comment': 'Benchmark'}),
+            '_visible_menu_ids': lambda: self.env['ir.ui.menu'].with_user(user)._visible_menu_ids(),
+            'has_group': lambda: self.env['res.users'].with_user(user).has_group('base.group_no_one'),
+            'view_processing': lambda: self.env['access.management'].apply_view_access(
+                'res.partner', BENCHMARK_VIEW_ARCH, 'form', user=user,
+            ),
+            'check_access': lambda: self.env['access.management'].check_access(
+                'res.partner', 'write', user=user, raise_exception=False,
+            ),
+            'user_access_report': lambda: self.env['access.management.report.wizard'].create({
+                'report_type': 'user_access',
+            })._generate_user_access_report(),
+        }
+
+        results = []
+        for name, func in scenarios.items():
+            results.extend(self._run_scenario(name, func))
+            self.assertTrue(results[-1]['runs'])
+
+        report = json.dumps({'sizes': self.sizes, 'results': results}, indent=2)
+        _logger.info("Access management benchmark:\n%s", report)
+        output = config.get('access_management_benchmark_output')
+        if output:
+            with open(output, 'w') as output_file:
+                output_file.write(report)
+
+
+@tagged('access_management', 'performance')
+class TestAccessManagementQueryCount(TransactionCase):
+    """Query budgets of the access hooks, which must not grow with the rules
+
+    The budget of a hook is the number of queries it issues with a single
+    rule, on cold and on warm access caches. The same hooks must stay
+    within their budgets once the configuration grows to more rules.
+    """
+
+    RULE_COUNTS = (1, 100, 1000)
+
+    # Queries to compute the policy of a user: the rule index and the user
+    COLD_POLICY_BUDGET = 5
+    # Queries to compile one section of a policy
+    COLD_SECTION_BUDGET = 2
+
+    @classmethod
+    def setUpClass(cls):
+        super(TestAccessManagementQueryCount, cls).setUpClass()
+        cls.generator = AccessManagementDataGenerator(
+            cls.env, users=10, groups=3, lines_per_type=1, menu_depth=2, menu_width=3,
+        )
+        cls.user = cls.generator.probe_user
+        cls.partner = cls.env['res.partner'].create({'name': 'Access Query Count Partner'})
+
+    def setUp(self):
+        super(TestAccessManagementQueryCount, self).setUp()
+        # Rules of a previous test were rolled back with it
+        self.generator.reset_rules()
+
+    def _get_hooks(self):
+        """Get the access hooks to check, as {name: function}"""
+        user = self.user
+        partner = self.partner
+        return {
+            '_search': lambda: self.env['res.partner'].with_user(user).search([], limit=1),
+            'fields_get': lambda: self.env['res.partner'].with_user(user).fields_get(),
+            'read': lambda: partner.with_user(user).read(['name', 'comment']),
+            'write': lambda: partner.with_user(user).sudo().write({'comment': 'Query count'}),
+            '_visible_menu_ids': lambda: self.env['ir.ui.menu'].with_user(user)._visible_menu_ids(),
+            'has_group': lambda: self.env['res.users'].with_user(user).has_group('base.group_no_one'),
+            'apply_view_access': lambda: self.env['access.management'].apply_view_access(
+                'res.partner', BENCHMARK_VIEW_ARCH, 'form', user=user,
+            ),
+        }
+
+    def _reset_caches(self, cold):
+        """Empty the record cache, and the access caches for a cold run"""
+        self.env.invalidate_all()
+        if cold:
+            clear_access_caches()
+
+    def _count_queries(self, func):
+        """Count the queries issued by a function, pending writes included"""
+        self.env.flush_all()
+        count = self.cr.sql_log_count
+        func()
+        self.env.flush_all()
+        return self.cr.sql_log_count - count
+
+    def _grow_rules(self, rule_count):
+        """Generate rules up to the given number"""
+        self.generator.generate_rules(rule_count - self.generator.rule_count)
+
+    def test_01_hook_query_budgets(self):
+        """Test the queries of every hook do not grow with the number of rules"""
+        budgets = {}
+        for rule_count in self.RULE_COUNTS:
+            self._grow_rules(rule_count)
+            for name, func in self._get_hooks().items():
+                # Warm up the ORM and registry caches the hook goes through
+                func()
+                for cache in ('cold', 'warm'):
+                    self._reset_caches(cache == 'cold')
+                    if (name, cache) not in budgets:
+                        budgets[name, cache] = self._count_queries(func)
+                        continue
+                    with self.subTest(hook=name, cache=cache, rules=rule_count):
+                        with self.assertQueryCount(budgets[name, cache]):
+                            func()
+
+    def test_02_policy_query_budgets(self):
+        """Test the policy engine queries on cold and warm caches"""
+        access_mgmt = self.env['access.management']
+        budgets = {}
+        for rule_count in self.RULE_COUNTS:
+            self._grow_rules(rule_count)
+
+            self._reset_caches(cold=True)
+            count = self._count_queries(lambda: access_mgmt._get_user_policy(self.user))
+            self.assertLessEqual(count, self.COLD_POLICY_BUDGET)
+            budgets.setdefault('policy', count)
+            self.assertLessEqual(count, budgets['policy'], f"Policy queries grew with {rule_count} rules")
+
+            policy = access_mgmt._get_user_policy(self.user)
+            for section in POLICY_SECTIONS:
+                count = self._count_queries(lambda: access_mgmt._get_policy_section(policy, section))
+                self.assertLessEqual(count, self.COLD_SECTION_BUDGET, f"Section {section} issued {count} queries")
+                budgets.setdefault(section, count)
+                self.assertLessEqual(count, budgets[section], f"Section {section} queries grew with {rule_count} rules")
+
+            # Once compiled, nothing hits the database anymore
+            self.env.invalidate_all()
+            with self.assertQueryCount(0):
+                policy = access_mgmt._get_user_policy(self.user)
+                for section in POLICY_SECTIONS:
+                    access_mgmt._get_policy_section(policy, section)
@@ -1,7 +1,11 @@
 # -*- coding: utf-8 -*-
+import base64
+
 from odoo import models, fields, api, _
 from odoo.exceptions import UserError
 
+from ..models.utils import iter_import_records
+
 
 class AccessManagementMenuWizard(models.TransientModel):
     _name = 'access.management.menu.wizard'
@@ -49,38 +53,28 @@ class AccessManagementMenuWizard(models.TransientModel):
         """Add the selected menu to access management"""
         self.ensure_one()
         
-        # Check if menu already exists
-        existing = self.env['access.management.menu'].search([
-            ('access_id', '=', self.access_id.id),
-            ('menu_id', '=', self.menu_id.id)
-        ])
+        menus = self.menu_id
+        if self.apply_to_children:
+            menus |= self._get_all_child_menus(self.menu_id)
         
-        if existing:
+        # Check which menus already exist, in one query
+        menu_access_model = self.env['access.management.menu']
+        existing_ids = {
+            line['menu_id'] for line in menu_access_model.search_read([
+                ('access_id', '=', self.access_id.id),
+                ('menu_id', 'in', menus.ids),
+            ], ['menu_id'], load=None)
+        }
+        
+        if self.menu_id.id in existing_ids:
             raise UserError(_("Menu '%s' is already in the access rule.") % self.menu_id.name)
         
-        # Create menu access record
-        menu_access = self.env['access.management.menu'].create({
+        # Create the missing menu access records at once
+        menu_access_model.create([{
             'access_id': self.access_id.id,
-            'menu_id': self.menu_id.id,
+            'menu_id': menu.id,
             'hidden': self.hidden,
-        })
-        
-        # Apply to children if requested
-        if self.apply_to_children:
-            child_menus = self._get_all_child_menus(self.menu_id)
-            for child_menu in child_menus:
-                # Check if child menu already exists
-                existing_child = self.env['access.management.menu'].search([
-                    ('access_id', '=', self.access_id.id),
-                    ('menu_id', '=', child_menu.id)
-                ])
-                
-                if not existing_child:
-                    self.env['access.management.menu'].create({
-                        'access_id': self.access_id.id,
-                        'menu_id': child_menu.id,
-                        'hidden': self.hidden,
-                    })
+        } for menu in menus if menu.id not in existing_ids])
         
         return {
             'type': 'ir.actions.client',
@@ -95,14 +89,11 @@ class AccessManagementMenuWizard(models.TransientModel):
         }
     
     def _get_all_child_menus(self, menu):
-        """Recursively get all child menus"""
-        children = menu.child_id
-        all_children = children
-        
-        for child in children:
-            all_children |= self._get_all_child_menus(child)
-        
-        return all_children
+        """Get all descendant menus, with one query on the parent path"""
+        return self.env['ir.ui.menu'].with_context(**{'ir.ui.menu.full_list': True}).search([
+            ('parent_path', '=like', menu.parent_path + '%'),
+            ('id', '!=', menu.id),
+        ])
 
 
 class AccessManagementImportWizard(models.TransientModel):
@@ -112,7 +103,7 @@ class AccessManagementImportWizard(models.TransientModel):
     file_data = fields.Binary(
         string='Import File',
         required=True,
-        help="CSV or Excel file containing access rules"
+        help="JSON, JSON lines or CSV file containing access rules, as exported"
     )
     
     file_name = fields.Char(string='File Name')
@@ -125,30 +116,92 @@ class AccessManagementImportWizard(models.TransientModel):
         ('full', 'Full Configuration')
     ], string='Import Type', required=True, default='full')
     
+    import_mode = fields.Selection([
+        ('create', 'Create'),
+        ('sync', 'Synchronize'),
+    ], string='Import Mode', required=True, default='create',
+       help="Synchronize matches rules by name and lines by their target, "
+            "and only applies the differences with the file")
+    
+    remove_missing = fields.Boolean(
+        string='Remove Missing Rules',
+        default=False,
+        help="When synchronizing, delete the rules absent from the file"
+    )
+    
     update_existing = fields.Boolean(
         string='Update Existing',
         default=False,
         help="Update existing rules if found"
     )
     
+    # Line types imported per import type
+    _IMPORT_LINE_TYPES = {
+        'menu': ['menu_access'],
+        'model': ['model_access'],
+        'field': ['field_access', 'field_conditional_access'],
+        'domain': ['domain_access'],
+        'full': None,
+    }
+    
+    # Import file formats by file extension
+    _IMPORT_FORMATS = {
+        'json': 'json',
+        'jsonl': 'jsonl',
+        'ndjson': 'jsonl',
+        'csv': 'csv',
+    }
+    
     def action_import(self):
         """Import access management rules from file"""
         self.ensure_one()
         
-        # Implementation would include:
-        # 1. Parse the file (CSV/Excel)
-        # 2. Validate the data
-        # 3. Create or update access management records
-        # 4. Handle errors and provide feedback
+        extension = (self.file_name or '').rsplit('.', 1)[-1].lower()
+        file_format = self._IMPORT_FORMATS.get(extension)
+        if not file_format:
+            raise UserError(_("Please upload a JSON, JSON lines or CSV file."))
+        
+        data = base64.b64decode(self.file_data)
+        records = iter_import_records(data, file_format)
+        line_types = self._IMPORT_LINE_TYPES[self.import_type]
+        access_mgmt = self.env['access.management']
+        
+        if self.import_mode == 'sync':
+            result = access_mgmt._sync_rules(
+                records, line_types=line_types, remove_missing=self.remove_missing,
+            )
+            message = _('%(rules)s access rules synchronized: %(created)s records created, '
+                        '%(updated)s updated and %(deleted)s deleted.') % {
+                'rules': len(result['rules']),
+                'created': result['created'],
+                'updated': result['updated'],
+                'deleted': result['deleted'],
+            }
+        else:
+            result = access_mgmt._import_rules(
+                records, line_types=line_types, update_existing=self.update_existing,
+            )
+            message = _('%(rules)s access rules and %(lines)s lines imported.') % {
+                'rules': len(result['rules']),
+                'lines': result['lines'],
+            }
+        errors = result['errors']
+        if errors:
+            message += '\n' + '\n'.join(
+                _('Row %(row)s: %(error)s') % {'row': row, 'error': error}
+                for row, error in errors[:10]
+            )
+            if len(errors) > 10:
+                message += '\n' + _('... and %s more errors.') % (len(errors) - 10)
         
         return {
             'type': 'ir.actions.client',
             'tag': 'display_notification',
             'params': {
                 'title': _('Import Completed'),
-                'message': _('Access rules imported successfully.'),
-                'type': 'success',
-                'sticky': False,
+                'message': message,
+                'type': 'warning' if errors else 'success',
+                'sticky': bool(errors),
             }
         }
 
@@ -180,6 +233,34 @@ class AccessManagementCopyWizard(models.TransientModel):
     copy_users = fields.Boolean(string='Copy Users', default=False)
     copy_groups = fields.Boolean(string='Copy Groups', default=False)
     
+    copy_mode = fields.Selection([
+        ('single', 'Single Copy'),
+        ('companies', 'One Copy per Company'),
+        ('groups', 'One Copy per Group'),
+    ], string='Copy Mode', required=True, default='single',
+       help="Clone the rule once, or once for each target company or group")
+    target_company_ids = fields.Many2many(
+        'res.company',
+        string='Target Companies',
+        help="A copy restricted to each of these companies is created"
+    )
+    target_group_ids = fields.Many2many(
+        'res.groups',
+        string='Target Groups',
+        help="A copy applied by group to each of these groups is created"
+    )
+    
+    # Line fields copied per copy option
+    _COPY_LINE_FIELDS = {
+        'copy_menu_access': 'menu_access_ids',
+        'copy_model_access': 'model_access_ids',
+        'copy_field_access': 'field_access_ids',
+        'copy_domain_access': 'domain_access_ids',
+        'copy_button_tab_access': 'button_tab_access_ids',
+        'copy_search_panel_access': 'search_panel_access_ids',
+        'copy_chatter_access': 'chatter_access_ids',
+    }
+    
     def _default_name(self):
         source = self.env['access.management'].browse(self.env.context.get('active_id'))
         if source:
@@ -190,35 +271,65 @@ class AccessManagementCopyWizard(models.TransientModel):
         """Create a copy of the access management rule"""
         self.ensure_one()
         
-        # Create new rule
-        new_rule = self.source_id.copy({
-            'name': self.name,
-            'active': False,  # Start as inactive
+        # Start as inactive
+        default = {
+            'active': False,
             'user_ids': [(6, 0, self.source_id.user_ids.ids)] if self.copy_users else [(5, 0, 0)],
             'group_ids': [(6, 0, self.source_id.group_ids.ids)] if self.copy_groups else [(5, 0, 0)],
-        })
+        }
+        if self.copy_mode == 'companies':
+            if not self.target_company_ids:
+                raise UserError(_("Please select the companies to copy the rule to."))
+            defaults = [dict(default, name="%s (%s)" % (self.name, company.name), company_id=company.id)
+                        for company in self.target_company_ids]
+        elif self.copy_mode == 'groups':
+            if not self.target_group_ids:
+                raise UserError(_("Please select the groups to copy the rule to."))
+            defaults = [dict(default, name="%s (%s)" % (self.name, group.name),
+                             apply_by_group=True, group_ids=[(6, 0, group.ids)])
+                        for group in self.target_group_ids]
+        else:
+            defaults = [dict(default, name=self.name)]
         
-        # Clear unwanted sections
-        if not self.copy_menu_access:
-            new_rule.menu_access_ids.unlink()
-        if not self.copy_model_access:
-            new_rule.model_access_ids.unlink()
-        if not self.copy_field_access:
-            new_rule.field_access_ids.unlink()
-        if not self.copy_domain_access:
-            new_rule.domain_access_ids.unlink()
-        if not self.copy_button_tab_access:
-            new_rule.button_tab_access_ids.unlink()
-        if not self.copy_search_panel_access:
-            new_rule.search_panel_access_ids.unlink()
-        if not self.copy_chatter_access:
-            new_rule.chatter_access_ids.unlink()
+        new_rules = self._copy_source(defaults)
         
         # Open the new rule
+        if len(new_rules) == 1:
+            return {
+                'type': 'ir.actions.act_window',
+                'res_model': 'access.management',
+                'res_id': new_rules.id,
+                'view_mode': 'form',
+                'target': 'current',
+            }
         return {
             'type': 'ir.actions.act_window',
+            'name': _('Copied Access Rules'),
             'res_model': 'access.management',
-            'res_id': new_rule.id,
-            'view_mode': 'form',
+            'domain': [('id', 'in', new_rules.ids)],
+            'view_mode': 'tree,form',
+            'context': {'active_test': False},
             'target': 'current',
         }
+    
+    def _copy_source(self, defaults):
+        """Copy the source rule once per defaults, with the selected line types only
+
+        Lines are not copied along with the rule: the selected ones are
+        created for all the copies with one create() per line type.
+        """
+        source = self.source_id
+        rule_vals = source.copy_data()[0]
+        new_rules = self.env['access.management'].create([
+            dict(rule_vals, **default) for default in defaults
+        ])
+        
+        for option, field_name in self._COPY_LINE_FIELDS.items():
+            lines = source[field_name]
+            if not self[option] or not lines:
+                continue
+            line_vals = [line.copy_data()[0] for line in lines]
+            self.env[lines._name].create([
+                dict(vals, access_id=rule.id) for rule in new_rules for vals in line_vals
+            ])
+        return new_rules